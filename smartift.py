@@ -1,40 +1,248 @@
+import time
+_IMPORT_STARTED = time.perf_counter()  # first statement, so startup timings include every import below
+
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import datetime
-import pandas as pd
 import numpy as np
-import math, os, threading, time, sys
+import math, os, threading, sys, json, bisect, unicodedata, re
+import argparse, csv, itertools, importlib, importlib.util, io, queue, functools, heapq
+from collections import deque, OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
 
 # ---------- Optional libraries ----------
+# pandas, ttkbootstrap and matplotlib are only imported when first needed, so headless
+# commands and the splash screen do not pay for them at import time.
+class _LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+    def __init__(self, name):
+        self._name, self._module = name, None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+pd = _LazyModule("pandas")
+# standard-library modules used by single subsystems (HTTP service, history, export, benchmarks)
+asyncio, socket, signal, subprocess = (_LazyModule(m) for m in ("asyncio", "socket", "signal", "subprocess"))
+sqlite3, gzip, tempfile, tracemalloc, platform = (_LazyModule(m) for m in ("sqlite3", "gzip", "tempfile", "tracemalloc", "platform"))
+futures = _LazyModule("concurrent.futures")  # ProcessPoolExecutor pulls in multiprocessing
+
 # ttkbootstrap: modern themes & widgets (highly recommended)
-try:
-    import ttkbootstrap as tb
-    from ttkbootstrap.constants import *
-    USE_TTB = True
-except Exception:
-    USE_TTB = False
-    tb = None
+USE_TTB = importlib.util.find_spec("ttkbootstrap") is not None
+tb = None
 
 # Matplotlib for charts (optional)
-try:
-    from matplotlib.figure import Figure
-    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-    MATPLOTLIB_AVAILABLE = True
-except Exception:
-    MATPLOTLIB_AVAILABLE = False
+MATPLOTLIB_AVAILABLE = importlib.util.find_spec("matplotlib") is not None
+Figure = FigureCanvasTkAgg = None
+
+# pyarrow for Parquet/Feather export, zstandard for .csv.zst (both optional)
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+ZSTD_AVAILABLE = importlib.util.find_spec("zstandard") is not None
+
+# scipy's cKDTree for food swap lookups (optional; falls back to a blocked NumPy scan)
+SCIPY_AVAILABLE = importlib.util.find_spec("scipy") is not None
+
+def load_ui_libraries():
+    """Import ttkbootstrap and matplotlib's Tk backend. Idempotent; safe to run on a worker thread."""
+    global USE_TTB, tb, MATPLOTLIB_AVAILABLE, Figure, FigureCanvasTkAgg
+    if USE_TTB and tb is None:
+        try:
+            import ttkbootstrap as tb
+        except Exception:
+            USE_TTB, tb = False, None
+    if MATPLOTLIB_AVAILABLE and Figure is None:
+        try:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        except Exception:
+            MATPLOTLIB_AVAILABLE = False
 
 # ---------- Helpers ----------
 def print_status(msg):
     print(f"[SmartFit] {msg}")
 
-print_status("Starting SmartFit...")
-if USE_TTB:
-    print_status("Using ttkbootstrap for modern styling.")
-else:
-    print_status("ttkbootstrap unavailable — falling back to default ttk.")
-
-if not MATPLOTLIB_AVAILABLE:
-    print_status("Matplotlib unavailable — charts disabled.")
+# ---------- Instrumentation ----------
+class Histogram:
+    """Latency histogram (seconds) with Prometheus-style bucket bounds."""
+    BOUNDS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count, self.sum, self.min, self.max = 0, 0.0, math.inf, 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1; self.sum += seconds
+        self.min = min(self.min, seconds); self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count; self.sum += other.sum
+        self.min = min(self.min, other.min); self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (capped at the observed max)."""
+        seen = 0
+        for bound, c in zip(self.BOUNDS + (self.max,), self.counts):
+            seen += c
+            if seen >= q * self.count:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "sum_s": self.sum, "mean_s": self.sum / max(self.count, 1),
+                "min_s": self.min if self.count else 0.0, "max_s": self.max,
+                "p50_s": self.quantile(0.5), "p90_s": self.quantile(0.9), "p99_s": self.quantile(0.99),
+                "buckets": dict(zip([str(b) for b in self.BOUNDS] + ["+Inf"], itertools.accumulate(self.counts)))}
+
+class _NullTimer:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+    def __init__(self, metrics, name):
+        self.metrics, self.name = metrics, name
+    def __enter__(self):
+        self.start = time.perf_counter(); return self
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start); return False
+
+class Instrumentation:
+    """Per-stage timers feeding histograms, plus an opt-in cProfile hook that keeps the N slowest
+    calls of functions decorated with timed(..., profile=True). Disabled (the default), timer()
+    returns a shared no-op context manager and timed() adds one attribute check per call."""
+    def __init__(self):
+        self.enabled, self.profile_slowest = False, 0
+        self.histograms = {}
+        self.slowest = []  # min-heap of (seconds, seq, stage, call, cProfile.Profile or rendered text)
+        self._lock, self._seq = threading.Lock(), itertools.count()
+
+    def enable(self, profile_slowest=0):
+        self.enabled, self.profile_slowest = True, profile_slowest
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(seconds)
+
+    def timer(self, name):
+        return _Timer(self, name) if self.enabled else _NULL_TIMER
+
+    def timed(self, name, profile=False):
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                if profile and self.profile_slowest:
+                    return self._profiled(name, fn, args, kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def _profiled(self, name, fn, args, kwargs):
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:  # another profiler already runs on this thread
+            prof = None
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if prof is not None:
+                prof.disable()
+            self.observe(name, elapsed)
+            if prof is not None:
+                call = f"{fn.__name__}({', '.join([repr(a) for a in args] + [f'{k}={v!r}' for k, v in kwargs.items()])})"
+                self._keep(elapsed, name, call[:300], prof)
+
+    def _keep(self, elapsed, name, call, profile):
+        with self._lock:
+            item = (elapsed, next(self._seq), name, call, profile)
+            if len(self.slowest) < self.profile_slowest:
+                heapq.heappush(self.slowest, item)
+            elif elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    @staticmethod
+    def _render(profile, limit=25):
+        if isinstance(profile, str):
+            return profile
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def take(self):
+        """Snapshot of everything recorded so far (picklable, profiles rendered) and reset."""
+        with self._lock:
+            snap = {"histograms": self.histograms, "slowest": [(e, n, c, self._render(p)) for e, _, n, c, p in self.slowest]}
+            self.histograms, self.slowest = {}, []
+        return snap
+
+    def merge(self, snap):
+        """Fold in a take() snapshot, e.g. from a batch worker process."""
+        for name, hist in snap["histograms"].items():
+            with self._lock:
+                self.histograms.setdefault(name, Histogram()).merge(hist)
+        for elapsed, name, call, text in snap["slowest"]:
+            self._keep(elapsed, name, call, text)
+
+    def to_json(self):
+        return {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "stages": {k: h.to_dict() for k, h in sorted(self.histograms.items())},
+                "slowest": [{"seconds": e, "stage": n, "call": c} for e, _, n, c, _ in sorted(self.slowest, reverse=True)]}
+
+    def to_prometheus(self):
+        lines = ["# HELP smartfit_stage_seconds Time spent per SmartFit stage.", "# TYPE smartfit_stage_seconds histogram"]
+        for name, h in sorted(self.histograms.items()):
+            for le, n in h.to_dict()["buckets"].items():
+                lines.append(f'smartfit_stage_seconds_bucket{{stage="{name}",le="{le}"}} {n}')
+            lines.append(f'smartfit_stage_seconds_sum{{stage="{name}"}} {h.sum}')
+            lines.append(f'smartfit_stage_seconds_count{{stage="{name}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the histograms as Prometheus text (.prom/.txt) or JSON (anything else)."""
+        text = self.to_prometheus() if path.lower().endswith((".prom", ".txt")) else json.dumps(self.to_json(), indent=1)
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(text)
+
+    def dump_profiles(self, path):
+        with open(path, "w", encoding="utf-8") as fh:
+            for rank, (elapsed, _, name, call, prof) in enumerate(sorted(self.slowest, reverse=True), 1):
+                fh.write(f"#{rank} {name}: {elapsed * 1000:.2f} ms\n{call}\n{self._render(prof)}\n")
+
+    def report(self):
+        for name, h in sorted(self.histograms.items()):
+            print_status(f"{name}: n={h.count} mean={h.sum / max(h.count, 1) * 1000:.3f} ms "
+                         f"p50<={h.quantile(0.5) * 1000:.3f} ms p99<={h.quantile(0.99) * 1000:.3f} ms")
+
+METRICS = Instrumentation()
+
+def report_environment():
+    if USE_TTB:
+        print_status("Using ttkbootstrap for modern styling.")
+    else:
+        print_status("ttkbootstrap unavailable — falling back to default ttk.")
+    if not MATPLOTLIB_AVAILABLE:
+        print_status("Matplotlib unavailable — charts disabled.")
 
 
 # -------------------------
@@ -57,7 +265,483 @@ FOOD_DB = [
     {"name": "Olive Oil (1 tbsp)", "cal": 119, "protein": 0, "carbs": 0, "fat": 13.5, "serving": "1 tbsp"},
     {"name": "Quinoa (1 cup cooked)", "cal": 222, "protein": 8, "carbs": 39, "fat": 3.6, "serving": "1 cup"},
 ]
-FOOD_DF = pd.DataFrame(FOOD_DB)
+CATALOG_FORMAT_VERSION = 2
+
+
+def _sort_order(values, descending=False):
+    # Same ordering (including ties) as DataFrame.sort_values(kind="quicksort")
+    values = np.asarray(values)
+    idx = np.arange(len(values))
+    if not descending:
+        return values.argsort(kind="quicksort")
+    return idx[::-1][values[::-1].argsort(kind="quicksort")][::-1]
+
+class StringTable:
+    """Interned UTF-8 strings stored as one byte blob plus an offsets array."""
+    def __init__(self, blob, offsets):
+        # plain ndarray views (still file-backed for memmaps) keep per-item slicing cheap
+        self.blob, self.offsets = np.asarray(blob), np.asarray(offsets)
+
+    @classmethod
+    def build(cls, *columns):
+        """Intern every string of `columns`; returns (table, [refs per column])."""
+        ids, encoded, refs = {}, [], []
+        for col in columns:
+            r = np.empty(len(col), dtype=np.int32)
+            for j, s in enumerate(col):
+                s = str(s)
+                if s not in ids:
+                    ids[s] = len(encoded); encoded.append(s.encode("utf-8"))
+                r[j] = ids[s]
+            refs.append(r)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(blob, offsets), refs
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def decode(self, refs):
+        """Bulk-decode many refs, copying only the span of the blob they cover (or each string on
+        its own when the refs are scattered across a large blob)."""
+        refs = np.asarray(refs, dtype=np.int64)
+        if not len(refs):
+            return []
+        starts, ends = self.offsets[refs], self.offsets[refs + 1]
+        lo, hi = int(starts.min()), int(ends.max())
+        if hi - lo > 4 * int((ends - starts).sum()) + 4096:
+            blob = self.blob
+            return [blob[a:b].tobytes().decode("utf-8") for a, b in zip(starts.tolist(), ends.tolist())]
+        raw = self.blob[lo:hi].tobytes()
+        return [raw[a:b].decode("utf-8") for a, b in zip((starts - lo).tolist(), (ends - lo).tolist())]
+
+class StringColumn:
+    """Read-only sequence view resolving refs against a StringTable on access."""
+    def __init__(self, table, refs):
+        self.table, self.refs = table, np.asarray(refs)
+
+    def __len__(self):
+        return len(self.refs)
+
+    def __getitem__(self, i):
+        return self.table[self.refs[i]]
+
+    def __iter__(self):
+        return iter(self.table.decode(self.refs))
+
+class FoodCatalog:
+    """Food DB as column arrays with meal orderings and macro prefix sums precomputed once."""
+    MACROS = ("cal", "protein", "carbs", "fat")
+    ORDERS = ("cal", "pdensity")
+
+    def __init__(self, names, servings, cal, protein, carbs, fat, index=None):
+        self.names, self.servings = names, servings
+        self.columns = {k: np.asarray(v) for k, v in zip(self.MACROS, (cal, protein, carbs, fat))}
+        if index is None:
+            index = self._build_index(np.column_stack([self.columns[k] for k in self.MACROS]).astype(np.float64))
+        self.macros, self.orders, self.prefix, self.biggest = index
+
+    @staticmethod
+    def _build_index(macros):
+        cal = macros[:, 0]
+        orders = {
+            "cal": _sort_order(cal),
+            "pdensity": _sort_order(macros[:, 1] / (cal + 1e-6), descending=True),
+        }
+        biggest = int(_sort_order(cal, descending=True)[0]) if len(cal) else -1
+        # prefix[k] = macro totals of the first k foods in that ordering (row 0 is zeros)
+        prefix = {k: np.vstack([np.zeros((1, 4)), np.cumsum(macros[o], axis=0)]) for k, o in orders.items()}
+        return macros, orders, prefix, biggest
+
+    @classmethod
+    def from_records(cls, records):
+        records = list(records)
+        return cls(*(list(c) for c in zip(*[(r["name"], r["serving"], r["cal"], r["protein"], r["carbs"], r["fat"]) for r in records])))
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df["name"].astype(str).tolist(), df["serving"].astype(str).tolist(), df["cal"], df["protein"], df["carbs"], df["fat"])
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        return cls.from_frame(pd.read_csv(csv_path))
+
+    # ---- binary columnar format ----
+    def save(self, path):
+        """Write the catalog as a directory of .npy columns (plus its precomputed index) that
+        `open` maps read-only, so every process shares the same page-cache pages."""
+        os.makedirs(path, exist_ok=True)
+        table, (name_refs, serving_refs) = StringTable.build(self.names, self.servings)
+        arrays = {"macros": self.macros, "name_refs": name_refs, "serving_refs": serving_refs,
+                  "strings": table.blob, "string_offsets": table.offsets}
+        # the macro columns keep their own dtypes (integer calories stay integers); `macros` is the float index
+        arrays.update({f"col_{k}": self.columns[k] for k in self.MACROS})
+        for k in self.ORDERS:
+            arrays[f"order_{k}"] = self.orders[k]; arrays[f"prefix_{k}"] = self.prefix[k]
+        for k, arr in arrays.items():
+            np.save(os.path.join(path, k + ".npy"), np.ascontiguousarray(arr))
+        # meta.json is written last: a catalog without it is incomplete
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump({"version": CATALOG_FORMAT_VERSION, "count": len(self), "biggest": self.biggest}, fh)
+        return path
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta.get("version") != CATALOG_FORMAT_VERSION:
+            raise ValueError(f"Unsupported food catalog version: {meta.get('version')}")
+        load = lambda k: np.load(os.path.join(path, k + ".npy"), mmap_mode="r")
+        table = StringTable(load("strings"), load("string_offsets"))
+        index = (load("macros"), {k: load(f"order_{k}") for k in cls.ORDERS}, {k: load(f"prefix_{k}") for k in cls.ORDERS}, int(meta["biggest"]))
+        return cls(StringColumn(table, load("name_refs")), StringColumn(table, load("serving_refs")),
+                   *(load(f"col_{k}") for k in cls.MACROS), index=index)
+
+    def __len__(self):
+        return len(self.names)
+
+    def record(self, i, portion=1.0):
+        rec = {"id": int(i), "name": self.names[i]}
+        if portion == 1.0:
+            rec.update({k: self.columns[k][i].item() for k in self.MACROS})
+        else:
+            rec.update({k: round(self.columns[k][i].item() * portion, 2) for k in self.MACROS})
+        rec["serving"] = self.servings[i]
+        rec["portion"] = portion
+        return rec
+
+    def candidate_pool(self, per_macro=10):
+        """Small fixed set of foods spanning macro space (densest per macro + most calorie-dense),
+        so the optimizer's cost does not grow with the catalog. Cached per size."""
+        pools = self.__dict__.setdefault("_pools", {})
+        if per_macro not in pools:
+            k = min(per_macro, len(self))
+            cal = self.macros[:, 0] + 1e-6
+            top = lambda v: np.argpartition(-v, k - 1)[:k] if k < len(v) else np.arange(len(v))
+            picks = [np.asarray(self.orders["pdensity"][:k])] + [top(self.macros[:, j] / cal) for j in (2, 3)] + [top(self.macros[:, 0])]
+            pools[per_macro] = np.unique(np.concatenate(picks))
+        return pools[per_macro]
+
+    @property
+    def search_index(self):
+        if getattr(self, "_search_index", None) is None:
+            self._search_index = FoodSearchIndex(self.names)
+        return self._search_index
+
+    def search(self, query, limit=10):
+        """Ranked food ids for a name query (exact, prefix, word prefix, substring, then fuzzy)."""
+        return self.search_index.search(query, limit)
+
+    def find(self, name):
+        """Food id whose normalized name equals `name`, or None."""
+        return self.search_index.lookup(name)
+
+    def containing(self, text):
+        """Sorted int32 ids of foods whose normalized name contains `text` (cached per text). Without a
+        built search index this is one vectorized scan of the names, so rule item lookups do not pay
+        for building the full trigram index."""
+        found = self.__dict__.setdefault("_containing", {})
+        q = normalize_food_name(text)
+        if q not in found:
+            if getattr(self, "_search_index", None) is not None:
+                ids = sorted(self._search_index.containing(q))
+            else:
+                if "_name_text" not in self.__dict__:
+                    self._name_text, self._name_starts = _normalized_name_text(self.names)
+                hits = np.fromiter((m.start() for m in re.finditer(re.escape(q), self._name_text)), dtype=np.int64)
+                ids = np.unique(np.searchsorted(self._name_starts, hits, side="right") - 1)
+            found[q] = np.asarray(ids, dtype=np.int32)
+        return found[q]
+
+    @property
+    def swap_index(self):
+        if getattr(self, "_swap_index", None) is None:
+            self._swap_index = FoodSwapIndex(self.macros)
+        return self._swap_index
+
+    def swaps(self, food_id, k=5, room=None, exclude=()):
+        """The k foods nearest to food_id by scaled macro vector, as (ids, distances); see FoodSwapIndex.query."""
+        return self.swap_index.query(food_id, k, room, exclude)
+
+    def to_frame(self):
+        return pd.DataFrame({"name": list(self.names), **{k: np.asarray(v) for k, v in self.columns.items()}, "serving": list(self.servings)})
+
+    def greedy_fill(self, threshold, order="pdensity"):
+        """Take foods in `order` until calories reach `threshold`; top up with the biggest food if
+        the whole catalog falls short. Returns (food ids, [cal, protein, carbs, fat] totals)."""
+        prefix = self.prefix[order]
+        k = int(np.searchsorted(prefix[:, 0], threshold, side="left"))
+        if k < len(prefix):
+            return self.orders[order][:k], prefix[k]
+        ids = np.append(self.orders[order], self.biggest)
+        return ids, prefix[-1] + self.macros[self.biggest]
+
+    def greedy_fill_allowed(self, threshold, order, allowed):
+        """greedy_fill restricted to foods with allowed[id] True. Only a prefix of the ordering is
+        scanned (grown geometrically), since a few blocked foods rarely push the fill far."""
+        o, cal = self.orders[order], self.macros[:, 0]
+        w = min(len(o), 64)
+        while True:
+            sel = o[:w][allowed[o[:w]]]
+            cum = np.concatenate([[0.0], np.cumsum(cal[sel])])
+            k = int(np.searchsorted(cum, threshold, side="left"))
+            if k < len(cum) or w == len(o):
+                break
+            w = min(len(o), w * 4)
+        if k < len(cum):
+            ids = sel[:k]
+        else:
+            cand = np.flatnonzero(allowed)
+            ids = np.append(sel, cand[np.argmax(cal[cand])]) if len(cand) else sel
+        totals = np.cumsum(self.macros[ids], axis=0)[-1] if len(ids) else np.zeros(4)
+        return ids, totals
+
+class FoodSwapIndex:
+    """Nearest neighbours over per-serving (cal, protein, carbs, fat) vectors, each column divided by
+    its catalog std so no macro dominates the distance. Uses scipy's cKDTree when available, else a
+    blocked scan over rows sorted by scaled calories that widens around the query until the calorie
+    gap alone is farther than the k-th best match. Both are exact. The scan only visits rows within
+    the calorie room, so a tight room is cheap; a room tight only on other macros may still scan
+    every food under the calorie bound."""
+    BLOCK = 4096
+
+    def __init__(self, macros, kdtree=None):
+        self.macros = np.asarray(macros, dtype=np.float64)
+        scale = self.macros.std(axis=0) if len(self.macros) else np.ones(4)
+        self.vectors = self.macros / np.where(scale > 0, scale, 1.0)
+        self.tree = None
+        if SCIPY_AVAILABLE if kdtree is None else kdtree:
+            from scipy.spatial import cKDTree
+            self.tree = cKDTree(self.vectors)
+        else:
+            self.order = np.argsort(self.vectors[:, 0], kind="stable")
+            self.sorted_vectors = self.vectors[self.order]
+            self.first = np.ascontiguousarray(self.sorted_vectors[:, 0])
+            self.sorted_columns = np.ascontiguousarray(self.macros[self.order].T)  # per-macro rows for the room test
+
+    def query(self, food_id, k=5, room=None, exclude=()):
+        """Up to k (ids, distances) nearest to food_id, nearest first. food_id itself and `exclude` are
+        skipped, and with `room` ([cal, protein, carbs, fat] upper bounds) so is any food above it."""
+        exclude = np.append(np.asarray(exclude, dtype=np.int64), food_id)
+        room = None if room is None else np.asarray(room, dtype=np.float64)
+        n, x = len(self.vectors), self.vectors[food_id]
+        if k <= 0 or n == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if self.tree is not None:
+            fetch = k + len(exclude)
+            while True:
+                d, ids = self.tree.query(x, k=min(fetch, n))
+                d, ids = np.atleast_1d(d), np.atleast_1d(ids)
+                ok = ~np.isin(ids, exclude)
+                if room is not None:
+                    ok &= (self.macros[ids] <= room).all(axis=1)
+                if ok.sum() >= k or fetch >= n:
+                    return ids[ok][:k].astype(np.int64), d[ok][:k]
+                fetch *= 4
+        # keep k + len(exclude) best, so dropping excluded ids at the end still leaves k
+        keep = k + len(exclude)
+        # rows are in calorie order, so the calorie room is a prefix: never scan past it
+        n = n if room is None else int(np.searchsorted(self.sorted_columns[0], room[0], side="right"))
+        lo = hi = min(int(np.searchsorted(self.first, x[0])), n)
+        best_i, best_d = np.empty(0, dtype=np.int64), np.empty(0)
+        step = self.BLOCK // 2
+        while lo > 0 or hi < n:
+            new_lo, new_hi = max(0, lo - step), min(n, hi + step)
+            for a, b in ((new_lo, lo), (hi, new_hi)):
+                if a == b:
+                    continue
+                rows = np.arange(a, b)
+                if room is not None:
+                    c = self.sorted_columns
+                    rows = rows[(c[1, a:b] <= room[1]) & (c[2, a:b] <= room[2]) & (c[3, a:b] <= room[3])]
+                best_i = np.concatenate([best_i, rows])
+                best_d = np.concatenate([best_d, ((self.sorted_vectors[rows] - x) ** 2).sum(axis=1)])
+            if len(best_d) > keep:
+                top = np.argpartition(best_d, keep - 1)[:keep]
+                best_i, best_d = best_i[top], best_d[top]
+            lo, hi, step = new_lo, new_hi, 2 * step  # widen geometrically: rows far from x in calories rarely fit
+            if len(best_d) == keep:
+                gap = min(x[0] - self.first[lo - 1] if lo > 0 else np.inf, self.first[hi] - x[0] if hi < n else np.inf)
+                if gap * gap > best_d.max():
+                    break
+        ids = self.order[best_i]
+        ok = ~np.isin(ids, exclude)
+        ids, best_d = ids[ok], best_d[ok]
+        order = np.argsort(best_d, kind="stable")[:k]
+        return ids[order], np.sqrt(best_d[order])
+
+_NAME_SEPARATORS = str.maketrans({c: " " for c in map(chr, range(128)) if not c.isalnum()})
+
+_NAME_TEXT_SEPARATORS = str.maketrans({c: " " for c in map(chr, range(128)) if not c.isalnum() and c != "\n"})
+
+def _normalized_name_text(names):
+    """All names normalized as by normalize_food_name, in one newline-joined string (one pass of
+    C-level string ops instead of a call per name), plus the start offset of every name."""
+    text = "\n".join(str(n).replace("\n", " ") for n in names)
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    text = text.lower().translate(_NAME_TEXT_SEPARATORS)
+    while "  " in text:
+        text = text.replace("  ", " ")
+    text = text.replace(" \n", "\n").replace("\n ", "\n").strip(" ")
+    starts = np.concatenate([[0], np.flatnonzero(np.frombuffer(text.encode("ascii"), dtype=np.uint8) == 10) + 1])
+    return text, starts
+
+def normalize_food_name(name):
+    name = str(name)
+    if not name.isascii():
+        name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return " ".join(name.lower().translate(_NAME_SEPARATORS).split())
+
+def _trigram_keys(text):
+    # 3 code points packed into one int64 key; "\0" separates names so no key spans two names
+    c = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    if len(c) < 3:
+        return np.empty(0, dtype=np.int64), np.zeros(0, dtype=bool)
+    keys = (c[:-2] << 42) | (c[1:-1] << 21) | c[2:]
+    valid = (c[:-2] != 0) & (c[1:-1] != 0) & (c[2:] != 0)
+    return keys, valid
+
+class FoodSearchIndex:
+    """Prebuilt name index: sorted normalized names and word tokens for prefix/autocomplete
+    lookups (bisect), plus a trigram inverted index (CSR postings) for substring and fuzzy matches."""
+    def __init__(self, names):
+        self.norm = [normalize_food_name(n) for n in names]
+        self.lengths = np.fromiter((len(n) for n in self.norm), dtype=np.int32, count=len(self.norm))
+        order = sorted(range(len(self.norm)), key=self.norm.__getitem__)
+        self.sorted_names = [self.norm[i] for i in order]
+        self.sorted_ids = np.asarray(order, dtype=np.int64)
+        tokens = sorted((tok, i) for i, n in enumerate(self.norm) for tok in set(n.split()))
+        self.sorted_tokens = [t for t, _ in tokens]
+        self.token_ids = np.asarray([i for _, i in tokens], dtype=np.int64)
+        self._build_trigrams()
+        self._contains_cache = {}
+
+    def _build_trigrams(self):
+        keys, valid = _trigram_keys("\0".join(self.norm))
+        owner = np.repeat(np.arange(len(self.norm), dtype=np.int64), self.lengths + 1)[:len(keys)]
+        keys, owner = keys[valid], owner[valid]
+        order = np.lexsort((owner, keys))
+        keys, owner = keys[order], owner[order]
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = (keys[1:] != keys[:-1]) | (owner[1:] != owner[:-1])
+        keys, self.postings = keys[keep], owner[keep]
+        self.trigrams, starts = np.unique(keys, return_index=True)
+        self.offsets = np.append(starts, len(keys))
+
+    def _posting(self, key):
+        j = np.searchsorted(self.trigrams, key)
+        if j == len(self.trigrams) or self.trigrams[j] != key:
+            return self.postings[:0]
+        return self.postings[self.offsets[j]:self.offsets[j + 1]]
+
+    def _range(self, sorted_keys, prefix):
+        lo = bisect.bisect_left(sorted_keys, prefix)
+        return lo, bisect.bisect_left(sorted_keys, prefix + "\uffff", lo)
+
+    def lookup(self, name):
+        q = normalize_food_name(name)
+        lo, hi = self._range(self.sorted_names, q)
+        return int(self.sorted_ids[lo]) if lo < hi and self.sorted_names[lo] == q else None
+
+    def _substring_candidates(self, q):
+        """(ids holding every trigram of q, the trigram postings rarest first)."""
+        keys, valid = _trigram_keys(q)
+        posts = sorted((self._posting(k) for k in np.unique(keys[valid])), key=len)
+        if not posts:
+            return self.postings[:0], posts
+        cand = posts[0]
+        for p in posts[1:]:
+            if not len(cand):
+                break
+            j = np.minimum(np.searchsorted(p, cand), len(p) - 1)  # postings are sorted by id
+            cand = cand[p[j] == cand]
+        return cand, posts
+
+    def containing(self, text):
+        """Set of ids whose normalized name contains `text` (cached; used for rule item matching)."""
+        q = normalize_food_name(text)
+        if q not in self._contains_cache:
+            if len(q) < 3:
+                ids = {i for i, n in enumerate(self.norm) if q in n}
+            else:
+                cand, _ = self._substring_candidates(q)
+                ids = {int(i) for i in cand if q in self.norm[i]}
+            self._contains_cache[q] = frozenset(ids)
+        return self._contains_cache[q]
+
+    def search(self, query, limit=10):
+        q = normalize_food_name(query)
+        if not q or limit <= 0:
+            return []
+        out, seen = [], set()
+        def take(ids):
+            for i in ids:
+                i = int(i)
+                if i not in seen:
+                    seen.add(i); out.append(i)
+                    if len(out) >= limit:
+                        return True
+            return False
+        # 1) exact + whole-name prefix (alphabetical, so the exact match comes first)
+        lo, hi = self._range(self.sorted_names, q)
+        if take(self.sorted_ids[lo:min(hi, lo + limit)]):
+            return out
+        # 2) prefix of any word
+        lo, hi = self._range(self.sorted_tokens, q)
+        if take(self.token_ids[lo:min(hi, lo + 4 * limit)]):
+            return out
+        if len(q) < 3:
+            return out
+        # 3) substring, shortest names first
+        cand, posts = self._substring_candidates(q)
+        if len(cand) and take(i for i in cand[np.argsort(self.lengths[cand], kind="stable")] if q in self.norm[i]):
+            return out
+        # 4) fuzzy (misspelled or reordered words), by number of shared trigrams. Only the rarer
+        # trigrams carry signal and very common ones would dominate the cost; when every one is
+        # common (large catalogs of variants), the rarest few non-empty postings stand in.
+        posts = [p for p in posts if len(p)]
+        if posts:
+            cap = max(1000, len(self.norm) // 50)
+            posts = [p for p in posts if len(p) <= cap] or posts[:3]
+            ids, counts = np.unique(np.concatenate(posts), return_counts=True)
+            best = np.lexsort((self.lengths[ids], -counts))[:limit + len(out)]
+            take(ids[best])
+        return out
+
+def convert_csv_to_catalog(csv_path, out_path):
+    """CSV with name, cal, protein, carbs, fat, serving columns -> binary catalog directory."""
+    return FoodCatalog.from_csv(csv_path).save(out_path)
+
+def convert_food_db_to_catalog(out_path, records=None):
+    return FoodCatalog.from_records(FOOD_DB if records is None else records).save(out_path)
+
+# The catalog is only materialized on first use; set SMARTFIT_CATALOG to a saved catalog
+# directory to serve that instead of the inline FOOD_DB.
+_food_catalog = None
+
+def get_food_catalog():
+    global _food_catalog
+    if _food_catalog is None:
+        path = os.environ.get("SMARTFIT_CATALOG")
+        _food_catalog = FoodCatalog.open(path) if path else FoodCatalog.from_records(FOOD_DB)
+    return _food_catalog
+
+def set_food_catalog(catalog):
+    global _food_catalog
+    _food_catalog = catalog
+
+def __getattr__(name):
+    # Lazy module attributes kept for backwards compatibility
+    if name == "FOOD_CATALOG":
+        return get_food_catalog()
+    if name == "FOOD_DF":
+        return get_food_catalog().to_frame()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # -------------------------
@@ -85,10 +769,15 @@ def calculate_bmr(sex: str, weight_kg: float, height_cm: float, age: int) -> flo
         return 10 * weight_kg + 6.25 * height_cm - 5 * age + 5
     return 10 * weight_kg + 6.25 * height_cm - 5 * age - 161
 
-def calculate_tdee_and_targets(sex, weight_kg, height_cm, age, activity_level, goal):
+@METRICS.timed("targets")
+def calculate_tdee_and_targets(sex, weight_kg, height_cm, age, activity_level, goal, tdee=None, tdee_confidence=1.0):
+    """Daily targets from the Mifflin-St Jeor BMR and activity factor. A measured `tdee` (e.g. from
+    ProgressTracker) replaces the activity-factor estimate in proportion to `tdee_confidence` (0-1)."""
     bmr = calculate_bmr(sex, weight_kg, height_cm, age)
     activity_factor = ACTIVITY_FACTORS.get(activity_level, 1.375)
-    tdee = bmr * activity_factor
+    measured, tdee = tdee, bmr * activity_factor
+    if measured is not None and not math.isnan(measured):
+        tdee += tdee_confidence * (measured - tdee)
     target_calories = tdee * GOAL_ADJUSTMENT.get(goal, 1.0)
     protein_g = round(2.0 * weight_kg) if "Lose" in goal else round(1.8 * weight_kg) if "Gain" in goal else round(1.6 * weight_kg)
     fat_cals = 0.25 * target_calories
@@ -105,28 +794,448 @@ def calculate_tdee_and_targets(sex, weight_kg, height_cm, age, activity_level, g
         "Fat_g": int(fat_g)
     }
 
-def generate_meal_plan(target_calories, protein_g, carbs_g, fat_g, meals=("Breakfast","Lunch","Dinner","Snack")):
-    splits = {"Breakfast":0.25, "Lunch":0.35, "Dinner":0.30, "Snack":0.10}
+# ---------- Batch (vectorized) targets ----------
+ACTIVITY_LEVELS = list(ACTIVITY_FACTORS.keys())
+GOALS = list(GOAL_ADJUSTMENT.keys())
+TARGET_COLUMNS = ["BMR", "TDEE", "TargetCalories", "Protein_g", "Carbs_g", "Fat_g"]
+
+def encode_labels(values, labels):
+    """Map labels to small int codes (index into `labels`); unseen labels get codes past the end.
+    Returns (codes, vocab) where vocab[code] is the original label."""
+    inv, uniq = pd.factorize(np.asarray(values, dtype=object).ravel(), use_na_sentinel=False)
+    uniq = [str(u) for u in uniq]
+    vocab = list(labels) + [u for u in dict.fromkeys(uniq) if u not in labels]
+    lookup = {lab: i for i, lab in enumerate(vocab)}
+    codes = np.array([lookup[u] for u in uniq], dtype=np.int16)[inv]
+    return codes, vocab
+
+def _goal_protein_factor(goal):
+    return 2.0 if "Lose" in goal else 1.8 if "Gain" in goal else 1.6
+
+@METRICS.timed("targets.batch")
+def calculate_targets_batch(profiles):
+    """Vectorized calculate_tdee_and_targets over many profiles.
+    `profiles` is a DataFrame or mapping of column arrays: sex, weight, height, age, activity, goal,
+    optionally tdee and tdee_confidence (NaN tdee: formula only).
+    Returns a DataFrame with TARGET_COLUMNS, identical to the scalar function row by row."""
+    col = lambda k: np.asarray(profiles[k])
+    weight = col("weight").astype(np.float64); height = col("height").astype(np.float64)
+    age = col("age").astype(np.float64)
+    sex_codes, sex_vocab = encode_labels(col("sex"), ["Male", "Female"])
+    male = np.array([s.lower().startswith('m') for s in sex_vocab])[sex_codes]
+    act_codes, act_vocab = encode_labels(col("activity"), ACTIVITY_LEVELS)
+    goal_codes, goal_vocab = encode_labels(col("goal"), GOALS)
+    act_factor = np.array([ACTIVITY_FACTORS.get(a, 1.375) for a in act_vocab])[act_codes]
+    goal_adj = np.array([GOAL_ADJUSTMENT.get(g, 1.0) for g in goal_vocab])[goal_codes]
+    prot_factor = np.array([_goal_protein_factor(g) for g in goal_vocab])[goal_codes]
+
+    bmr = 10 * weight + 6.25 * height - 5 * age + np.where(male, 5, -161)
+    tdee = bmr * act_factor
+    if "tdee" in profiles:
+        measured = pd.to_numeric(pd.Series(col("tdee")), errors="coerce").to_numpy(dtype=np.float64)
+        conf = (pd.to_numeric(pd.Series(col("tdee_confidence")), errors="coerce").fillna(1.0).to_numpy(dtype=np.float64)
+                if "tdee_confidence" in profiles else 1.0)
+        tdee = np.where(np.isnan(measured), tdee, tdee + conf * (measured - tdee))
+    out = pd.DataFrame(_target_arrays(bmr, tdee, goal_adj, prot_factor, weight))
+    if isinstance(profiles, pd.DataFrame):
+        out.index = profiles.index
+    return out
+
+def _target_arrays(bmr, tdee, goal_adj, prot_factor, weight):
+    """TARGET_COLUMNS as int64 arrays from broadcastable BMR, TDEE, goal adjustment, protein factor and weight."""
+    target_calories = tdee * goal_adj
+    protein_g = np.round(prot_factor * weight)
+    fat_cals = 0.25 * target_calories
+    fat_g = np.round(fat_cals / 9)
+    remaining_cals = np.maximum(0, target_calories - (protein_g * 4 + fat_cals))
+    carbs_g = np.round(remaining_cals / 4)
+    cols = np.broadcast_arrays(np.round(bmr), np.round(tdee), np.round(target_calories), protein_g, carbs_g, fat_g)
+    return {k: c.astype(np.int64) for k, c in zip(TARGET_COLUMNS, cols)}
+
+MEAL_SPLITS = {"Breakfast":0.25, "Lunch":0.35, "Dinner":0.30, "Snack":0.10}
+PORTIONS = (0.5, 1.0, 1.5, 2.0, 2.5, 3.0)
+MACRO_WEIGHTS = np.array([2.0, 1.0, 1.0, 1.0])  # calories matter most
+
+def _meal_shares(meals):
     available = [m for m in meals if m]
-    total_split = sum(splits[m] for m in available if m in splits)
-    rows = []
-    foods = FOOD_DF.copy()
-    for meal in available:
-        split = splits.get(meal, 0.15)
-        meal_target = target_calories * (split / total_split)
-        items = []; cal = prot = carb = fat = 0.0
-        cand = foods.sort_values(by="cal") if meal == "Snack" else foods.assign(pdensity=foods["protein"]/(foods["cal"]+1e-6)).sort_values(by="pdensity", ascending=False)
-        i = 0
-        while cal < meal_target * 0.95 and i < len(cand):
-            f = cand.iloc[i].to_dict()
-            items.append(f)
-            cal += f["cal"]; prot += f["protein"]; carb += f["carbs"]; fat += f["fat"]
-            i += 1
-        if cal < meal_target * 0.95:
-            big = foods.sort_values(by="cal", ascending=False).iloc[0].to_dict()
-            items.append(big); cal += big["cal"]; prot += big["protein"]; carb += big["carbs"]; fat += big["fat"]
-        rows.append({"Meal": meal, "Items": items, "Calories": round(cal), "Protein_g": round(prot, 1), "Carbs_g": round(carb, 1), "Fat_g": round(fat, 1)})
-    return pd.DataFrame(rows)
+    total_split = sum(MEAL_SPLITS[m] for m in available if m in MEAL_SPLITS)
+    return [(m, MEAL_SPLITS.get(m, 0.15) / total_split) for m in available]
+
+def macro_error(totals, target):
+    """Weighted squared relative error of [cal, protein, carbs, fat] totals (any leading shape)."""
+    target = np.asarray(target, dtype=np.float64)
+    rel = (np.asarray(totals) - target) / np.maximum(target, 1.0)
+    return (rel * rel) @ MACRO_WEIGHTS
+
+def optimize_meal(catalog, target, deadline, max_items=4, beam=32, portions=PORTIONS, allowed=None):
+    """Bounded beam search over (food, portion) combinations minimizing macro_error, optionally only
+    over foods where the boolean mask `allowed` is set. Returns (food ids, portions, totals, error),
+    or None if `deadline` (perf_counter) passes or no candidate food is allowed."""
+    pool = catalog.candidate_pool()
+    if allowed is not None:
+        pool = pool[allowed[pool]]
+    if not len(pool):
+        return None
+    P = np.asarray(portions)
+    opt_pos = np.repeat(np.arange(len(pool)), len(P))      # option -> position in pool
+    opt_port = np.tile(P, len(pool))
+    V = catalog.macros[pool][opt_pos] * opt_port[:, None]    # (options, 4)
+    # errors in scaled space: |a + v|^2_w = |a|^2_w + 2 a.w.v + |v|^2_w, so each level is one matmul
+    scale = np.maximum(np.asarray(target, dtype=np.float64), 1.0)
+    Vs = V / scale; VsW = (Vs * MACRO_WEIGHTS).T; v2 = (Vs * Vs) @ MACRO_WEIGHTS
+    a = -np.asarray(target) / scale
+    err = (a * a) @ MACRO_WEIGHTS + 2 * (a @ VsW) + v2
+    keep = np.argsort(err)[:beam]
+    states, last, A = keep[:, None], opt_pos[keep], a + Vs[keep]
+    best_err, best = err[keep[0]], keep[:1]
+    for _ in range(max_items - 1):
+        if time.perf_counter() > deadline:
+            return None
+        cand_err = ((A * A) @ MACRO_WEIGHTS)[:, None] + 2 * (A @ VsW) + v2[None, :]
+        cand_err[opt_pos[None, :] <= last[:, None]] = np.inf  # canonical order: no repeats/permutations
+        flat = cand_err.ravel()
+        k = min(beam, flat.size)
+        sel = np.argpartition(flat, k - 1)[:k]
+        sel = sel[np.isfinite(flat[sel])]
+        if not len(sel):
+            break
+        s_idx, o_idx = np.divmod(sel, len(V))
+        states = np.hstack([states[s_idx], o_idx[:, None]])
+        last, A = opt_pos[o_idx], A[s_idx] + Vs[o_idx]
+        j = int(np.argmin(flat[sel]))
+        if flat[sel[j]] < best_err:
+            best_err, best = flat[sel[j]], states[j]
+    return pool[opt_pos[best]], opt_port[best], V[best].sum(axis=0), float(best_err)
+
+@METRICS.timed("meal_plan", profile=True)
+def generate_meal_plan(target_calories, protein_g, carbs_g, fat_g, meals=("Breakfast","Lunch","Dinner","Snack"), catalog=None, mode="greedy", deadline_ms=5.0, compact=False):
+    """Per-meal plan DataFrame (or CompactPlan with compact=True). mode="greedy" fills meals by calories
+    only; mode="optimize" also matches protein/carbs/fat, falling back to greedy if `deadline_ms` expires."""
+    start = time.perf_counter()
+    catalog = get_food_catalog() if catalog is None else catalog
+    if mode not in ("greedy", "optimize"):
+        raise ValueError(f"Unknown meal plan mode: {mode}")
+    shares = _meal_shares(meals)
+    greedy = [catalog.greedy_fill(target_calories * share * 0.95, "cal" if meal == "Snack" else "pdensity") for meal, share in shares]
+    choices = greedy
+    if mode == "optimize":
+        deadline = start + deadline_ms / 1000.0
+        choices = []
+        for (meal, share), (ids, totals) in zip(shares, greedy):
+            target = np.array([target_calories, protein_g * 4, carbs_g * 4, fat_g * 9]) * share / [1, 4, 4, 9]
+            res = optimize_meal(catalog, target, deadline)
+            if res is None:
+                choices = greedy  # out of time: serve the greedy plan
+                break
+            opt_ids, ports, opt_totals, err = res
+            choices.append((opt_ids, opt_totals, ports) if err < macro_error(totals, target) else (ids, totals))
+    plan = CompactPlan.from_choices([meal for meal, _ in shares], choices)
+    return plan if compact else plan.to_frame(catalog)
+
+# ---------- What-if sweeps ----------
+def greedy_plan_totals(target_calories, meals=("Breakfast","Lunch","Dinner","Snack"), catalog=None):
+    """Daily [cal, protein, carbs, fat] of the greedy generate_meal_plan for an array of calorie targets
+    (result shape: target_calories.shape + (4,)), with one searchsorted per meal instead of a plan per target."""
+    catalog = get_food_catalog() if catalog is None else catalog
+    calories = np.asarray(target_calories, dtype=np.float64)
+    total = np.zeros(calories.shape + (4,))
+    for meal, share in _meal_shares(meals):
+        prefix = catalog.prefix["cal" if meal == "Snack" else "pdensity"]
+        k = np.searchsorted(prefix[:, 0], calories * share * 0.95, side="left")
+        short = (k == len(prefix))[..., None]  # whole catalog below the threshold: topped up with the biggest food
+        total += np.where(short, prefix[-1] + catalog.macros[catalog.biggest], prefix[np.minimum(k, len(prefix) - 1)])
+    return total
+
+class TargetSweep:
+    """Targets over a weight x activity x goal grid: `values[column]` is a (weights, activities, goals)
+    int array per TARGET_COLUMNS name. With feasibility scoring, `plan_error` is the macro_error of the
+    greedy meal plan against each cell's targets and `feasible` marks cells where every plan macro is
+    within the tolerance."""
+    __slots__ = ("weights", "activities", "goals", "values", "plan_error", "feasible")
+
+    def __init__(self, weights, activities, goals, values, plan_error=None, feasible=None):
+        self.weights, self.activities, self.goals = weights, tuple(activities), tuple(goals)
+        self.values, self.plan_error, self.feasible = values, plan_error, feasible
+
+    def __getitem__(self, column):
+        return self.plan_error if column == "PlanError" else self.values[column]
+
+    @property
+    def shape(self):
+        return len(self.weights), len(self.activities), len(self.goals)
+
+    def cell(self, i, j, k):
+        """Targets of one grid cell, as calculate_tdee_and_targets returns them."""
+        return {c: int(v[i, j, k]) for c, v in self.values.items()}
+
+    def to_frame(self):
+        """One row per cell: Weight, Activity, Goal, TARGET_COLUMNS (and PlanError, Feasible)."""
+        w, a, g = (x.ravel() for x in np.meshgrid(self.weights, np.arange(len(self.activities)), np.arange(len(self.goals)), indexing="ij"))
+        df = pd.DataFrame({"Weight": w, "Activity": np.asarray(self.activities, dtype=object)[a],
+                           "Goal": np.asarray(self.goals, dtype=object)[g], **{c: v.ravel() for c, v in self.values.items()}})
+        if self.plan_error is not None:
+            df["PlanError"], df["Feasible"] = self.plan_error.ravel(), self.feasible.ravel()
+        return df
+
+def target_sweep(sex="Male", height=175.0, age=30, weights=None, activities=None, goals=None, feasibility=False, tolerance=0.15, catalog=None):
+    """calculate_tdee_and_targets over every weight x activity x goal combination (default: 60-100 kg in
+    1 kg steps, all levels and goals) in one broadcasted evaluation; each cell matches the scalar call.
+    With feasibility, also scores the greedy meal plan of every cell (see greedy_plan_totals)."""
+    weights = np.arange(60.0, 101.0) if weights is None else np.asarray(weights, dtype=np.float64)
+    activities = ACTIVITY_LEVELS if activities is None else list(activities)
+    goals = GOALS if goals is None else list(goals)
+    w = weights[:, None, None]
+    bmr = 10 * w + 6.25 * float(height) - 5 * float(age) + (5 if str(sex).lower().startswith("m") else -161)
+    act = np.array([ACTIVITY_FACTORS.get(a, 1.375) for a in activities])[None, :, None]
+    adj = np.array([GOAL_ADJUSTMENT.get(g, 1.0) for g in goals])[None, None, :]
+    prot = np.array([_goal_protein_factor(g) for g in goals])[None, None, :]
+    values = _target_arrays(bmr, bmr * act, adj, prot, w)
+    plan_error = feasible = None
+    if feasibility:
+        target = np.stack([values[c] for c in ("TargetCalories", "Protein_g", "Carbs_g", "Fat_g")], axis=-1).astype(np.float64)
+        plan = greedy_plan_totals(values["TargetCalories"], catalog=catalog)
+        plan_error = macro_error(plan, target)
+        feasible = (np.abs(plan - target) <= tolerance * np.maximum(target, 1.0)).all(axis=-1)
+    return TargetSweep(weights, activities, goals, values, plan_error, feasible)
+
+def meal_budget(targets, meal, meals=("Breakfast","Lunch","Dinner","Snack")):
+    """[cal, protein, carbs, fat] share of the daily `targets` that `meal` gets, as generate_meal_plan splits them."""
+    share = dict(_meal_shares(tuple(dict.fromkeys(meals))))[meal]
+    return np.array([targets["TargetCalories"], targets["Protein_g"], targets["Carbs_g"], targets["Fat_g"]], dtype=np.float64) * share
+
+def meal_swaps(food_ids, position, portions=None, budget=None, k=5, tolerance=0.10, catalog=None):
+    """The k foods closest to food_ids[position] by macro profile that keep the meal within `budget`
+    ([cal, protein, carbs, fat]; default: the meal's current totals): no macro may end more than
+    `tolerance` above its budget, or above its current total where the meal is already over. The new
+    food takes the item's portion. Returns catalog records with "distance" and the new "meal_totals"."""
+    catalog = get_food_catalog() if catalog is None else catalog
+    ids = np.asarray(food_ids, dtype=np.int64)
+    ports = np.ones(len(ids)) if portions is None else np.asarray(portions, dtype=np.float64)
+    food, portion = int(ids[position]), float(ports[position])
+    current = (catalog.macros[ids] * ports[:, None]).sum(axis=0)
+    budget = current if budget is None else np.asarray(budget, dtype=np.float64)
+    rest = current - catalog.macros[food] * portion
+    room = (np.maximum(budget, current) * (1 + tolerance) - rest) / portion
+    out = []
+    for f, d in zip(*catalog.swaps(food, k, room, ids)):
+        rec = catalog.record(f, portion)
+        cal, prot, carb, fat = (float(v) for v in rest + catalog.macros[f] * portion)
+        rec["distance"] = round(float(d), 4)
+        rec["meal_totals"] = {"Calories": round(cal), "Protein_g": round(prot, 1), "Carbs_g": round(carb, 1), "Fat_g": round(fat, 1)}
+        out.append(rec)
+    return out
+
+def swap_alternatives(plan, meal, position, targets=None, k=5, tolerance=0.10, catalog=None):
+    """meal_swaps() for item `position` of row `meal` of a CompactPlan or plan DataFrame, budgeted by the
+    meal's share of `targets` (or its current totals without targets). Apply one with replace_item()."""
+    plan = plan if isinstance(plan, CompactPlan) else CompactPlan.from_frame(plan, catalog)
+    lo, hi = int(plan.offsets[meal]), int(plan.offsets[meal + 1])
+    budget = None if targets is None else meal_budget(targets, plan.meals[meal], plan.meals)
+    return meal_swaps(plan.food_ids[lo:hi], position, plan.portions[lo:hi], budget, k, tolerance, catalog)
+
+def format_plan_item(it):
+    portion = it.get("portion", 1.0)
+    return f"{it['name']} ({it['serving']})" if portion == 1.0 else f"{portion:g} x {it['name']} ({it['serving']})"
+
+class CompactPlan:
+    """Index-based plan: typed arrays of food ids and portions (sliced per meal by `offsets`) plus
+    the rounded meal totals. Item dicts are only resolved against a catalog in to_frame(), which
+    gives back exactly the DataFrame generate_meal_plan returns."""
+    __slots__ = ("meals", "days", "offsets", "food_ids", "portions", "totals")
+
+    def __init__(self, meals, offsets, food_ids, portions, totals, days=None):
+        self.meals = tuple(meals)
+        self.days = None if days is None else np.asarray(days, dtype=np.int16)
+        self.offsets = np.asarray(offsets, dtype=np.int32)
+        self.food_ids = np.asarray(food_ids, dtype=np.int32)
+        self.portions = np.asarray(portions, dtype=np.float32)
+        self.totals = np.asarray(totals, dtype=np.int32).reshape(-1, 4)  # Calories, then macros in 0.1 g
+
+    def to_dict(self):
+        """JSON-ready arrays; from_dict() gives back an identical plan."""
+        return {"meals": list(self.meals), "days": None if self.days is None else self.days.tolist(), "offsets": self.offsets.tolist(),
+                "food_ids": self.food_ids.tolist(), "portions": self.portions.tolist(), "totals": self.totals.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["meals"], d["offsets"], d["food_ids"], d["portions"], d["totals"], d.get("days"))
+
+    @staticmethod
+    def _round_totals(totals):
+        cal, prot, carb, fat = (float(x) for x in totals)
+        return [round(cal)] + [round(round(v, 1) * 10) for v in (prot, carb, fat)]
+
+    @classmethod
+    def from_choices(cls, meals, choices, days=None):
+        """choices: per meal (food ids, [cal, protein, carbs, fat] totals[, portions])."""
+        ids = [np.asarray(c[0], dtype=np.int32) for c in choices]
+        ports = [np.asarray(c[2]) if len(c) > 2 else np.ones(len(i)) for c, i in zip(choices, ids)]
+        offsets = np.concatenate([[0], np.cumsum([len(i) for i in ids])])
+        cat = lambda parts, dt: np.concatenate(parts).astype(dt) if parts else np.empty(0, dt)
+        return cls(meals, offsets, cat(ids, np.int32), cat(ports, np.float32),
+                   [cls._round_totals(c[1]) for c in choices], days)
+
+    @classmethod
+    def from_frame(cls, df, catalog=None):
+        """Compact form of a plan DataFrame. Items are matched by their catalog "id"; items without
+        one (plans built outside generate_meal_plan) are looked up by name in `catalog`."""
+        def food_id(it):
+            if "id" in it:
+                return it["id"]
+            nonlocal catalog
+            catalog = get_food_catalog() if catalog is None else catalog
+            found = catalog.find(it["name"])
+            if found is None:
+                raise ValueError(f"{it['name']!r} is not in the food catalog")
+            return found
+        recs = df.to_dict("records")
+        choices = [([food_id(it) for it in r["Items"]], None, [it.get("portion", 1.0) for it in r["Items"]]) for r in recs]
+        offsets = np.concatenate([[0], np.cumsum([len(c[0]) for c in choices])])
+        totals = [[int(r["Calories"])] + [round(float(r[k]) * 10) for k in ("Protein_g", "Carbs_g", "Fat_g")] for r in recs]
+        return cls([r["Meal"] for r in recs], offsets, [i for c in choices for i in c[0]], [p for c in choices for p in c[2]],
+                   totals, [r["Day"] for r in recs] if "Day" in df else None)
+
+    def __len__(self):
+        return len(self.meals)
+
+    def replace_item(self, meal, position, food_id, catalog=None):
+        """Copy with item `position` of row `meal` replaced by food_id at the same portion; only that row's totals change."""
+        catalog = get_food_catalog() if catalog is None else catalog
+        lo, hi = int(self.offsets[meal]), int(self.offsets[meal + 1])
+        if not 0 <= position < hi - lo:
+            raise IndexError(f"{self.meals[meal]} has no item {position}")
+        food_ids, totals = self.food_ids.copy(), self.totals.copy()
+        food_ids[lo + position] = food_id
+        totals[meal] = self._round_totals((catalog.macros[food_ids[lo:hi]] * self.portions[lo:hi, None].astype(np.float64)).sum(axis=0))
+        return CompactPlan(self.meals, self.offsets, food_ids, self.portions, totals, self.days)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.offsets, self.food_ids, self.portions, self.totals)) + (0 if self.days is None else self.days.nbytes)
+
+    def meal_food_ids(self):
+        return [(m, self.food_ids[self.offsets[i]:self.offsets[i + 1]]) for i, m in enumerate(self.meals)]
+
+    def rows(self, catalog=None, resolve=True):
+        """Plan rows as dicts; with resolve=False, Items holds (food id, portion) pairs."""
+        catalog = get_food_catalog() if catalog is None else catalog
+        out = []
+        for i, meal in enumerate(self.meals):
+            lo, hi = self.offsets[i], self.offsets[i + 1]
+            pairs = zip(self.food_ids[lo:hi].tolist(), self.portions[lo:hi].tolist())
+            cal, p10, c10, f10 = self.totals[i].tolist()
+            row = {} if self.days is None else {"Day": int(self.days[i])}
+            row.update({"Meal": meal, "Items": [catalog.record(f, p) for f, p in pairs] if resolve else list(pairs),
+                        "Calories": cal, "Protein_g": p10 / 10, "Carbs_g": c10 / 10, "Fat_g": f10 / 10})
+            out.append(row)
+        return out
+
+    def to_frame(self, catalog=None):
+        return pd.DataFrame(self.rows(catalog))
+
+class MultiDayPlan:
+    """N-day meal plan with variety rules: a food used on one day is blocked for the next
+    `no_repeat_days` days, and `max_days_per_item` (int, or {food id: cap}) limits on how many days
+    a food may appear. Days are solved in order; edits re-solve only days whose inputs changed.
+    mode="optimize" matches macros per meal as generate_meal_plan does, over the foods not blocked,
+    with a `deadline_ms` budget per day (a day that runs out is served greedy). A meal no food can
+    fill under the rules is planned from the whole catalog instead and listed in `relaxed[day]`."""
+    def __init__(self, targets, days=7, no_repeat_days=1, max_days_per_item=None, meals=("Breakfast","Lunch","Dinner","Snack"), catalog=None,
+                 mode="greedy", deadline_ms=5.0):
+        if mode not in ("greedy", "optimize"):
+            raise ValueError(f"Unknown meal plan mode: {mode}")
+        self.catalog = get_food_catalog() if catalog is None else catalog
+        self.mode, self.deadline_ms = mode, deadline_ms
+        self.days, self.no_repeat_days, self.meals = days, no_repeat_days, meals
+        self.max_days_per_item = max_days_per_item
+        self.targets = [dict(targets) for _ in range(days)]
+        self.excluded = [{} for _ in range(days)]   # per day: meal -> food ids excluded by swaps
+        self.solutions = [None] * days              # per day: [(meal, ids, totals[, portions])]
+        self.relaxed = [()] * days                  # per day: meals planned without the variety rules
+        self.used = [frozenset()] * days
+        self._inputs = [None] * days
+        self.solve_count = 0
+        self._propagate(0)
+
+    def _cap(self, food_id):
+        caps = self.max_days_per_item
+        return caps.get(food_id) if isinstance(caps, dict) else caps
+
+    def _propagate(self, start):
+        counts = Counter(i for used in self.used[:start] for i in used)
+        for d in range(start, self.days):
+            blocked = set().union(*self.used[max(0, d - self.no_repeat_days):d])
+            if self.max_days_per_item is not None:
+                blocked.update(i for i, c in counts.items() if self._cap(i) is not None and c >= self._cap(i))
+            t = self.targets[d]
+            inputs = (frozenset(blocked), self._day_targets(t), tuple(sorted((m, frozenset(x)) for m, x in self.excluded[d].items())))
+            if inputs != self._inputs[d]:
+                self._solve_day(d, blocked)
+                self._inputs[d] = inputs
+            counts.update(self.used[d])
+
+    def _day_targets(self, t):
+        # greedy plans only depend on calories; optimize also on the macro grams
+        keys = ("TargetCalories",) if self.mode == "greedy" else ("TargetCalories", "Protein_g", "Carbs_g", "Fat_g")
+        return tuple(t.get(k) for k in keys)
+
+    def _solve_day(self, d, blocked):
+        n = len(self.catalog)
+        base = np.ones(n, dtype=bool)
+        base[list(blocked)] = False
+        t = self.targets[d]
+        deadline = time.perf_counter() + self.deadline_ms / 1000.0
+        sol, greedy, relaxed = [], [], []
+        for meal, share in _meal_shares(self.meals):
+            allowed = base
+            if self.excluded[d].get(meal):
+                allowed = base.copy(); allowed[list(self.excluded[d][meal])] = False
+            if not allowed.any():
+                allowed = np.ones(n, dtype=bool)  # rules cannot be met: relax rather than leave a meal empty
+                relaxed.append(meal)
+            thr = t["TargetCalories"] * share * 0.95
+            ids, totals = self.catalog.greedy_fill_allowed(thr, "cal" if meal == "Snack" else "pdensity", allowed)
+            greedy.append((meal, ids, totals))
+            if self.mode == "optimize" and sol is not None:
+                target = np.array([t["TargetCalories"], t["Protein_g"] * 4, t["Carbs_g"] * 4, t["Fat_g"] * 9]) * share / [1, 4, 4, 9]
+                res = optimize_meal(self.catalog, target, deadline, allowed=allowed)
+                if res is None and time.perf_counter() > deadline:
+                    sol = None  # out of time: serve this day greedy
+                elif res is not None and res[3] < macro_error(totals, target):
+                    sol.append((meal, res[0], res[2], res[1]))
+                else:
+                    sol.append((meal, ids, totals))
+        sol = greedy if self.mode == "greedy" or sol is None else sol
+        self.solutions[d], self.relaxed[d] = sol, tuple(relaxed)
+        self.used[d] = frozenset(int(i) for _, ids, *_ in sol for i in ids)
+        self.solve_count += 1
+
+    def relaxed_meals(self):
+        """(day, meal) pairs, days 1-based, where the variety rules could not be met."""
+        return [(d + 1, meal) for d, meals in enumerate(self.relaxed) for meal in meals]
+
+    def edit_day(self, day, **targets):
+        """Change targets (e.g. TargetCalories) for day `day` (1-based) and re-solve what it affects."""
+        self.targets[day - 1].update(targets)
+        self._propagate(day - 1)
+
+    def swap_meal(self, day, meal, food_ids=None):
+        """Re-plan `meal` on `day` without `food_ids` (default: without its current foods)."""
+        if food_ids is None:
+            food_ids = next(ids for m, ids, *_ in self.solutions[day - 1] if m == meal)
+        self.excluded[day - 1].setdefault(meal, set()).update(int(i) for i in food_ids)
+        self._propagate(day - 1)
+
+    def to_compact(self, days=None):
+        days = range(1, self.days + 1) if days is None else days
+        sol = [(d, meal, choice) for d in days for meal, *choice in self.solutions[d - 1]]
+        return CompactPlan.from_choices([m for _, m, _ in sol], [choice for _, _, choice in sol], [d for d, *_ in sol])
+
+    def day_frame(self, day):
+        return self.to_compact([day]).to_frame(self.catalog)
+
+    def to_frame(self):
+        return self.to_compact().to_frame(self.catalog)
 
 WORKOUT_TEMPLATES = {
     "beginner": [
@@ -158,47 +1267,1820 @@ WORKOUT_TEMPLATES = {
     ]
 }
 
+CARDIO_KEYWORDS = ("cardio", "walk")
+CARDIO_FINISHER = "10-15 min cardio finisher"
+OVERLOAD_NOTE = "Progressive overload: increase weight over weeks"
+
+# ---------- Workout templates, parsed once ----------
+EXERCISE_KINDS = ("strength", "timed", "distance", "other")
+_SETS_REPS = re.compile(r"^(?P<name>.+?)\s+(?P<sets>\d+)x(?P<lo>\d+)(?:-(?P<hi>\d+))?(?P<unit>m?)$")
+_DURATION = re.compile(r"(?P<lo>\d+)(?:-(?P<hi>\d+))?\s*(?P<unit>min|s)\b")
+
+def parse_exercise(text):
+    """A template line as a record. strength "Bench Press 4x6-8": sets 4, reps 6..8; distance "Sprints 8x60m":
+    sets 8 of 60 m; timed "Yoga / Mobility 20-30 min" / "Plank 30s": 20..30 (min or s); anything else is "other".
+    `fmt` rebuilds the line from the progressed numbers."""
+    rec = {"text": text, "kind": "other", "sets": 1, "lo": 0, "hi": 0, "fmt": text,
+           "cardio": any(kw in text.lower() for kw in CARDIO_KEYWORDS)}
+    if m := _SETS_REPS.match(text):
+        lo = int(m["lo"])
+        if m["unit"]:
+            rec.update(kind="distance", sets=int(m["sets"]), lo=lo, hi=lo, fmt=f"{m['name']} {{sets}}x{lo}m")
+        else:
+            rec.update(kind="strength", sets=int(m["sets"]), lo=lo, hi=int(m["hi"] or lo), fmt=f"{m['name']} {{sets}}x{{reps}} @ {{load:.0%}}")
+    elif m := _DURATION.search(text):
+        end = m.end("hi") if m["hi"] else m.end("lo")
+        rec.update(kind="timed", lo=int(m["lo"]), hi=int(m["hi"] or m["lo"]), fmt=text[:m.start()] + "{reps}" + text[end:])
+    return rec
+
+class WorkoutTemplate:
+    """One WORKOUT_TEMPLATES level as numeric columns, one row per exercise (in day order)."""
+    __slots__ = ("level", "days", "records", "day", "kind", "sets", "lo", "hi", "day_cardio", "_weeks")
+
+    def __init__(self, level, template):
+        self.level, self.days = level, tuple(day for day, _ in template)
+        self.records = tuple(parse_exercise(e) for _, exs in template for e in exs)
+        self.day = np.repeat(np.arange(len(template), dtype=np.int16), [len(exs) for _, exs in template])
+        self.kind = np.array([EXERCISE_KINDS.index(r["kind"]) for r in self.records], dtype=np.int8)
+        self.sets, self.lo, self.hi = (np.array([r[k] for r in self.records], dtype=np.int16) for k in ("sets", "lo", "hi"))
+        self.day_cardio = np.zeros(len(template), dtype=bool)
+        np.logical_or.at(self.day_cardio, self.day, [r["cardio"] for r in self.records])
+        # the static week per (lose, gain) goal flags, as generate_workout_plan returns it
+        self._weeks = {}
+        for lose, gain in itertools.product((False, True), repeat=2):
+            self._weeks[lose, gain] = tuple(
+                (day, tuple(exs) + ((CARDIO_FINISHER,) if lose and not cardio else ()) + ((OVERLOAD_NOTE,) if gain else ()))
+                for (day, exs), cardio in zip(template, self.day_cardio))
+
+    def week(self, lose=False, gain=False):
+        return [(day, list(exs)) for day, exs in self._weeks[lose, gain]]
+
+WORKOUT_TABLES = {level: WorkoutTemplate(level, template) for level, template in WORKOUT_TEMPLATES.items()}
+
 def generate_workout_plan(level, goal):
-    template = WORKOUT_TEMPLATES.get(level, WORKOUT_TEMPLATES["beginner"])
-    adapted = []
-    for day, exs in template:
-        ex = list(exs)
-        if "Lose" in goal and not any(kw in e.lower() for e in ex for kw in ["cardio", "walk"]):
-            ex.append("10-15 min cardio finisher")
-        if "Gain" in goal:
-            ex.append("Progressive overload: increase weight over weeks")
-        adapted.append((day, ex))
-    return adapted
-
-def ai_diet_suggestions(targets, last_plan_df):
-    tips = []
-    tcal = targets.get("TargetCalories")
-    if tcal and tcal < 1600:
-        tips.append("Target calories are low — prioritize protein and nutrient-dense foods.")
-    if targets and targets.get("Protein_g", 0) < 1:
-        tips.append("Distribute protein across meals (20-30g per meal).")
-    if last_plan_df is not None:
-        for _, r in last_plan_df.iterrows():
-            if any("Peanut Butter" in it["name"] and r["Meal"].lower().startswith("sn") for it in r["Items"]):
-                tips.append("Swap some peanut-butter snacks for Greek yogurt + berries.")
-                break
-    tips.extend([
-        "Include colored vegetables for vitamins and fiber.",
-        "Stay hydrated (2-3 L/day depending on activity).",
-        "For medical conditions, consult a dietitian."
-    ])
-    return tips
+    template = WORKOUT_TABLES.get(level, WORKOUT_TABLES["beginner"])
+    return template.week("Lose" in goal, "Gain" in goal)
+
+# ---------- Periodization ----------
+# goal keyword -> (load step per build week, sets added per block, duration growth per block)
+PERIODIZATION = {"Lose": (0.010, 0, 0.15), "Gain": (0.025, 1, 0.05), "Maintain": (0.020, 0, 0.10)}
+BLOCK_WEEKS = 4                      # 3 build weeks, then a deload week
+DELOAD_LOAD, DELOAD_VOLUME = 0.90, 0.6
+MAX_EXTRA_SETS, MAX_DURATION_GROWTH = 2, 1.5
+PROGRAM_WEEKS = (4, 16)
+
+def _goal_key(goal):
+    return "Lose" if "Lose" in goal else "Gain" if "Gain" in goal else "Maintain"
+
+class WorkoutProgram:
+    """A periodized multi-week program over a WorkoutTemplate. Arrays are (weeks, exercises):
+    `sets`, `reps` (reps for strength, minutes/seconds for timed rows) and relative `load` (1.0 = week 1).
+    Programs are shared through the workout_program() cache and read-only."""
+    __slots__ = ("template", "goal", "weeks", "deload", "sets", "reps", "load")
+
+    def __init__(self, template, goal, weeks):
+        step, extra_sets, growth = PERIODIZATION[goal]
+        t = template
+        w = np.arange(weeks)[:, None]
+        pos, block = w % BLOCK_WEEKS, w // BLOCK_WEEKS
+        deload = pos == BLOCK_WEEKS - 1
+        build = np.minimum(pos, BLOCK_WEEKS - 2)                     # position in the block; a deload holds the last build week
+        strength, timed, distance = (t.kind == EXERCISE_KINDS.index(k) for k in ("strength", "timed", "distance"))
+        # double progression: reps climb lo -> hi inside a block, load steps up every build week and reps reset per block
+        rep_step = np.ceil((t.hi - t.lo) / (BLOCK_WEEKS - 2))
+        reps = np.minimum(t.lo + build * rep_step, t.hi)
+        duration = np.round((t.lo + (t.hi - t.lo) * build / (BLOCK_WEEKS - 2)) * np.minimum(1 + growth * block, MAX_DURATION_GROWTH))
+        reps = np.where(timed, np.where(deload, np.round(duration * DELOAD_VOLUME), duration), np.where(strength, reps, t.lo))
+        sets = t.sets + np.where(distance, 1, np.where(strength, extra_sets, 0)) * np.minimum(block, MAX_EXTRA_SETS)
+        sets = np.where(deload & (strength | distance), np.maximum(1, np.round(sets * DELOAD_VOLUME)), sets)
+        load = np.where(strength, (1 + step * (block * (BLOCK_WEEKS - 1) + build)) * np.where(deload, DELOAD_LOAD, 1.0), 1.0)
+        self.template, self.goal, self.weeks, self.deload = t, goal, weeks, deload[:, 0]
+        self.sets, self.reps, self.load = sets.astype(np.int16), reps.astype(np.int16), load.astype(np.float32)
+        for a in (self.deload, self.sets, self.reps, self.load):
+            a.flags.writeable = False
+
+    def __len__(self):
+        return self.weeks
+
+    def volume(self):
+        """Weekly strength volume, sets x reps x relative load, per week."""
+        strength = self.template.kind == EXERCISE_KINDS.index("strength")
+        return (self.sets * self.reps * self.load * strength).sum(axis=1)
+
+    def week(self, i):
+        """Week i (0-based) as [(day, [exercise lines])], like generate_workout_plan."""
+        t, lose = self.template, self.goal == "Lose"
+        days = [(f"{day} (deload)" if self.deload[i] else day, []) for day in t.days]
+        for j, r in enumerate(t.records):
+            days[t.day[j]][1].append(r["fmt"].format(sets=int(self.sets[i, j]), reps=int(self.reps[i, j]), load=float(self.load[i, j])))
+        if lose:
+            for d in np.flatnonzero(~t.day_cardio):
+                days[d][1].append(CARDIO_FINISHER)
+        return days
+
+    def to_dict(self):
+        return [{"week": i + 1, "deload": bool(self.deload[i]), "days": [{"day": d, "exercises": ex} for d, ex in self.week(i)]}
+                for i in range(self.weeks)]
+
+    def to_frame(self):
+        """One row per week and exercise: Week, Day, Exercise, Kind, Sets, Reps, Load."""
+        t, n = self.template, len(self.template.records)
+        return pd.DataFrame({"Week": np.repeat(np.arange(1, self.weeks + 1), n),
+                             "Day": np.tile(np.asarray(t.days, dtype=object)[t.day], self.weeks),
+                             "Exercise": np.tile([r["text"] for r in t.records], self.weeks),
+                             "Kind": np.tile(np.asarray(EXERCISE_KINDS, dtype=object)[t.kind], self.weeks),
+                             "Sets": self.sets.ravel(), "Reps": self.reps.ravel(), "Load": self.load.ravel()})
+
+@functools.lru_cache(maxsize=None)
+def _workout_program(level, goal, weeks):
+    return WorkoutProgram(WORKOUT_TABLES[level], goal, weeks)
+
+def workout_program(level, goal, weeks=8):
+    """Periodized program of 4-16 weeks; memoized by (level, goal kind, weeks), so a whole member base
+    costs one build per distinct combination. Unknown levels fall back to beginner, as in generate_workout_plan."""
+    if not PROGRAM_WEEKS[0] <= weeks <= PROGRAM_WEEKS[1]:
+        raise ValueError(f"weeks must be between {PROGRAM_WEEKS[0]} and {PROGRAM_WEEKS[1]}, got {weeks}")
+    return _workout_program(level if level in WORKOUT_TABLES else "beginner", _goal_key(goal), int(weeks))
+
+# ---------- Diet suggestion rules ----------
+# A rule is {"tip": text, "when": [conditions]}; the tip is given when every condition holds
+# (rules without "when" always apply). Conditions:
+#   ("target", field, op, value[, default])  on the targets dict; `default` stands in for a missing field
+#   ("meal", prefix, field, op, value)       some meal whose name starts with `prefix` (case-insensitive)
+#   ("plan", field, op, value)               the whole-plan totals
+#   ("item", prefix, text)                   some meal starting with `prefix` has a food whose name contains `text`
+# Meal/plan fields are Calories, Protein_g, Carbs_g, Fat_g or a share of calories: protein_pct, carbs_pct, fat_pct.
+DIET_RULES = [
+    {"tip": "Target calories are low — prioritize protein and nutrient-dense foods.",
+     "when": [("target", "TargetCalories", "<", 1600), ("target", "TargetCalories", "!=", 0)]},
+    {"tip": "Distribute protein across meals (20-30g per meal).", "when": [("target", "Protein_g", "<", 1, 0)]},
+    {"tip": "Swap some peanut-butter snacks for Greek yogurt + berries.", "when": [("item", "sn", "Peanut Butter")]},
+    {"tip": "Include colored vegetables for vitamins and fiber."},
+    {"tip": "Stay hydrated (2-3 L/day depending on activity)."},
+    {"tip": "For medical conditions, consult a dietitian."},
+]
+
+MACRO_FIELDS = ("Calories", "Protein_g", "Carbs_g", "Fat_g")
+_COMPARE = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal, "==": np.equal, "!=": np.not_equal}
+
+def _macro_column(totals, field):
+    """`field` of (n, 4) [Calories, Protein_g, Carbs_g, Fat_g] totals; *_pct fields are % of calories."""
+    if field in MACRO_FIELDS:
+        return totals[:, MACRO_FIELDS.index(field)]
+    macro = field[:-4].capitalize() + "_g"
+    kcal = totals[:, MACRO_FIELDS.index(macro)] * (9.0 if macro == "Fat_g" else 4.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100.0 * kcal / totals[:, 0]
+
+class RuleBatch:
+    """Targets and plans of a batch flattened for rule evaluation: one array row per plan, per
+    meal and per item. Columns are built on first use and reused by every rule."""
+    def __init__(self, targets, plans, catalog):
+        self.catalog = catalog
+        self.n = len(plans)
+        if isinstance(targets, pd.DataFrame):
+            self._frame, self.targets = targets, None
+            self.has_targets = np.ones(self.n, dtype=bool)
+        else:
+            self._frame, self.targets = None, list(targets)
+            self.has_targets = np.array([bool(t) for t in self.targets], dtype=bool)
+        self._targets = {}
+        plans = [CompactPlan.from_frame(p, catalog) if p is not None and not isinstance(p, CompactPlan) else p for p in plans]
+        self.has_plan = np.array([p is not None for p in plans], dtype=bool)
+        plans = [p for p in plans if p is not None]
+        lens = np.array([len(p) for p in plans], dtype=np.int64)
+        self.meal_plan = np.repeat(np.flatnonzero(self.has_plan), lens)
+        vocab, layouts = {}, {}  # plans mostly share one tuple of meal names
+        for p in plans:
+            if p.meals not in layouts:
+                layouts[p.meals] = np.array([vocab.setdefault(m, len(vocab)) for m in p.meals], dtype=np.int32)
+        self.meal_codes = np.concatenate([layouts[p.meals] for p in plans]) if plans else np.zeros(0, dtype=np.int32)
+        self.meal_names = list(vocab)
+        self.meal_totals = np.concatenate([p.totals for p in plans]).astype(np.float64) if plans else np.zeros((0, 4))
+        self.meal_totals[:, 1:] /= 10
+        self.item_ids = np.concatenate([p.food_ids for p in plans]) if plans else np.zeros(0, dtype=np.int32)
+        # items per meal: diff of the stacked offsets, minus the jumps between consecutive plans
+        counts = np.diff(np.concatenate([p.offsets for p in plans])) if plans else np.zeros(0, dtype=np.int64)
+        keep = np.ones(len(counts), dtype=bool); keep[np.cumsum(lens + 1)[:-1] - 1] = False
+        self.item_meal = np.repeat(np.arange(len(self.meal_codes)), counts[keep])
+        self._prefix = {}; self._plan_totals = None
+
+    def target(self, field, default=np.nan):
+        key = (field, default)
+        if key not in self._targets:
+            if self._frame is not None:
+                col = self._frame[field] if field in self._frame else pd.Series(default, index=self._frame.index)
+                values = pd.to_numeric(col, errors="coerce").fillna(default).to_numpy(dtype=np.float64)
+            else:
+                values = np.array([np.nan if v is None else v for v in
+                                   (t.get(field, default) if t else default for t in self.targets)], dtype=np.float64)
+            self._targets[key] = values
+        return self._targets[key]
+
+    def meal_rows(self, prefix):
+        if prefix not in self._prefix:
+            vocab = np.array([m.lower().startswith(prefix) for m in self.meal_names], dtype=bool)
+            self._prefix[prefix] = vocab[self.meal_codes]
+        return self._prefix[prefix]
+
+    def plan_totals(self):
+        if self._plan_totals is None:
+            self._plan_totals = np.stack([np.bincount(self.meal_plan, weights=self.meal_totals[:, j], minlength=self.n)
+                                          for j in range(4)], axis=1)
+        return self._plan_totals
+
+    def any_meal(self, rows):
+        """Plans with at least one meal row set in `rows`."""
+        return np.bincount(self.meal_plan[rows], minlength=self.n) > 0
+
+class DietRules:
+    """Rules in the DIET_RULES format, compiled once into vectorized predicates. evaluate() gives a
+    (plans, rules) boolean mask for a whole batch; suggest() turns it into tip lists."""
+    def __init__(self, rules=DIET_RULES):
+        self.tips = [r["tip"] for r in rules]
+        self.predicates = [[self._compile(c) for c in r.get("when", ())] for r in rules]
+
+    def _compile(self, cond):
+        kind, *args = cond
+        if kind == "target":
+            field, op, value, *default = args
+            cmp, default = _COMPARE[op], (default[0] if default else np.nan)
+            return lambda b: b.has_targets & cmp(b.target(field, default), value)
+        if kind == "meal":
+            prefix, field, op, value = args
+            cmp, prefix = _COMPARE[op], prefix.lower()
+            _macro_column(np.ones((1, 4)), field)
+            return lambda b: b.any_meal(b.meal_rows(prefix) & cmp(_macro_column(b.meal_totals, field), value))
+        if kind == "plan":
+            field, op, value = args
+            cmp = _COMPARE[op]
+            _macro_column(np.ones((1, 4)), field)
+            return lambda b: b.has_plan & cmp(_macro_column(b.plan_totals(), field), value)
+        if kind == "item":
+            prefix, text = args
+            prefix = prefix.lower()
+            def predicate(b):
+                hit = np.zeros(len(b.meal_codes), dtype=bool)
+                hit[b.item_meal[np.isin(b.item_ids, b.catalog.containing(text))]] = True
+                return b.any_meal(hit & b.meal_rows(prefix))
+            return predicate
+        raise ValueError(f"Unknown rule condition: {cond!r}")
+
+    def evaluate(self, targets, plans, catalog=None):
+        """targets: list of dicts or a DataFrame; plans: CompactPlans, plan DataFrames or None."""
+        batch = RuleBatch(targets, plans, get_food_catalog() if catalog is None else catalog)
+        mask = np.ones((batch.n, len(self.tips)), dtype=bool)
+        for j, preds in enumerate(self.predicates):
+            for pred in preds:
+                mask[:, j] &= pred(batch)
+        return mask
+
+    @METRICS.timed("suggestions")
+    def suggest(self, targets, plans, catalog=None):
+        mask = self.evaluate(targets, plans, catalog)
+        if not len(mask):
+            return []
+        # distinct tip combinations are few, so build each list once
+        if mask.shape[1] < 63:
+            codes, inverse = np.unique(mask @ (1 << np.arange(mask.shape[1], dtype=np.int64)), return_inverse=True)
+            patterns = (codes[:, None] >> np.arange(mask.shape[1])) & 1
+        else:
+            patterns, inverse = np.unique(mask, axis=0, return_inverse=True)
+        tips = [[self.tips[j] for j in np.flatnonzero(row)] for row in patterns]
+        return [list(tips[i]) for i in inverse.ravel().tolist()]
+
+DIET_RULESET = DietRules()
+
+def ai_diet_suggestions(targets, last_plan_df, catalog=None):
+    return DIET_RULESET.suggest([targets], [last_plan_df], catalog)[0]
+
+# -------------------------
+# Plan cache
+# -------------------------
+SMARTFIT_HOME = os.environ.get("SMARTFIT_HOME", os.path.join(os.path.expanduser("~"), ".smartfit"))
+
+def quantize(value, step):
+    return float(value) if not step else round(round(float(value) / step) * step, 6)
+
+class PlanCache:
+    """Size-bounded LRU of {plan (CompactPlan), workout} keyed by quantized profile inputs. Plans are
+    computed from the bucket's quantized values, so every member of a bucket shares one (approximate)
+    plan; targets are never cached and always come from the exact inputs. The file written by save()
+    is plain JSON, so loading one never runs code from it."""
+    FORMAT_VERSION = 4
+
+    def __init__(self, maxsize=4096, weight_step=0.5, height_step=1.0, age_step=1, path=None):
+        self.maxsize = maxsize
+        self.steps = {"weight": weight_step, "height": height_step, "age": age_step}
+        self.path = path
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._added = {}  # keys put since the last take_added(), oldest first (at most maxsize)
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def profile_key(self, sex, age, weight, height, activity, goal, experience="beginner", mode="greedy"):
+        sex = "Male" if str(sex).lower().startswith("m") else "Female"
+        return (sex, quantize(age, self.steps["age"]), quantize(weight, self.steps["weight"]),
+                quantize(height, self.steps["height"]), activity, goal, experience, mode)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1; self._data.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._data[key] = entry; self._data.move_to_end(key)
+            self._added[key] = None
+            if len(self._added) > self.maxsize:
+                del self._added[next(iter(self._added))]
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    TDEE_STEP = 10.0  # kcal bucket for log-based TDEE estimates
+
+    def entry(self, sex, age, weight, height, activity, goal, experience="beginner", mode="greedy", tdee=None, tdee_confidence=1.0):
+        """The bucket's shared {plan, workout} entry (planned on a miss)."""
+        key = self.profile_key(sex, age, weight, height, activity, goal, experience, mode)
+        if tdee is not None and not math.isnan(tdee):
+            key += (quantize(tdee, self.TDEE_STEP), round(float(tdee_confidence), 2))
+        entry = self.get(key)
+        if entry is None:
+            sex, age, weight, height = key[:4]
+            bucket = calculate_tdee_and_targets(sex, weight, height, age, activity, goal, *key[8:])
+            entry = {"plan": generate_meal_plan(bucket["TargetCalories"], bucket["Protein_g"], bucket["Carbs_g"], bucket["Fat_g"], mode=mode, compact=True),
+                     "workout": generate_workout_plan(experience, goal)}
+            self.put(key, entry)
+        return entry
+
+    def plan(self, sex, age, weight, height, activity, goal, experience="beginner", mode="greedy", tdee=None, tdee_confidence=1.0):
+        """{targets, plan, workout}: exact targets for these inputs plus the bucket's cached plan and workout."""
+        entry = self.entry(sex, age, weight, height, activity, goal, experience, mode, tdee, tdee_confidence)
+        targets = calculate_tdee_and_targets(sex, weight, height, age, activity, goal, tdee, tdee_confidence)
+        return {**entry, "targets": targets}
+
+    def take_added(self):
+        """(key, {plan, workout}) for entries put since the last call and still cached, e.g. for a
+        batch worker to hand its new plans to the parent that saves the cache file."""
+        with self._lock:
+            keys, self._added = list(self._added), {}
+            return [(k, {"plan": self._data[k]["plan"], "workout": self._data[k]["workout"]}) for k in keys if k in self._data]
+
+    def merge(self, items):
+        for key, entry in items:
+            self.put(tuple(key), entry)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def clear(self):
+        with self._lock:
+            self._data.clear(); self._added.clear(); self.hits = self.misses = 0
+
+    def _signature(self):
+        # entries are only valid for the same quantization and food catalog
+        return {"version": self.FORMAT_VERSION, "steps": self.steps,
+                "catalog": [os.environ.get("SMARTFIT_CATALOG"), len(get_food_catalog())]}
+
+    def save(self, path=None):
+        path = path or self.path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            entries = [[list(k), {"plan": e["plan"].to_dict(), "workout": e["workout"]}] for k, e in self._data.items()]
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"signature": self._signature(), "entries": entries}, fh, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def load(self, path=None):
+        path = path or self.path
+        try:
+            with open(path, encoding="utf-8") as fh:
+                state = json.load(fh)
+            if not isinstance(state, dict) or state.get("signature") != json.loads(json.dumps(self._signature())):
+                print_status("Plan cache was built with other settings — starting cold."); return 0
+            entries = [(tuple(k), {"plan": CompactPlan.from_dict(e["plan"]), "workout": [(d, list(ex)) for d, ex in e["workout"]]})
+                       for k, e in state["entries"][-self.maxsize:]]
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            print_status(f"Ignoring unreadable plan cache {path}: {e}"); return 0
+        self.merge(entries)
+        with self._lock:
+            self._added.clear()
+        return len(self._data)
+
+
+# -------------------------
+# Plan history (SQLite)
+# -------------------------
+LOCAL_MEMBER = "local"  # member id of the desktop app's own plans
+
+def _sql_value(v):
+    return v.item() if isinstance(v, np.generic) else v
+
+class PlanStore:
+    """Profiles, targets and CompactPlans in one SQLite database (WAL mode, so readers never wait
+    on the writer). A plan is one row holding its arrays as BLOBs; (member_id, plan_date, id) and
+    plan_date are indexed, so "last N" and date-range lookups are index range scans whatever the
+    table size. Queries are constant SQL strings, which sqlite3 keeps prepared in its statement cache."""
+    SCHEMA_VERSION = 1
+    TARGETS = ("BMR", "TDEE", "TargetCalories", "Protein_g", "Carbs_g", "Fat_g")
+    PROFILE = ("sex", "age", "weight", "height", "activity", "goal", "experience")
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS profiles (
+            id INTEGER PRIMARY KEY, member_id TEXT NOT NULL, created TEXT NOT NULL,
+            sex TEXT, age INTEGER, weight REAL, height REAL, activity TEXT, goal TEXT, experience TEXT);
+        CREATE TABLE IF NOT EXISTS plans (
+            id INTEGER PRIMARY KEY, member_id TEXT NOT NULL, plan_date TEXT NOT NULL, created TEXT NOT NULL,
+            profile_id INTEGER REFERENCES profiles(id), mode TEXT,
+            bmr INTEGER, tdee INTEGER, target_calories INTEGER, protein_g INTEGER, carbs_g INTEGER, fat_g INTEGER,
+            meals TEXT NOT NULL, days BLOB, offsets BLOB NOT NULL, food_ids BLOB NOT NULL, portions BLOB NOT NULL, totals BLOB NOT NULL);
+        CREATE INDEX IF NOT EXISTS profiles_member ON profiles(member_id, id);
+        CREATE INDEX IF NOT EXISTS plans_member_date ON plans(member_id, plan_date, id);
+        CREATE INDEX IF NOT EXISTS plans_date ON plans(plan_date, id);
+    """
+    _COLUMNS = ("id, member_id, plan_date, created, profile_id, mode, bmr, tdee, target_calories, protein_g, carbs_g, fat_g, "
+                "meals, days, offsets, food_ids, portions, totals")
+    _INSERT_PROFILE = "INSERT INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    _INSERT_PLAN = f"INSERT INTO plans ({_COLUMNS}) VALUES ({', '.join('?' * 18)})"
+    _LAST = f"SELECT {_COLUMNS} FROM plans WHERE member_id = ? ORDER BY plan_date DESC, id DESC LIMIT ?"
+    _MEMBER_RANGE = f"SELECT {_COLUMNS} FROM plans WHERE member_id = ? AND plan_date BETWEEN ? AND ? ORDER BY plan_date, id LIMIT ?"
+    _RANGE = f"SELECT {_COLUMNS} FROM plans WHERE plan_date BETWEEN ? AND ? ORDER BY plan_date, id LIMIT ?"
+    _PROFILE = "SELECT sex, age, weight, height, activity, goal, experience FROM profiles WHERE id = ?"
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(SMARTFIT_HOME, "history.sqlite3")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # one connection shared by the UI thread and the job thread, serialized by the lock
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+        self._lock = threading.Lock()
+        with self._lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > self.SCHEMA_VERSION:
+                raise RuntimeError(f"{self.path} was written by a newer SmartFit (schema {version})")
+            self.conn.executescript(self.SCHEMA)
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def add_plan(self, member_id, profile, targets, plan, plan_date=None, mode="greedy"):
+        return self.add_many([(member_id, profile, targets, plan)], plan_date, mode)[0]
+
+    def add_many(self, records, plan_date=None, mode="greedy"):
+        """Insert (member_id, profile dict or None, targets dict, plan) records in one transaction
+        with two executemany calls; returns the new plan ids. plan_date defaults to today."""
+        plan_date = str(plan_date or datetime.date.today())
+        created = datetime.datetime.now().isoformat(timespec="seconds")
+        records = [(str(m), prof, t, p if isinstance(p, CompactPlan) else CompactPlan.from_frame(p)) for m, prof, t, p in records]
+        with self._lock, self.conn:
+            cur = self.conn.execute("BEGIN IMMEDIATE")  # ids below are assigned while holding the write lock
+            next_profile = cur.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM profiles").fetchone()[0]
+            next_plan = cur.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM plans").fetchone()[0]
+            profiles, plans = [], []
+            for i, (member, prof, t, p) in enumerate(records):
+                profile_id = None
+                if prof:
+                    profile_id = next_profile + len(profiles)
+                    profiles.append((profile_id, member, created, *(_sql_value(prof.get(k)) for k in self.PROFILE)))
+                plans.append((next_plan + i, member, plan_date, created, profile_id, mode, *(_sql_value(t.get(k)) for k in self.TARGETS),
+                              json.dumps(p.meals), None if p.days is None else p.days.tobytes(), p.offsets.tobytes(),
+                              p.food_ids.tobytes(), p.portions.tobytes(), p.totals.tobytes()))
+            cur.executemany(self._INSERT_PROFILE, profiles)
+            cur.executemany(self._INSERT_PLAN, plans)
+        return [row[0] for row in plans]
+
+    @classmethod
+    def _decode(cls, row):
+        (plan_id, member, plan_date, created, profile_id, mode, *targets), blobs = row[:12], row[12:]
+        meals, days, offsets, food_ids, portions, totals = blobs
+        plan = CompactPlan(json.loads(meals), np.frombuffer(offsets, np.int32), np.frombuffer(food_ids, np.int32),
+                           np.frombuffer(portions, np.float32), np.frombuffer(totals, np.int32),
+                           None if days is None else np.frombuffer(days, np.int16))
+        return {"id": plan_id, "member_id": member, "date": plan_date, "created": created, "profile_id": profile_id,
+                "mode": mode, "targets": dict(zip(cls.TARGETS, targets)), "plan": plan}
+
+    def last_plans(self, member_id, n=10):
+        """The member's n most recent plans, newest first."""
+        with self._lock:
+            rows = self.conn.execute(self._LAST, (str(member_id), n)).fetchall()
+        return [self._decode(r) for r in rows]
+
+    def plans_between(self, start, end, member_id=None, limit=10000):
+        """Plans dated start..end (inclusive ISO dates), oldest first; all members unless member_id."""
+        start, end = str(start), str(end)
+        with self._lock:
+            if member_id is None:
+                rows = self.conn.execute(self._RANGE, (start, end, limit)).fetchall()
+            else:
+                rows = self.conn.execute(self._MEMBER_RANGE, (str(member_id), start, end, limit)).fetchall()
+        return [self._decode(r) for r in rows]
+
+    def profile(self, profile_id):
+        with self._lock:
+            row = self.conn.execute(self._PROFILE, (profile_id,)).fetchone()
+        return None if row is None else dict(zip(self.PROFILE, row))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# -------------------------
+# Progress tracking
+# -------------------------
+KCAL_PER_KG = 7700.0  # energy in 1 kg of body-weight change
+_EPOCH = datetime.date(1970, 1, 1)
+
+def day_number(day):
+    """Days since 1970-01-01 for a date, datetime, ISO string or a day number itself."""
+    if isinstance(day, (int, np.integer)):
+        return int(day)
+    if isinstance(day, datetime.datetime):
+        day = day.date()
+    elif not isinstance(day, datetime.date):
+        day = datetime.date.fromisoformat(str(day)[:10])
+    return (day - _EPOCH).days
+
+def _day_numbers(values):
+    values = pd.Series(values)
+    if pd.api.types.is_integer_dtype(values):
+        return values.to_numpy(dtype=np.int64)
+    return pd.to_datetime(values).to_numpy().astype("datetime64[D]").astype(np.int64)
+
+def tdee_confidence(coverage, window=28, min_days=14):
+    """How far to trust a log-based TDEE from `coverage`, the number of logged days in the window:
+    0 below min_days, then coverage/window up to 1."""
+    coverage = np.asarray(coverage, dtype=np.float64)
+    return np.where(coverage >= min_days, np.minimum(1.0, coverage / window), 0.0)
+
+class MemberProgress:
+    """One member's weight/intake log reduced to running statistics, each add() in O(1):
+    EWMA weight trend and intake (per logged value), and over the last `window` days a
+    least-squares weight slope, mean intake and number of distinct logged days (`coverage`), kept
+    as sums that entries enter and leave. Observed TDEE = mean intake - slope * KCAL_PER_KG."""
+    __slots__ = ("window", "alpha", "origin", "last_day", "count", "entries", "n_w", "st", "sw", "stt", "stw",
+                 "intake_sum", "n_intake", "trend", "intake_ewma", "coverage")
+
+    def __init__(self, window=28, alpha=0.1):
+        self.window, self.alpha = window, alpha
+        self.origin = self.last_day = None
+        self.count = 0
+        self.entries = deque()  # (day, weight or nan, intake or nan) inside the window
+        self.n_w = self.st = self.sw = self.stt = self.stw = self.intake_sum = 0.0
+        self.n_intake = self.coverage = 0
+        self.trend = self.intake_ewma = math.nan
+
+    def _sums(self, t, w, x, sign):
+        if not math.isnan(w):
+            self.n_w += sign; self.st += sign * t; self.sw += sign * w
+            self.stt += sign * t * t; self.stw += sign * t * w
+        if not math.isnan(x):
+            self.intake_sum += sign * x; self.n_intake += sign
+
+    def add(self, day, weight=None, intake=None):
+        """Log one day (date, ISO string or day number); entries must come in date order."""
+        day = day_number(day)
+        if self.last_day is not None and day < self.last_day:
+            raise ValueError("progress entries must be added in date order")
+        if self.origin is None:
+            self.origin = day
+        w = math.nan if weight is None else float(weight)
+        x = math.nan if intake is None else float(intake)
+        self._sums(day - self.origin, w, x, 1)
+        if not math.isnan(w):
+            self.trend = w if math.isnan(self.trend) else self.trend + self.alpha * (w - self.trend)
+        if not math.isnan(x):
+            self.intake_ewma = x if math.isnan(self.intake_ewma) else self.intake_ewma + self.alpha * (x - self.intake_ewma)
+        self._append(day, w, x)
+        while self.entries[0][0] <= day - self.window:
+            old_day, old_w, old_x = self.entries.popleft()
+            self._sums(old_day - self.origin, old_w, old_x, -1)
+            if not self.entries or self.entries[0][0] != old_day:
+                self.coverage -= 1
+        self.last_day = day; self.count += 1
+        return self
+
+    def _append(self, day, w, x):
+        if not self.entries or self.entries[-1][0] != day:
+            self.coverage += 1
+        self.entries.append((day, w, x))
+
+    def slope(self):
+        """Weight change in kg/day over the window (nan with fewer than 2 weigh-ins)."""
+        denom = self.n_w * self.stt - self.st * self.st
+        return (self.n_w * self.stw - self.st * self.sw) / denom if self.n_w >= 2 and denom > 0 else math.nan
+
+    def observed_tdee(self):
+        if not self.n_intake:
+            return math.nan
+        return self.intake_sum / self.n_intake - self.slope() * KCAL_PER_KG
+
+    def stats(self, min_days=14):
+        return {"trend": self.trend, "intake_ewma": self.intake_ewma, "slope_kg_per_day": self.slope(),
+                "intake_mean": self.intake_sum / self.n_intake if self.n_intake else math.nan,
+                "coverage": self.coverage, "tdee": self.observed_tdee(),
+                "confidence": float(tdee_confidence(self.coverage, self.window, min_days))}
+
+def progress_frame(logs, window=28, alpha=0.1, min_days=14):
+    """MemberProgress statistics after every row of a log DataFrame (member_id, date, weight, intake),
+    computed for all members at once: rows are sorted by member and date, EWMAs come from a grouped
+    ewm() and window sums from cumulative sums cut at each row's window start (one searchsorted).
+    Returns the sorted log with the MemberProgress.stats() columns added."""
+    day = _day_numbers(logs["date"])
+    codes = pd.factorize(logs["member_id"], sort=True)[0].astype(np.int64)
+    order = np.lexsort((day, codes))  # stable: same-day rows keep their log order
+    df, day, codes = logs.iloc[order].reset_index(drop=True), day[order], codes[order]
+    w = pd.to_numeric(df["weight"], errors="coerce").to_numpy(dtype=np.float64) if "weight" in df else np.full(len(df), np.nan)
+    x = pd.to_numeric(df["intake"], errors="coerce").to_numpy(dtype=np.float64) if "intake" in df else np.full(len(df), np.nan)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(df) else np.zeros(0, dtype=np.int64)
+    t = (day - np.repeat(day[starts], np.diff(np.r_[starts, len(df)]))).astype(np.float64)
+    has_w, has_x = ~np.isnan(w), ~np.isnan(x)
+    w0, x0 = np.where(has_w, w, 0.0), np.where(has_x, x, 0.0)
+    tw = np.where(has_w, t, 0.0)
+    parts = np.stack([has_w.astype(np.float64), tw, w0, tw * t, tw * w0, x0, has_x.astype(np.float64)], axis=1)
+    cs = np.vstack([np.zeros((1, parts.shape[1])), np.cumsum(parts, axis=0)])
+    key = (codes << 32) | (day - (day.min() if len(day) else 0))
+    first = np.searchsorted(key, key - window + 1, side="left")  # oldest row still inside each row's window
+    new_day = np.cumsum(np.r_[0, np.r_[True, key[1:] != key[:-1]] if len(key) else []])  # distinct days up to each row
+    n_w, st, sw, stt, stw, sx, n_x = (cs[1:] - cs[first]).T
+    denom = n_w * stt - st * st
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where((n_w >= 2) & (denom > 0), (n_w * stw - st * sw) / denom, np.nan)
+        intake_mean = np.where(n_x > 0, sx / n_x, np.nan)
+    grouped = lambda v: pd.Series(v).groupby(codes).ewm(alpha=alpha, adjust=False, ignore_na=True).mean().to_numpy()
+    coverage = new_day[1:] - new_day[first]
+    return df.assign(day=day, trend=grouped(w), intake_ewma=grouped(x), slope_kg_per_day=slope, intake_mean=intake_mean,
+                     coverage=coverage, tdee=intake_mean - slope * KCAL_PER_KG,
+                     confidence=tdee_confidence(coverage, window, min_days))
+
+class ProgressTracker:
+    """MemberProgress for many members. add() streams single entries; ingest_frame() bulk-loads
+    history with progress_frame() and seeds each new member's running state from it, so
+    streaming continues where the history ends. targets() feeds the estimate into
+    calculate_tdee_and_targets."""
+    def __init__(self, window=28, alpha=0.1, min_days=14):
+        self.window, self.alpha, self.min_days = window, alpha, min_days
+        self.members = {}
+
+    def add(self, member_id, day, weight=None, intake=None):
+        state = self.members.get(member_id)
+        if state is None:
+            state = self.members[member_id] = MemberProgress(self.window, self.alpha)
+        return state.add(day, weight, intake)
+
+    def ingest_frame(self, logs):
+        """Load a log DataFrame (member_id, date, weight, intake). Members already tracked get their
+        rows streamed through add(); new members are computed vectorized. Returns the progress_frame."""
+        known = logs["member_id"].isin(list(self.members)).to_numpy()
+        for r in logs[known].sort_values("date", kind="stable").to_dict("records"):
+            self.add(r["member_id"], r["date"], r.get("weight"), r.get("intake"))
+        frame = progress_frame(logs[~known], self.window, self.alpha, self.min_days)
+        if frame.empty:
+            return frame
+        codes = pd.factorize(frame["member_id"], sort=True)[0]
+        ends = np.r_[np.flatnonzero(codes[1:] != codes[:-1]), len(frame) - 1]
+        starts = np.r_[0, ends[:-1] + 1]
+        day = frame["day"].to_numpy()
+        w = pd.to_numeric(frame["weight"], errors="coerce").to_numpy(dtype=np.float64) if "weight" in frame else np.full(len(frame), np.nan)
+        x = pd.to_numeric(frame["intake"], errors="coerce").to_numpy(dtype=np.float64) if "intake" in frame else np.full(len(frame), np.nan)
+        last = frame.iloc[ends]
+        for i, (member, lo, hi) in enumerate(zip(last["member_id"].tolist(), starts.tolist(), ends.tolist())):
+            state = self.members[member] = MemberProgress(self.window, self.alpha)
+            state.origin, state.last_day, state.count = int(day[lo]), int(day[hi]), hi - lo + 1
+            window_start = lo + int(np.searchsorted(day[lo:hi + 1], day[hi] - self.window + 1))
+            for d, wv, xv in zip(day[window_start:hi + 1].tolist(), w[window_start:hi + 1].tolist(), x[window_start:hi + 1].tolist()):
+                state._append(d, wv, xv)
+                state._sums(d - state.origin, wv, xv, 1)
+            state.trend, state.intake_ewma = float(last["trend"].iat[i]), float(last["intake_ewma"].iat[i])
+        return frame
+
+    def estimate(self, member_id):
+        """(observed TDEE, confidence) for a member; (nan, 0.0) when unknown or not enough data."""
+        state = self.members.get(member_id)
+        if state is None:
+            return math.nan, 0.0
+        tdee = state.observed_tdee()
+        return tdee, (0.0 if math.isnan(tdee) else float(tdee_confidence(state.coverage, self.window, self.min_days)))
+
+    def summary(self):
+        """One row of MemberProgress.stats() per member."""
+        return pd.DataFrame([{"member_id": m, **st.stats(self.min_days)} for m, st in self.members.items()])
+
+    def targets(self, member_id, sex, weight_kg, height_cm, age, activity_level, goal):
+        """calculate_tdee_and_targets with the member's log-based TDEE blended in (weight_kg=None: trend weight)."""
+        tdee, confidence = self.estimate(member_id)
+        if weight_kg is None:
+            weight_kg = self.members[member_id].trend
+        return calculate_tdee_and_targets(sex, weight_kg, height_cm, age, activity_level, goal, tdee, confidence)
+
+
+# -------------------------
+# Headless batch generation
+# -------------------------
+PROFILE_DEFAULTS = {"sex": "Male", "experience": "beginner", "activity": ACTIVITY_LEVELS[2], "goal": GOALS[1]}
+
+def read_profiles(path):
+    """Stream profile dicts from a CSV or JSONL (.jsonl/.ndjson) file, one row at a time."""
+    with open(path, encoding="utf-8", newline="") as fh:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(fh)
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+def plan_to_dict(plan, catalog=None):
+    """JSON-ready rows for a plan DataFrame or CompactPlan (items as display strings)."""
+    if isinstance(plan, CompactPlan):
+        catalog = get_food_catalog() if catalog is None else catalog
+        fmt = lambda f, p: format_plan_item({"name": catalog.names[f], "serving": catalog.servings[f], "portion": p})
+        rows = plan.rows(catalog, resolve=False)
+        for r in rows:
+            r["Items"] = [fmt(f, p) for f, p in r["Items"]]
+        return rows
+    return [{"Meal": r["Meal"], "Items": [format_plan_item(it) for it in r["Items"]], "Calories": int(r["Calories"]),
+             "Protein_g": float(r["Protein_g"]), "Carbs_g": float(r["Carbs_g"]), "Fat_g": float(r["Fat_g"])}
+            for r in plan.to_dict("records")]
+
+def _profile_result(targets, plan, workout, suggestions=None):
+    return {"targets": targets, "meals": plan_to_dict(plan), "workout": [{"day": d, "exercises": ex} for d, ex in workout],
+            "suggestions": ai_diet_suggestions(targets, plan) if suggestions is None else suggestions}
+
+@METRICS.timed("inputs.parse")
+def _profile_frame(rows):
+    """Profile dicts as a DataFrame with defaults filled in, plus the mask of rows with usable numbers."""
+    df = pd.DataFrame([{**PROFILE_DEFAULTS, **{k: v for k, v in r.items() if v not in (None, "")}} for r in rows])
+    for c in ("weight", "height", "age"):
+        df[c] = pd.to_numeric(df[c], errors="coerce") if c in df else np.nan
+    for c in ("tdee", "tdee_confidence"):
+        if c in df:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    return df, df[["weight", "height", "age"]].notna().all(axis=1).to_numpy()
+
+def plan_profiles(rows, mode="greedy", cache=None, records=None):
+    """profile_results() of a chunk as one JSON line per row."""
+    return [json.dumps(res, default=str) for res in profile_results(rows, mode, cache, records)]
+
+def profile_results(rows, mode="greedy", cache=None, records=None):
+    """Full SmartFit output for a chunk of profile dicts: targets (one vectorized pass), meal plan,
+    workout plan and suggestions. Returns one result dict per row; bad rows get an "error" field.
+    With a PlanCache, meal and workout plans are shared per quantized bucket (targets and suggestions
+    stay exact per row). If `records` is a list,
+    (member id, profile, targets, plan) is appended to it for every planned row (see PlanStore)."""
+    df, valid = _profile_frame(rows)
+    targets = calculate_targets_batch(df[valid]).to_dict("records") if valid.any() else []
+    out, planned, t_iter = [], [], iter(targets)
+    for i, r in enumerate(df.to_dict("records")):
+        res = {"id": r.get("id", r.get("name"))}
+        if not valid[i]:
+            res["error"] = "invalid weight/height/age"
+            out.append(res)
+            continue
+        t = {k: int(v) for k, v in next(t_iter).items()}
+        if cache is not None:
+            entry = cache.entry(r["sex"], r["age"], r["weight"], r["height"], r["activity"], r["goal"], r["experience"], mode,
+                                r.get("tdee"), 1.0 if pd.isna(conf := r.get("tdee_confidence", 1.0)) else conf)
+            if "rows" not in entry:  # JSON-ready meals/workout, shared by the bucket's rows
+                entry["rows"] = _profile_result(t, entry["plan"], entry["workout"], suggestions=[])
+            plan, rows = entry["plan"], entry["rows"]
+            res.update(targets=t, meals=rows["meals"], workout=rows["workout"], suggestions=[])
+        else:
+            plan = generate_meal_plan(t["TargetCalories"], t["Protein_g"], t["Carbs_g"], t["Fat_g"], mode=mode, compact=True)
+            res.update(_profile_result(t, plan, generate_workout_plan(r["experience"], r["goal"]), suggestions=[]))
+        planned.append((res, t, plan))
+        if records is not None:
+            records.append((res["id"], {k: r[k] for k in PlanStore.PROFILE}, t, plan))
+        out.append(res)
+    if planned:
+        # suggestions for every row of the chunk in one rule pass
+        results, t_list, plans = zip(*planned)
+        for res, tips in zip(results, DIET_RULESET.suggest(t_list, plans)):
+            res["suggestions"].extend(tips)
+    return out
+
+_batch_cache = None
+
+def _init_batch_worker(catalog_path, cache_options=None, metrics=None):
+    global _batch_cache
+    if catalog_path:
+        set_food_catalog(FoodCatalog.open(catalog_path))
+    # each worker keeps its own cache, warm-started from the cache file; new entries go back to
+    # the parent with each chunk (take_added), which merges them and writes the file once
+    _batch_cache = PlanCache(**cache_options) if cache_options is not None else None
+    if metrics is not None:
+        METRICS.enable(**metrics)
+
+def _plan_chunk(rows, mode, keep_records=False):
+    """JSON lines for a chunk, the worker's metrics since the last chunk (None when disabled),
+    with keep_records the PlanStore records of the chunk, and the cache entries it added when the
+    cache is backed by a file."""
+    records = [] if keep_records else None
+    lines = plan_profiles(rows, mode, _batch_cache, records)
+    added = _batch_cache.take_added() if _batch_cache is not None and _batch_cache.path else None
+    return lines, METRICS.take() if METRICS.enabled else None, records, added
+
+def run_batch(input_path, output_path, workers=None, chunk_size=1000, mode="greedy", catalog_path=None, cache_options=None, store=None,
+              tdee_estimates=None):
+    """Stream profiles through a process pool and write JSONL results in input order.
+    At most 2 chunks per worker are in flight, so memory stays bounded for any input size.
+    With a PlanStore, every plan is also saved to it, one transaction per chunk.
+    tdee_estimates maps profile id -> (tdee, confidence), e.g. from ProgressTracker.estimate().
+    With a cache file in cache_options["path"], the plans the workers added are merged and saved to
+    it afterwards, so the next run starts warm."""
+    workers = workers or os.cpu_count() or 1
+    saved_cache = PlanCache(**cache_options) if cache_options and cache_options.get("path") else None
+    count = 0; start = time.perf_counter()
+    metrics = {"profile_slowest": METRICS.profile_slowest} if METRICS.enabled else None
+    with open(output_path, "w", encoding="utf-8") as out, \
+         futures.ProcessPoolExecutor(workers, initializer=_init_batch_worker, initargs=(catalog_path, cache_options, metrics)) as pool:
+        pending = deque()
+        def drain(limit):
+            nonlocal count
+            while len(pending) > limit:
+                lines, metrics, records, added = pending.popleft().result()
+                if metrics:
+                    METRICS.merge(metrics)
+                if added:
+                    saved_cache.merge(added)
+                if records:
+                    store.add_many(records, mode=mode)
+                out.write("\n".join(lines) + "\n"); count += len(lines)
+        for chunk in _chunks(read_profiles(input_path), chunk_size):
+            if tdee_estimates:
+                for r in chunk:
+                    est = tdee_estimates.get(str(r.get("id")))
+                    if est is not None:
+                        r["tdee"], r["tdee_confidence"] = est
+            pending.append(pool.submit(_plan_chunk, chunk, mode, store is not None))
+            drain(2 * workers)
+        drain(0)
+    if saved_cache is not None:
+        saved_cache.save()
+        print_status(f"Plan cache saved to {saved_cache.path} ({len(saved_cache._data)} entries)")
+    elapsed = time.perf_counter() - start
+    print_status(f"Planned {count} profiles in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f}/s, {workers} workers)")
+    return count
+
+
+# -------------------------
+# Plan export
+# -------------------------
+PLAN_COLUMNS = ("Meal", "Items", "Calories", "Protein_g", "Carbs_g", "Fat_g")
+
+def export_format(path, fmt=None, compression=None):
+    """(format, compression) for `path`: explicit values win, otherwise the file name decides
+    (.csv, .csv.gz, .csv.zst, .parquet, .feather/.arrow)."""
+    name = path.lower()
+    suffix = next((c for ext, c in ((".gz", "gzip"), (".zst", "zstd"), (".zstd", "zstd")) if name.endswith(ext)), None)
+    if suffix:
+        name = name.rsplit(".", 1)[0]
+    if fmt is None:
+        fmt = "parquet" if name.endswith((".parquet", ".pq")) else "feather" if name.endswith((".feather", ".arrow")) else "csv"
+    if fmt not in ("csv", "parquet", "feather"):
+        raise ValueError(f"Unknown export format: {fmt}")
+    return fmt, compression or suffix
+
+class PlanWriter:
+    """Streams any number of plans (CompactPlan or plan DataFrame) to one CSV, Parquet or Feather
+    file, one row per meal. Rows are buffered and written `chunk_size` at a time, so memory stays
+    bounded. CSV starts with `# key: value` header lines; Parquet/Feather keep them as schema metadata.
+    With `id_column`, every row carries the plan id passed to add(); with `days`, a Day column."""
+    def __init__(self, path, fmt=None, compression=None, metadata=None, title="SmartFit - Personalized Plan",
+                 id_column=None, days=False, chunk_size=50000, catalog=None):
+        self.path, self.chunk_size = path, chunk_size
+        self.fmt, self.compression = export_format(path, fmt, compression)
+        self.catalog = get_food_catalog() if catalog is None else catalog
+        self.id_column = id_column
+        self.columns = ((id_column,) if id_column else ()) + (("Day",) if days else ()) + PLAN_COLUMNS
+        self.metadata = {"title": title, **(metadata or {})}
+        self.buffer = {c: [] for c in self.columns}
+        self.rows = self.plans = 0
+        self._labels = {}
+        self._handles = []
+        if self.fmt == "csv":
+            self._open_csv()
+        else:
+            self._open_arrow()
+
+    def _open_csv(self):
+        raw = open(self.path, "wb", buffering=1 << 20)
+        self._handles.append(raw)
+        if self.compression == "gzip":
+            raw = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+            self._handles.append(raw)
+        elif self.compression == "zstd":
+            if not ZSTD_AVAILABLE:
+                raw.close(); raise RuntimeError("zstd compression needs the zstandard package")
+            import zstandard
+            raw = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+            self._handles.append(raw)
+        elif self.compression:
+            raw.close(); raise ValueError(f"Unsupported CSV compression: {self.compression}")
+        fh = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        self._handles.append(fh)
+        meta = dict(self.metadata)
+        fh.write(f"# {meta.pop('title')}\n")
+        for k, v in meta.items():
+            fh.write(f"# {k}: {v}\n")
+        self._csv = csv.writer(fh, lineterminator="\n")
+        self._csv.writerow(self.columns)
+
+    def _open_arrow(self):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError(f"{self.fmt} export needs the pyarrow package")
+        import pyarrow as pa
+        types = {"Day": pa.int16(), "Calories": pa.int32(), "Protein_g": pa.float64(), "Carbs_g": pa.float64(), "Fat_g": pa.float64()}
+        self._pa = pa
+        self._schema = pa.schema([(c, types.get(c, pa.string())) for c in self.columns],
+                                 metadata={str(k): str(v) for k, v in self.metadata.items()})
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression=self.compression or "snappy")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=self.compression)
+            sink = pa.OSFile(self.path, "wb")
+            self._handles.append(sink)
+            self._writer = pa.ipc.new_file(sink, self._schema, options=options)
+
+    def _label(self, food_id, portion):
+        key = (food_id, portion)
+        label = self._labels.get(key)
+        if label is None:
+            if len(self._labels) > 1 << 18:
+                self._labels.clear()
+            cat = self.catalog
+            label = self._labels[key] = format_plan_item({"name": cat.names[food_id], "serving": cat.servings[food_id], "portion": portion})
+        return label
+
+    def add(self, plan, plan_id=None):
+        if not isinstance(plan, CompactPlan):
+            plan = CompactPlan.from_frame(plan, self.catalog)
+        n, b = len(plan), self.buffer
+        if self.id_column:
+            b[self.id_column].extend([None if plan_id is None else str(plan_id)] * n)
+        if "Day" in b:
+            b["Day"].extend(plan.days.tolist() if plan.days is not None else [None] * n)
+        b["Meal"].extend(plan.meals)
+        ids, ports, offsets = plan.food_ids.tolist(), plan.portions.tolist(), plan.offsets.tolist()
+        b["Items"].extend("; ".join(self._label(f, p) for f, p in zip(ids[lo:hi], ports[lo:hi]))
+                          for lo, hi in zip(offsets, offsets[1:]))
+        b["Calories"].extend(plan.totals[:, 0].tolist())
+        for j, c in enumerate(("Protein_g", "Carbs_g", "Fat_g"), 1):
+            b[c].extend((plan.totals[:, j] / 10).tolist())
+        self.rows += n; self.plans += 1
+        if len(b["Meal"]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        b = self.buffer
+        if not b["Meal"]:
+            return
+        if self.fmt == "csv":
+            self._csv.writerows(zip(*(b[c] for c in self.columns)))
+        else:
+            self._writer.write_table(self._pa.Table.from_pydict(b, schema=self._schema))
+        for col in b.values():
+            col.clear()
+
+    def close(self):
+        try:
+            self.flush()
+            if self.fmt != "csv":
+                self._writer.close()
+        finally:
+            for h in reversed(self._handles):
+                h.close()
+            self._handles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def export_plans(plans, path, **options):
+    """Write an iterable of plans, or (plan id, plan) pairs, to `path`; returns the number of rows.
+    Options are passed to PlanWriter (pairs default to id_column="Plan")."""
+    it = iter(plans)
+    first = next(it, None)
+    paired = isinstance(first, tuple)
+    if paired:
+        options.setdefault("id_column", "Plan")
+    with PlanWriter(path, **options) as writer:
+        for item in itertools.chain([first], it) if first is not None else ():
+            writer.add(*(item[::-1] if paired else (item,)))
+    return writer.rows
+
+def export_profiles(input_path, output_path, mode="greedy", chunk_size=1000, fmt=None, compression=None, cache=None):
+    """Plan every profile in a CSV/JSONL file and write the meal rows to one export file keyed by
+    profile id. Profiles are read and planned `chunk_size` at a time; invalid rows are skipped."""
+    start = time.perf_counter(); skipped = 0
+    meta = {"source": os.path.basename(input_path), "mode": mode, "generated": datetime.datetime.now().isoformat(timespec="seconds")}
+    with PlanWriter(output_path, fmt, compression, meta, title="SmartFit - Plan Export", id_column="Profile") as writer:
+        for chunk in _chunks(read_profiles(input_path), chunk_size):
+            df, valid = _profile_frame(chunk)
+            skipped += int((~valid).sum())
+            df = df[valid]
+            if df.empty:
+                continue
+            pids = df["id"].tolist() if "id" in df else df["name"].tolist() if "name" in df else [None] * len(df)
+            if cache is not None:
+                recs = df.to_dict("records")
+                plans = [cache.entry(r["sex"], r["age"], r["weight"], r["height"], r["activity"], r["goal"], r["experience"], mode)["plan"] for r in recs]
+            else:
+                t = calculate_targets_batch(df)
+                plans = [generate_meal_plan(c, p, cb, f, mode=mode, compact=True) for c, p, cb, f in
+                         zip(t["TargetCalories"].tolist(), t["Protein_g"].tolist(), t["Carbs_g"].tolist(), t["Fat_g"].tolist())]
+            for pid, plan in zip(pids, plans):
+                writer.add(plan, pid)
+    elapsed = time.perf_counter() - start
+    print_status(f"Exported {writer.plans} plans ({writer.rows} rows, {skipped} skipped) in {elapsed:.1f}s "
+                 f"({writer.plans / max(elapsed, 1e-9):.0f} plans/s)")
+    return writer.plans
+
+
+# -------------------------
+# Benchmarks
+# -------------------------
+BENCH_FORMAT_VERSION = 2
+
+def synthetic_catalog(n, seed=0):
+    """FOOD_DB (truncated for n < 17) followed by random variants of its foods with macros scaled 0.5-1.5x."""
+    if n <= len(FOOD_DB):
+        return FoodCatalog.from_records(FOOD_DB[:n])
+    base = FoodCatalog.from_records(FOOD_DB)
+    rng = np.random.default_rng(seed)
+    src = rng.integers(0, len(FOOD_DB), n - len(FOOD_DB))
+    macros = np.vstack([base.macros, np.round(base.macros[src] * rng.uniform(0.5, 1.5, (len(src), 1)), 1)])
+    names, servings = list(base.names), list(base.servings)
+    names += [f"{names[j]} #{i}" for i, j in enumerate(src.tolist(), len(FOOD_DB))]
+    servings += [servings[j] for j in src.tolist()]
+    return FoodCatalog(names, servings, *macros.T)
+
+def synthetic_profiles(n, seed=0):
+    """n random profiles with the columns read_profiles/calculate_targets_batch expect."""
+    rng = np.random.default_rng(seed)
+    pick = lambda values: np.asarray(values, dtype=object)[rng.integers(0, len(values), n)]
+    return pd.DataFrame({"id": np.arange(n), "sex": pick(["Male", "Female"]),
+                         "weight": np.round(rng.uniform(45, 130, n), 1), "height": np.round(rng.uniform(150, 200, n), 1),
+                         "age": rng.integers(16, 80, n), "activity": pick(ACTIVITY_LEVELS), "goal": pick(GOALS),
+                         "experience": pick(list(WORKOUT_TEMPLATES))})
+
+# expected range of n normal samples in standard deviations (n = 2..10)
+_RANGE_SIGMAS = (1.128, 1.693, 2.059, 2.326, 2.534, 2.704, 2.847, 2.970, 3.078)
+
+def _relative_spread(samples):
+    """Relative standard deviation of repeated measurements, estimated from their range (or the MAD
+    past 10 samples) so one outlier cannot hide behind two equal values; None for a single sample."""
+    samples = np.asarray(samples, dtype=np.float64)
+    med = np.median(samples)
+    if len(samples) < 2 or med <= 0:
+        return None
+    if len(samples) <= 10:
+        return float(np.ptp(samples) / _RANGE_SIGMAS[len(samples) - 2] / med)
+    return float(1.4826 * np.median(np.abs(samples - med)) / med)
+
+def time_calls(fn, args, min_calls=1000, min_time=0.5, max_calls=200000, segments=5):
+    """Per-call latency stats of fn(*a) cycling over `args`: at least min_calls calls and min_time seconds.
+    "noise" is the relative spread of each metric across `segments` consecutive slices of the calls."""
+    lat, it, start = [], itertools.cycle(args), time.perf_counter()
+    while len(lat) < max_calls and (len(lat) < min_calls or time.perf_counter() - start < min_time):
+        a = next(it)
+        t0 = time.perf_counter(); fn(*a); lat.append(time.perf_counter() - t0)
+    us = np.array(lat) * 1e6
+    parts = np.array_split(us, segments)
+    noise = {"p50_us": _relative_spread([np.percentile(p, 50) for p in parts]),
+             "p99_us": _relative_spread([np.percentile(p, 99) for p in parts]),
+             "per_s": _relative_spread([p.mean() for p in parts])}
+    return {"calls": len(us), "mean_us": float(us.mean()), "p50_us": float(np.percentile(us, 50)),
+            "p90_us": float(np.percentile(us, 90)), "p99_us": float(np.percentile(us, 99)), "max_us": float(us.max()),
+            "per_s": float(len(us) / (us.sum() / 1e6)), "noise": noise}
+
+def _reset_peak_rss():
+    """Reset the kernel's resident-set high-water mark (Linux); False where that is not supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return False
+
+def _rss_mb(field="VmRSS"):
+    with open("/proc/self/status") as fh:
+        for line in fh:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def time_batch(fn, rows, memory=None, min_runs=5, min_time=1.0, max_runs=50, max_time=30.0):
+    """Median wall time and throughput of fn() over `rows` items: at least min_runs runs and min_time
+    seconds, but no new run once max_time is spent (so very large batches run once or twice).
+    memory="rss" reports the peak resident-set growth of the first timed run; memory="tracemalloc"
+    the peak traced allocations of one extra run, kept out of the timings since tracing skews them."""
+    runs, peak_mb = [], None
+    while not runs or (len(runs) < max_runs and (len(runs) < min_runs or sum(runs) < min_time) and sum(runs) < max_time):
+        rss = memory == "rss" and not runs and _reset_peak_rss() and _rss_mb()
+        t0 = time.perf_counter(); fn(); runs.append(time.perf_counter() - t0)
+        if rss:
+            peak_mb = _rss_mb("VmHWM") - rss
+    elapsed = float(np.median(runs))
+    out = {"rows": rows, "runs": len(runs), "seconds": elapsed, "best_seconds": min(runs),
+           "per_s": rows / max(elapsed, 1e-9), "noise": {"per_s": _relative_spread(runs)}}
+    if peak_mb is not None:
+        out["peak_mb"] = peak_mb
+    elif memory == "tracemalloc":
+        tracemalloc.start()
+        try:
+            fn(); out["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return out
+
+def run_benchmarks(catalog_sizes=(17, 10000, 1000000), batch_sizes=(1, 1000, 100000, 1000000), memory=True, log=print_status,
+                   pipeline_rows=10000):
+    """Headless benchmarks of the planning core. Returns {"meta", "results"}, results keyed
+    "<benchmark>/<parameter>=<size>" with latency percentiles or batch throughput (+ peak memory).
+    The full plan_profiles pipeline is per-row Python, so it runs on at most `pipeline_rows` rows of
+    each batch (None: the whole batch); meta["pipeline_rows"] records the cap."""
+    memory = ("rss" if _reset_peak_rss() else "tracemalloc") if memory else None
+    results = {}
+    def record(name, stats):
+        results[name] = stats
+        log(f"{name}: " + (f"p50 {stats['p50_us']:.1f} us, p99 {stats['p99_us']:.1f} us" if "p50_us" in stats else
+                           f"{stats['per_s']:.0f}/s" + (f", peak {stats['peak_mb']:.1f} MB" if "peak_mb" in stats else "")))
+    profiles = synthetic_profiles(max(batch_sizes + (1000,)))
+    sample = profiles.head(1000).to_dict("records")
+    targets = [calculate_tdee_and_targets(r["sex"], r["weight"], r["height"], r["age"], r["activity"], r["goal"]) for r in sample]
+    macro_args = [(t["TargetCalories"], t["Protein_g"], t["Carbs_g"], t["Fat_g"]) for t in targets]
+    record("targets.scalar", time_calls(calculate_tdee_and_targets,
+                                        [(r["sex"], r["weight"], r["height"], r["age"], r["activity"], r["goal"]) for r in sample]))
+    record("workout_plan", time_calls(generate_workout_plan, [(r["experience"], r["goal"]) for r in sample]))
+    for n in catalog_sizes:
+        t0 = time.perf_counter(); catalog = synthetic_catalog(n)
+        results[f"catalog.build/items={n}"] = {"rows": n, "seconds": time.perf_counter() - t0}
+        for mode in ("greedy", "optimize"):
+            record(f"meal_plan.{mode}/items={n}",
+                   time_calls(lambda c, p, cb, f: generate_meal_plan(c, p, cb, f, catalog=catalog, mode=mode, compact=True), macro_args))
+    plans = [generate_meal_plan(*a, compact=True) for a in macro_args]
+    record("suggestions.single", time_calls(ai_diet_suggestions, list(zip(targets, plans))))
+    if PYARROW_AVAILABLE:
+        importlib.import_module("pyarrow.parquet")  # keep the import out of the first export timing
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in batch_sizes:
+            batch = profiles.head(n)
+            record(f"targets.batch/rows={n}", time_batch(lambda: calculate_targets_batch(batch), n, memory))
+            batch_targets, batch_plans = [targets[i % len(targets)] for i in range(n)], [plans[i % len(plans)] for i in range(n)]
+            record(f"suggestions.batch/plans={n}", time_batch(lambda: DIET_RULESET.suggest(batch_targets, batch_plans), n, memory))
+            for ext in (".csv.gz",) + ((".parquet",) if PYARROW_AVAILABLE else ()):
+                path = os.path.join(tmp, "plans" + ext)
+                record(f"export{ext}/plans={n}", time_batch(lambda: export_plans(enumerate(batch_plans), path), n, memory))
+            m = n if pipeline_rows is None else min(n, pipeline_rows)
+            if m < n:
+                log(f"plan_profiles: sampling {m} of {n} rows")
+            if f"plan_profiles/rows={m}" not in results:
+                rows = batch.head(m).to_dict("records")
+                record(f"plan_profiles/rows={m}", time_batch(lambda: plan_profiles(rows), m, memory))
+    meta = {"format": BENCH_FORMAT_VERSION, "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "machine": platform.machine(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "memory": memory, "pipeline_rows": pipeline_rows}
+    return {"meta": meta, "results": results}
+
+# metric -> (True when higher is better, relative noise floor, absolute noise floor)
+BENCH_METRICS = {"p50_us": (False, 0.0, 0.5), "p99_us": (False, 0.30, 5.0), "per_s": (True, 0.0, 0.0), "peak_mb": (False, 0.10, 2.0)}
+BENCH_NOISE_SIGMAS = 3.0
+
+def compare_benchmarks(current, baseline, threshold=0.10):
+    """Rows (name, metric, baseline, current, relative change, limit) for every metric both runs have;
+    relative change is signed so that positive means worse. A change is a regression only when it
+    exceeds `limit`: the largest of `threshold`, the metric's noise floor and BENCH_NOISE_SIGMAS times
+    the run-to-run spread either run measured, and moves the metric by more than its absolute floor.
+    Peak memory is only compared between runs that measured it the same way. Returns (rows, regressions)."""
+    rows, regressions = [], []
+    same_memory = current.get("meta", {}).get("memory") == baseline.get("meta", {}).get("memory")
+    for name, stats in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for metric, (higher_better, floor, abs_floor) in BENCH_METRICS.items():
+            if metric not in stats or not base.get(metric) or (metric == "peak_mb" and not same_memory):
+                continue
+            change = (stats[metric] - base[metric]) / base[metric]
+            spread = max((s.get("noise") or {}).get(metric) or 0.0 for s in (stats, base))
+            limit = max(threshold, floor, BENCH_NOISE_SIGMAS * spread)
+            row = (name, metric, base[metric], stats[metric], -change if higher_better else change, limit)
+            rows.append(row)
+            if row[4] > limit and abs(stats[metric] - base[metric]) > abs_floor:
+                regressions.append(row)
+    return rows, regressions
+
+def merge_benchmarks(runs):
+    """One result set from several runs of the suite: the median of every numeric stat, with each
+    metric's noise the larger of its spread across runs and its median spread within a run."""
+    meta = dict(runs[0]["meta"], repeat=len(runs))
+    results = {}
+    for name, first in runs[0]["results"].items():
+        stats = [r["results"][name] for r in runs if name in r["results"]]
+        merged = {k: float(np.median([s[k] for s in stats if k in s])) for k, v in first.items()
+                  if isinstance(v, (int, float)) and not isinstance(v, bool)}
+        noise = {}
+        for metric in BENCH_METRICS:
+            if metric in merged:
+                within = [(s.get("noise") or {}).get(metric) for s in stats]
+                within = [x for x in within if x is not None]
+                across = _relative_spread([s[metric] for s in stats if metric in s])
+                noise[metric] = max(across or 0.0, float(np.median(within)) if within else 0.0)
+        results[name] = dict(merged, noise=noise)
+    return {"meta": meta, "results": results}
+
+def run_bench_repeats(args):
+    """Run the suite in args.repeat fresh processes and merge them: timings vary more between
+    processes (memory layout, hash seeds, scheduling) than between runs within one."""
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(args.repeat):
+            print_status(f"Benchmark process {i + 1}/{args.repeat}")
+            out = os.path.join(tmp, f"run{i}.json")
+            cmd = [sys.executable, os.path.abspath(__file__), "bench", "--repeat", "1", "--output", out,
+                   "--pipeline-rows", str(args.pipeline_rows), "--catalog-sizes", *map(str, args.catalog_sizes),
+                   "--batch-sizes", *map(str, args.batch_sizes)] + (["--no-memory"] if args.no_memory else [])
+            subprocess.run(cmd, check=True)
+            with open(out, encoding="utf-8") as fh:
+                runs.append(json.load(fh))
+    return merge_benchmarks(runs)
+
+def run_bench_command(args):
+    if args.repeat > 1:
+        results = run_bench_repeats(args)
+    else:
+        results = run_benchmarks(tuple(args.catalog_sizes), tuple(args.batch_sizes), memory=not args.no_memory,
+                                 pipeline_rows=args.pipeline_rows or None)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=1)
+        print_status(f"Results written to {args.output}")
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    rows, regressions = compare_benchmarks(results, baseline, args.threshold)
+    flagged = {r[:2] for r in regressions}
+    print(f"{'benchmark':<40} {'metric':<8} {'baseline':>12} {'current':>12} {'change':>8} {'limit':>7}")
+    for name, metric, base, cur, change, limit in rows:
+        flag = "  REGRESSION" if (name, metric) in flagged else ""
+        print(f"{name:<40} {metric:<8} {base:>12.1f} {cur:>12.1f} {change:>+8.1%} {limit:>7.0%}{flag}")
+    print_status(f"{len(regressions)} regression(s) against {args.baseline} (threshold {args.threshold:.0%}, widened to each metric's noise)")
+    return 1 if regressions else 0
+
+
+# -------------------------
+# HTTP service
+# -------------------------
+# kind -> result fields returned; None returns the full profile_results() dict
+SERVE_FIELDS = {"targets": ("id", "targets", "error"), "workout": ("id", "workout", "program", "error"),
+                "meal-plan": ("id", "targets", "meals", "error"), "suggestions": ("id", "targets", "suggestions", "error"),
+                "plan": None, "swaps": ("id", "swaps", "error")}
+SERVE_ROUTES = {f"/v1/{kind}": kind for kind in SERVE_FIELDS}
+# kinds answered on the event loop: one vectorized pass or a template lookup, cheaper than a pool round trip
+SERVE_INLINE = ("targets", "workout", "swaps")
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+                422: "Unprocessable Entity", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+def serve_batch(kind, rows, mode="greedy", cache=None):
+    """Answer a micro-batch of requests of one kind: a result dict per profile dict in `rows`."""
+    if kind == "workout":
+        out = []
+        for r in rows:
+            level, goal = r.get("experience") or PROFILE_DEFAULTS["experience"], r.get("goal") or PROFILE_DEFAULTS["goal"]
+            if level not in WORKOUT_TEMPLATES or goal not in GOALS:
+                out.append({"id": r.get("id"), "error": "unknown experience/goal"})
+            elif r.get("weeks") is not None:
+                try:
+                    out.append({"id": r.get("id"), "program": workout_program(level, goal, int(r["weeks"])).to_dict()})
+                except (TypeError, ValueError) as e:
+                    out.append({"id": r.get("id"), "error": str(e)})
+            else:
+                out.append({"id": r.get("id"), "workout": [{"day": d, "exercises": ex} for d, ex in generate_workout_plan(level, goal)]})
+        return out
+    if kind == "swaps":
+        return [_serve_swaps(r) for r in rows]
+    if kind == "targets":
+        df, valid = _profile_frame(rows)
+        targets = iter(calculate_targets_batch(df[valid]).to_dict("records") if valid.any() else [])
+        return [{"id": r.get("id"), "targets": {k: int(v) for k, v in next(targets).items()}} if ok else
+                {"id": r.get("id"), "error": "invalid weight/height/age"} for r, ok in zip(rows, valid)]
+    fields = SERVE_FIELDS[kind]
+    results = profile_results(rows, mode, cache)
+    return results if fields is None else [{k: res[k] for k in fields if k in res} for res in results]
+
+def _serve_swaps(r):
+    """{"foods": [names or ids], "position": i[, "portions", "meal", "targets", "k"]} -> closest swaps for foods[i]."""
+    catalog = get_food_catalog()
+    try:
+        # bool is an int subclass: JSON true/false are not food ids
+        foods = [f if isinstance(f, int) and not isinstance(f, bool) else catalog.find(f) if isinstance(f, str) else None
+                 for f in r.get("foods") or []]
+        if not foods or None in foods or not all(0 <= f < len(catalog) for f in foods):
+            raise ValueError("foods must be catalog names or ids")
+        position = int(r.get("position", 0))
+        if not 0 <= position < len(foods):
+            raise ValueError(f"position must be in 0..{len(foods) - 1}")
+        budget = meal_budget(r["targets"], r.get("meal") or "Lunch") if r.get("targets") else None
+        swaps = meal_swaps(foods, position, r.get("portions"), budget, min(int(r.get("k", 5)), 50), catalog=catalog)
+    except (KeyError, TypeError, ValueError) as e:
+        return {"id": r.get("id"), "error": str(e)}
+    return {"id": r.get("id"), "swaps": swaps}
+
+def _serve_chunk(kind, rows, mode):
+    """serve_batch() in a pool worker, plus the worker's metrics since the last call."""
+    return serve_batch(kind, rows, mode, _batch_cache), METRICS.take() if METRICS.enabled else None
+
+class PlanServer:
+    """JSON-over-HTTP/1.1 front end for targets, meal plans, workouts and suggestions.
+
+    Concurrent requests of the same kind and mode are collected for up to `batch_window_ms` (or
+    `max_batch` requests) and answered by one serve_batch() call, so they share the vectorized
+    target pass and rule evaluation. Plan solving runs in a process pool with at most 2 batches per
+    worker in flight; past `max_pending` unanswered requests, new ones get 503 + Retry-After."""
+    def __init__(self, host="127.0.0.1", port=8080, workers=None, batch_window_ms=2.0, max_batch=256, max_pending=1024,
+                 mode="greedy", catalog_path=None, cache_options=None, max_body=1 << 20):
+        self.host, self.port, self.mode = host, port, mode
+        self.workers = workers or os.cpu_count() or 1
+        self.window, self.max_batch, self.max_pending, self.max_body = batch_window_ms / 1000, max_batch, max_pending, max_body
+        self.catalog_path, self.cache_options = catalog_path, cache_options
+        self.pending = 0; self.rejected = 0; self.batches = 0; self.batched = 0
+        self._open, self._timers, self._tasks = {}, {}, set()
+        self.pool = self.server = self._slots = None
+
+    async def start(self):
+        metrics = {"profile_slowest": METRICS.profile_slowest} if METRICS.enabled else None
+        self.pool = futures.ProcessPoolExecutor(self.workers, initializer=_init_batch_worker,
+                                        initargs=(self.catalog_path, self.cache_options, metrics))
+        self._slots = asyncio.Semaphore(2 * self.workers)
+        # start every worker (imports, catalog) before taking traffic, not on the first requests
+        loop = asyncio.get_running_loop()
+        profile = PROFILE_DEFAULTS | {"weight": 70, "height": 175, "age": 30}
+        await asyncio.gather(*(loop.run_in_executor(self.pool, _serve_chunk, "plan", [profile], self.mode)
+                               for _ in range(self.workers)))
+        # the inline kinds run here: load pandas, the workout tables and the swap index up front too
+        for kind, row in (("targets", profile), ("workout", profile), ("swaps", {"foods": [0]})):
+            serve_batch(kind, [row], self.mode)
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print_status(f"Serving on http://{self.host}:{self.port} ({self.workers} workers, {self.window * 1000:g} ms batch window)")
+
+    async def serve_forever(self):
+        """Serve until SIGINT/SIGTERM, then stop the pool so no worker outlives the server."""
+        await self.start()
+        stop, loop = asyncio.Event(), asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):  # Windows: Ctrl+C still raises KeyboardInterrupt
+                pass
+        try:
+            async with self.server:
+                await stop.wait()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True); self.pool = None
+
+    def stats(self):
+        return {"status": "ok", "pending": self.pending, "rejected": self.rejected, "batches": self.batches,
+                "mean_batch": round(self.batched / self.batches, 2) if self.batches else 0.0}
+
+    # ---------- HTTP ----------
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                parts = lines[0].split(" ")
+                if len(parts) != 3:
+                    await self._respond(writer, 400, {"error": "malformed request line"}, False); break
+                method, target, version = parts
+                headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:] if l)}
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "bad Content-Length"}, False); break
+                if length > self.max_body:
+                    await self._respond(writer, 413, {"error": f"body over {self.max_body} bytes"}, False); break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                status, payload = await self._route(method, target.split("?", 1)[0], body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, ctype = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, ctype = json.dumps(payload, default=str).encode(), "application/json"
+        retry = "Retry-After: 1\r\n" if status == 503 else ""
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+                f"{retry}Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def _route(self, method, path, body):
+        if path in ("/health", "/metrics"):
+            if method != "GET":
+                return 405, {"error": "use GET"}
+            return (200, self.stats()) if path == "/health" else (200, METRICS.to_prometheus())
+        kind = SERVE_ROUTES.get(path)
+        if kind is None:
+            return 404, {"error": f"no route {path}", "routes": sorted(SERVE_ROUTES)}
+        if method != "POST":
+            return 405, {"error": "use POST with a JSON profile"}
+        try:
+            profile = json.loads(body or b"{}")
+        except ValueError as e:
+            return 400, {"error": f"invalid JSON: {e}"}
+        if not isinstance(profile, dict):
+            return 400, {"error": "expected a JSON object"}
+        mode = profile.pop("mode", self.mode)
+        if mode not in ("greedy", "optimize"):
+            return 400, {"error": "mode must be greedy or optimize"}
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return 503, {"error": "server busy, retry later"}
+        self.pending += 1
+        try:
+            with METRICS.timer(f"http.{kind}"):
+                result = await self._submit(kind, mode, profile)
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            self.pending -= 1
+        return (422 if "error" in result else 200), result
+
+    # ---------- micro-batching ----------
+    def _submit(self, kind, mode, profile):
+        loop = asyncio.get_running_loop()
+        fut, key = loop.create_future(), (kind, mode)
+        batch = self._open.setdefault(key, [])
+        batch.append((profile, fut))
+        if len(batch) >= self.max_batch:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return fut
+
+    def _flush(self, key):
+        batch, timer = self._open.pop(key, None), self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        if batch:
+            # the loop only keeps weak references to tasks; hold each one until it finishes
+            task = asyncio.ensure_future(self._run(key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key, batch):
+        kind, mode = key
+        rows = [p for p, _ in batch]
+        self.batches += 1; self.batched += len(rows)
+        try:
+            if kind in SERVE_INLINE:
+                results = serve_batch(kind, rows, mode)
+            else:
+                async with self._slots:
+                    results, metrics = await asyncio.get_running_loop().run_in_executor(self.pool, _serve_chunk, kind, rows, mode)
+                if metrics:
+                    METRICS.merge(metrics)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():
+                fut.set_result(res)
+
+def run_server(host="127.0.0.1", port=8080, **options):
+    server = PlanServer(host, port, **options)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    print_status("Server stopped")
+
+# ---------- load test ----------
+async def _http_request(reader, writer, host, path, body=None):
+    method = "POST" if body is not None else "GET"
+    body = body or b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:] if l)}
+    payload = await reader.readexactly(int(headers.get("content-length", 0)))
+    return int(lines[0].split(" ")[1]), headers, payload
+
+async def _load_test(host, port, path, bodies, concurrency):
+    latencies, statuses, queue = [], Counter(), iter(bodies)
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for body in queue:
+                t0 = time.perf_counter()
+                status, headers, _ = await _http_request(reader, writer, host, path, body)
+                latencies.append(time.perf_counter() - t0); statuses[status] += 1
+                if headers.get("connection") == "close":
+                    writer.close(); reader, writer = await asyncio.open_connection(host, port)
+        finally:
+            writer.close()
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+async def _wait_for_server(host, port, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                if (await _http_request(reader, writer, host, "/health"))[0] == 200:
+                    return
+            finally:
+                writer.close()
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"no server on {host}:{port} after {timeout:.0f}s")
+            await asyncio.sleep(0.2)
+
+def _free_port(host):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+def run_load_test(host="127.0.0.1", port=None, path="/v1/plan", requests=2000, concurrency=32, seed=0, server_args=()):
+    """Closed-loop load test: `concurrency` keep-alive clients post `requests` synthetic profiles to
+    `path`. Without a port a `serve` subprocess is started on a free local port (extra CLI flags in
+    server_args) and stopped afterwards. Returns throughput, latency percentiles (ms) and status counts."""
+    bodies = [json.dumps(r, default=str).encode() for r in synthetic_profiles(requests, seed).to_dict("records")]
+    proc = None
+    if port is None:
+        port = _free_port(host)
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--host", host, "--port", str(port), *server_args])
+    try:
+        asyncio.run(_wait_for_server(host, port))
+        latencies, statuses, elapsed = asyncio.run(_load_test(host, port, path, bodies, concurrency))
+    finally:
+        if proc is not None:
+            proc.terminate(); proc.wait(10)
+    ms = np.array(latencies) * 1000
+    return {"path": path, "requests": len(ms), "concurrency": concurrency, "seconds": elapsed, "per_s": len(ms) / elapsed,
+            "p50_ms": float(np.percentile(ms, 50)), "p90_ms": float(np.percentile(ms, 90)),
+            "p99_ms": float(np.percentile(ms, 99)), "max_ms": float(ms.max()),
+            "status": {str(k): v for k, v in sorted(statuses.items())}}
+
+def run_loadtest_command(args):
+    host, _, port = (args.url or args.host).replace("http://", "").rstrip("/").partition(":")
+    stats = run_load_test(host, int(port) if port else None, args.path, args.requests, args.concurrency, args.seed,
+                          server_args=["--workers", str(args.workers)] if args.workers else ())
+    print(json.dumps(stats, indent=1))
+    failed = sum(v for k, v in stats["status"].items() if k != "200")
+    slow = args.p99_ms is not None and stats["p99_ms"] > args.p99_ms
+    print_status(f"{stats['per_s']:.0f} req/s, p99 {stats['p99_ms']:.1f} ms, {failed} non-200"
+                 + (f" - over the {args.p99_ms:g} ms p99 budget" if slow else ""))
+    return 1 if slow or (args.strict and failed) else 0
 
 
 # -------------------------
 # UI: Splash + App
 # -------------------------
 
+def macro_chart_data(targets, startangle=90.0):
+    """Pie geometry for the macro chart (plain numbers, so it can be computed off the UI thread).
+    Only this geometry comes from the worker: the artists are updated and rasterized on the Tk
+    thread, because the figure belongs to a Tk canvas."""
+    vals = np.array([targets["Protein_g"]*4, targets["Carbs_g"]*4, targets["Fat_g"]*9], dtype=float)
+    total = vals.sum()
+    fracs = vals / total if total > 0 else np.full(3, 1 / 3)
+    bounds = startangle + 360 * np.concatenate([[0], np.cumsum(fracs)])
+    mid = np.deg2rad((bounds[:-1] + bounds[1:]) / 2)
+    return {"values": vals, "fracs": fracs, "theta1": bounds[:-1], "theta2": bounds[1:],
+            "label_xy": np.column_stack([1.1 * np.cos(mid), 1.1 * np.sin(mid)]),
+            "pct_xy": np.column_stack([0.6 * np.cos(mid), 0.6 * np.sin(mid)]),
+            "pct_text": [f"{100 * f:.1f}%" for f in fracs]}
+
+def meal_chart_data(df):
+    if "Day" in df:
+        df = df[df["Day"] == df["Day"].iloc[0]]  # multi-day plans chart their first day
+    return {"names": [str(m) for m in df["Meal"]], "cals": [float(c) for c in df["Calories"]]}
+
+class BlitManager:
+    """Redraws a set of animated artists over a cached background instead of the whole figure
+    (matplotlib's blitting recipe). A full draw (resize, theme change) refreshes the background.
+    Rendering stays on the Tk thread; blitting keeps that cost to the animated artists."""
+    def __init__(self, canvas):
+        self.canvas, self._bg, self._artists = canvas, None, []
+        self._cid = canvas.mpl_connect("draw_event", self._on_draw)
+
+    def add(self, artist):
+        artist.set_animated(True)
+        self._artists.append(artist)
+        return artist
+
+    def disconnect(self):
+        self.canvas.mpl_disconnect(self._cid)
+
+    def _on_draw(self, event):
+        self._bg = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for a in self._artists:
+            self.canvas.figure.draw_artist(a)
+
+    def update(self):
+        if self._bg is None:
+            self.canvas.draw_idle(); return
+        self.canvas.restore_region(self._bg)
+        self._draw_animated()
+        self.canvas.blit(self.canvas.figure.bbox)
+
+
+class VirtualTreeview:
+    """Treeview over a long row list that only materializes the visible window.
+    Rows are (key, values) pairs; rendering diffs the window by key, so unchanged rows are not
+    touched, changed rows are updated in place and only new keys are inserted."""
+    def __init__(self, parent, columns, height=6):
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings", height=height, selectmode="browse")
+        self.vsb = ttk.Scrollbar(self.frame, orient="vertical", command=self._on_scroll)
+        self.tree.pack(side="left", fill="x", expand=True)
+        self.vsb.pack(side="right", fill="y")
+        self.height, self.rows, self.top = height, [], 0
+        self._shown = {}  # iid -> values currently in the widget
+        self._iid_keys = {}
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(seq, self._on_wheel)
+
+    def pack(self, **kw):
+        self.frame.pack(**kw)
+
+    @METRICS.timed("ui.table")
+    def set_rows(self, rows):
+        self.rows, seen = [], {}
+        for key, values in rows:
+            if key in seen:  # keep keys unique so each row maps to one item id
+                seen[key] += 1; key = (key, seen[key])
+            else:
+                seen[key] = 0
+            self.rows.append((key, tuple(values)))
+        self.top = max(0, min(self.top, len(self.rows) - self.height))
+        self._render()
+
+    def selected_key(self):
+        sel = self.tree.selection()
+        return self._iid_keys.get(sel[0]) if sel else None
+
+    def _render(self):
+        window = self.rows[self.top:self.top + self.height]
+        wanted = {str(key): (key, values) for key, values in window}
+        for iid in [i for i in self._shown if i not in wanted]:
+            self.tree.delete(iid); del self._shown[iid]; self._iid_keys.pop(iid, None)
+        for pos, (iid, (key, values)) in enumerate(wanted.items()):
+            if iid not in self._shown:
+                self.tree.insert("", pos, iid=iid, values=values)
+            else:
+                if self._shown[iid] != values:
+                    self.tree.item(iid, values=values)
+                if self.tree.index(iid) != pos:
+                    self.tree.move(iid, "", pos)
+            self._shown[iid] = values; self._iid_keys[iid] = key
+        n = max(len(self.rows), 1)
+        self.vsb.set(self.top / n, min(1.0, (self.top + self.height) / n))
+
+    def _scroll_to(self, top):
+        top = max(0, min(int(top), len(self.rows) - self.height))
+        if top != self.top:
+            self.top = top; self._render()
+
+    def _on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(amount) * len(self.rows))
+        else:
+            self._scroll_to(self.top + int(amount) * (self.height if unit == "pages" else 1))
+
+    def _on_wheel(self, event):
+        step = -1 if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0 else 1
+        self._scroll_to(self.top + 3 * step)
+        return "break"
+
+
+def set_text(widget, text):
+    """Replace a Text widget's content with one insert, skipping the work if it is unchanged."""
+    if widget.get("1.0", "end-1c") == text:
+        return
+    widget.delete("1.0", tk.END)
+    widget.insert("1.0", text)
+
+
+class LatestOnlyExecutor:
+    """One long-lived background thread for UI work. Each job kind keeps only its newest request:
+    submitting again cancels the pending one, and results of superseded jobs are dropped.
+
+    The worker never touches Tk: finished jobs go on a queue that the Tk thread polls (every
+    `poll_ms` while jobs are outstanding), so nothing is scheduled on a root that is shut down
+    or destroyed."""
+    def __init__(self, root, poll_ms=20):
+        self.root, self.poll_ms = root, poll_ms
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smartfit-ui")
+        self._latest = {}  # kind -> (seq, future)
+        self._seq = itertools.count(1)
+        self._finished = queue.SimpleQueue()
+        self._poll_id, self._closed = None, False
+
+    def submit(self, kind, fn, on_done, on_error=None):
+        if self._closed:
+            raise RuntimeError("executor is shut down")
+        self.cancel(kind)
+        seq = next(self._seq)
+        future = self._pool.submit(fn)
+        self._latest[kind] = (seq, future)
+        future.add_done_callback(lambda f: f.cancelled() or self._finished.put((kind, seq, f, on_done, on_error)))
+        if self._poll_id is None:
+            self._poll_id = self.root.after(self.poll_ms, self._poll)
+        return future
+
+    def _poll(self):
+        self._poll_id = None
+        if self._closed:
+            return
+        while True:
+            try:
+                item = self._finished.get_nowait()
+            except queue.Empty:
+                break
+            self._deliver(*item)
+        if self._latest and not self._closed:
+            self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    def cancel(self, kind):
+        """Cancel a pending job of `kind`; a running one finishes but its result is discarded."""
+        seq, future = self._latest.pop(kind, (None, None))
+        if future is not None:
+            future.cancel()
+
+    def _deliver(self, kind, seq, future, on_done, on_error):
+        if self._closed or self._latest.get(kind, (None,))[0] != seq:
+            return  # shut down, superseded or cancelled
+        del self._latest[kind]
+        err = future.exception()
+        if err is None:
+            on_done(future.result())
+        elif on_error is not None:
+            on_error(err)
+
+    def shutdown(self):
+        self._closed = True
+        self._latest.clear()
+        if self._poll_id is not None:
+            try:
+                self.root.after_cancel(self._poll_id)
+            except tk.TclError:  # root already destroyed
+                pass
+            self._poll_id = None
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
 class SplashScreen:
-    """3-second gradient teal splash with progress animation"""
-    def __init__(self, master, duration_ms=3000, on_finish=None):
+    """Gradient teal splash; progress follows real startup stages (set_stage) and it closes
+    when finish() is called, i.e. when the app is actually ready."""
+    def __init__(self, master, on_finish=None):
         self.on_finish = on_finish
-        self.duration = max(1000, int(duration_ms))
+        self._target, self._done = 0.0, False
         self.win = tk.Toplevel(master)
         self.win.overrideredirect(True)
         sw, sh = self.win.winfo_screenwidth(), self.win.winfo_screenheight()
@@ -232,33 +3114,175 @@ class SplashScreen:
         self.status.place(relx=0.5, rely=0.86, anchor="n")
 
     def start(self):
-        steps = 100; delay = max(5, int(self.duration / steps))
-        def step(i=0):
-            if i > steps:
-                self.win.after(200, self.finish); return
-            frac = i / steps
-            self.progress["value"] = frac * 100
-            self.status.config(text=[
-                "Loading SmartFit...", "Preparing dashboard...", "Generating personalized plans...", "Finalizing..."
-            ][min(int(frac * 4), 3)])
-            self.win.update_idletasks()
-            self.win.after(delay, lambda: step(i + 1))
-        step(0)
+        def step():
+            if self._done:
+                return
+            cur = self.progress["value"]
+            # ease toward the current stage, creeping a little so the bar never looks stalled
+            self.progress["value"] = min(99.0, cur + max(0.15, (self._target * 100 - cur) * 0.2))
+            self.win.after(16, step)
+        step()
+
+    def set_stage(self, frac, text):
+        if self._done:
+            return
+        self._target = frac
+        self.status.config(text=text)
+        self.win.update_idletasks()
 
     def finish(self):
+        if self._done:
+            return
+        self._done = True
         try: self.win.destroy()
         except: pass
         if callable(self.on_finish): self.on_finish()
 
 
+class WhatIfPanel:
+    """Targets across weight x activity x goal for the sidebar profile. The whole grid comes from one
+    target_sweep() call on open/refresh; dragging the weight slider only re-indexes it (heatmap
+    set_data, or the line chart's cursor) followed by draw_idle, so it keeps up with the mouse."""
+    WEIGHTS = np.arange(60.0, 100.5, 0.5)
+
+    def __init__(self, app):
+        self.app, p = app, app.palette
+        self.win = tk.Toplevel(app.root)
+        self.win.title("SmartFit - What-if Explorer")
+        self.win.geometry("980x680")
+        self.win.configure(bg=p["bg"])
+        self.sweep = self.image = self.cursor = None
+        self.cell_text = []
+
+        controls = ttk.Frame(self.win)
+        controls.pack(fill="x", padx=12, pady=(12, 4))
+        ttk.Label(controls, text="Show:", foreground=p["muted"]).pack(side="left")
+        self.metric_var = tk.StringVar(value="TargetCalories")
+        self.metric_box = ttk.Combobox(controls, textvariable=self.metric_var, values=TARGET_COLUMNS, state="readonly", width=16)
+        self.metric_box.pack(side="left", padx=(4, 12))
+        self.view_var = tk.StringVar(value="heatmap")
+        for text, value in (("Heatmap", "heatmap"), ("Lines", "lines")):
+            ttk.Radiobutton(controls, text=text, variable=self.view_var, value=value, command=self._draw).pack(side="left")
+        ttk.Label(controls, text="Goal (lines):", foreground=p["muted"]).pack(side="left", padx=(12, 0))
+        self.goal_var = tk.StringVar(value=app.vars["goal"].get())
+        goal_box = ttk.Combobox(controls, textvariable=self.goal_var, values=GOALS, state="readonly", width=22)
+        goal_box.pack(side="left", padx=4)
+        self.feasible_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls, text="Score meal-plan feasibility", variable=self.feasible_var, command=self.refresh).pack(side="left", padx=12)
+        ttk.Button(controls, text="Refresh from profile", command=self.refresh).pack(side="right")
+        self.metric_box.bind("<<ComboboxSelected>>", lambda e: self._draw())
+        goal_box.bind("<<ComboboxSelected>>", lambda e: self._draw())
+
+        slider_row = ttk.Frame(self.win)
+        slider_row.pack(fill="x", padx=12, pady=4)
+        ttk.Label(slider_row, text="Weight:", foreground=p["muted"]).pack(side="left")
+        try:
+            weight = float(app.vars["weight"].get() or 70.0)
+        except (tk.TclError, TypeError, ValueError):  # the sidebar entry may hold text that is not a number yet
+            weight = 70.0
+        self.weight_var = tk.DoubleVar(value=min(max(weight, 60.0), 100.0) if math.isfinite(weight) else 70.0)
+        ttk.Scale(slider_row, from_=self.WEIGHTS[0], to=self.WEIGHTS[-1], variable=self.weight_var, command=self._on_slide).pack(side="left", fill="x", expand=True, padx=8)
+        self.weight_label = ttk.Label(slider_row, text="", width=10)
+        self.weight_label.pack(side="right")
+
+        self.canvas = None
+        if not MATPLOTLIB_AVAILABLE:
+            ttk.Label(self.win, text="Charts disabled (matplotlib not found)", foreground=p["muted"]).pack(pady=20)
+            return
+        self.fig = Figure(figsize=(9, 5.5), dpi=100, facecolor=p["card"])
+        self.canvas = FigureCanvasTkAgg(self.fig, self.win)
+        self.canvas.get_tk_widget().pack(fill="both", expand=True, padx=12, pady=12)
+        self.refresh()
+
+    def refresh(self):
+        """Recompute the grid for the current sidebar profile (one broadcasted evaluation)."""
+        try:
+            v = self.app.vars
+            sex, height, age = v["sex"].get(), float(v["height"].get()), int(v["age"].get())
+        except Exception as e:
+            messagebox.showerror("Input Error", f"Invalid input: {e}", parent=self.win); return
+        self.sweep = target_sweep(sex, height, age, weights=self.WEIGHTS, feasibility=self.feasible_var.get())
+        metrics = TARGET_COLUMNS + (["PlanError"] if self.sweep.plan_error is not None else [])
+        self.metric_box.configure(values=metrics)
+        if self.metric_var.get() not in metrics:
+            self.metric_var.set("TargetCalories")
+        self._draw()
+
+    def _index(self):
+        return int(np.abs(self.WEIGHTS - self.weight_var.get()).argmin())
+
+    def _cell_label(self, value, i, j, k):
+        text = f"{value:.2f}" if self.metric_var.get() == "PlanError" else f"{int(value)}"
+        if self.sweep.feasible is not None and not self.sweep.feasible[i, j, k]:
+            text += " \u2717"
+        return text
+
+    def _draw(self):
+        """Rebuild the chart for the current metric/view; slider moves then only update its data."""
+        if self.canvas is None or self.sweep is None:
+            return
+        p, sweep, values = self.app.palette, self.sweep, self.sweep[self.metric_var.get()]
+        self.fig.clf()
+        ax = self.fig.add_subplot(111, facecolor=p["card"])
+        ax.tick_params(colors=p["text"])
+        acts = [a.split(" (")[0] for a in sweep.activities]
+        i = self._index()
+        self.image = self.cursor = None; self.cell_text = []
+        if self.view_var.get() == "heatmap":
+            # one colour scale over all weights, so colours stay comparable while dragging
+            self.image = ax.imshow(values[i], aspect="auto", cmap="viridis", vmin=float(values.min()), vmax=float(values.max()))
+            ax.set_xticks(range(len(sweep.goals)), [g.split(" (")[0] for g in sweep.goals])
+            ax.set_yticks(range(len(acts)), acts)
+            self.cell_text = [[ax.text(k, j, self._cell_label(values[i, j, k], i, j, k), ha="center", va="center", color="white", fontsize=9)
+                               for k in range(len(sweep.goals))] for j in range(len(acts))]
+            self.fig.colorbar(self.image, ax=ax)
+        else:
+            k = sweep.goals.index(self.goal_var.get()) if self.goal_var.get() in sweep.goals else 0
+            for j, act in enumerate(acts):
+                ax.plot(sweep.weights, values[:, j, k], label=act)
+            self.cursor = ax.axvline(self.WEIGHTS[i], color=p["warning"], linestyle="--")
+            ax.set_xlabel("Weight (kg)", color=p["text"]); ax.set_ylabel(self.metric_var.get(), color=p["text"])
+            ax.legend(fontsize=8)
+        ax.set_title(f"{self.metric_var.get()} by activity and goal", color=p["text"])
+        self.fig.tight_layout()
+        self._on_slide()
+
+    def _on_slide(self, _value=None):
+        if self.sweep is None:
+            return
+        i = self._index()
+        self.weight_label.config(text=f"{self.WEIGHTS[i]:g} kg")
+        if self.canvas is None:
+            return
+        values = self.sweep[self.metric_var.get()]
+        if self.image is not None:
+            self.image.set_data(values[i])
+            for j, row in enumerate(self.cell_text):
+                for k, txt in enumerate(row):
+                    txt.set_text(self._cell_label(values[i, j, k], i, j, k))
+        elif self.cursor is not None:
+            self.cursor.set_xdata([self.WEIGHTS[i]] * 2)
+        self.canvas.draw_idle()
+
+
 class SmartFitApp:
     def __init__(self, root):
+        load_ui_libraries()
         self.root = root
         self.root.title("SmartFit")
         self.root.geometry("1400x900")
-        try: self.root.state("zoomed")
-        except: pass
+        if self.root.state() != "withdrawn":
+            self._maximize()
         self.last_plan_df = self.last_targets = None
+        self._plan_callbacks = []
+        self.jobs = LatestOnlyExecutor(self.root)
+        self.plan_cache = PlanCache(path=os.path.join(SMARTFIT_HOME, "plan_cache.json"))
+        try:
+            self.history = PlanStore()
+        except Exception as e:
+            self.history = None
+            print_status(f"Plan history disabled: {e}")
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         # Professional, modern color palettes (default: dark)
         self.PALETTES = {
@@ -298,6 +3322,18 @@ class SmartFitApp:
         self._build_ui()
         self._apply_palette()
 
+    def _maximize(self):
+        try: self.root.state("zoomed")
+        except: pass
+
+    def show(self):
+        self.root.deiconify()
+        self._maximize()
+
+    def when_plan_displayed(self, callback):
+        """Run `callback` once, right after the next plan has been displayed."""
+        self._plan_callbacks.append(callback)
+
     def _setup_style(self):
         if USE_TTB:
             base_theme = "cyborg" if self.palette_key == "dark" else "cosmo"
@@ -381,6 +3417,14 @@ class SmartFitApp:
         btn_card = ttk.Frame(self.sidebar, style="Card.TFrame")
         btn_card.pack(fill="x", pady=(0, 12), padx=12)
 
+        self.optimize_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(btn_card, text="Match macro targets", variable=self.optimize_var).pack(anchor="w", pady=(12, 0), padx=16)
+        days_row = ttk.Frame(btn_card)
+        days_row.pack(fill="x", pady=(6, 0), padx=16)
+        ttk.Label(days_row, text="Plan days:", foreground=self.palette["muted"]).pack(side="left")
+        self.days_var = tk.StringVar(value="1")
+        ttk.Combobox(days_row, textvariable=self.days_var, values=["1", "7", "14", "28"], state="readonly", width=6).pack(side="right")
+
         self.gen_nut_btn = ttk.Button(btn_card, text="Generate Nutrition Plan", style="success.TButton", command=self.on_generate)
         self.gen_nut_btn.pack(fill="x", pady=(12, 6), padx=16)
 
@@ -388,19 +3432,24 @@ class SmartFitApp:
         self.gen_wkt_btn.pack(fill="x", pady=(0, 6), padx=16)
 
         self.export_btn = ttk.Button(btn_card, text="Export Plan to CSV", style="warning.TButton", command=self.export_plan)
-        self.export_btn.pack(fill="x", pady=(0, 12), padx=16)
+        self.export_btn.pack(fill="x", pady=(0, 6), padx=16)
+
+        self.whatif_btn = ttk.Button(btn_card, text="What-if Explorer", style="secondary.TButton", command=lambda: WhatIfPanel(self))
+        self.whatif_btn.pack(fill="x", pady=(0, 12), padx=16)
 
         # Stats Card
         stats_card = ttk.Labelframe(self.sidebar, text="Quick Stats", style="Card.TLabelframe")
         stats_card.pack(fill="x", pady=(0, 12), padx=12, ipadx=12, ipady=8)
 
         self.stat_labels = {}
-        for key, text in [("BMR", "BMR"), ("TDEE", "TDEE"), ("TargetCalories", "Target Calories")]:
+        for key, text in [("BMR", "BMR"), ("TDEE", "TDEE"), ("TargetCalories", "Target Calories"), ("Latency", "Response Time")]:
             frame = ttk.Frame(stats_card)
             frame.pack(fill="x", padx=12, pady=4)
             ttk.Label(frame, text=text + ":", foreground=self.palette["muted"], width=14).pack(side="left")
             self.stat_labels[key] = ttk.Label(frame, text="—", font=("Segoe UI", 10, "bold"), foreground=self.palette["accent"])
             self.stat_labels[key].pack(side="right")
+        self.latency_note = ttk.Label(stats_card, text="", font=("Segoe UI", 8), foreground=self.palette["muted"])
+        self.latency_note.pack(anchor="w", padx=12, pady=(0, 4))
 
         # Theme Toggle (with icon-like style)
         theme_frame = ttk.Frame(self.sidebar)
@@ -433,6 +3482,7 @@ class SmartFitApp:
         macro_card = ttk.Labelframe(chart_row, text="Macronutrient Split", style="Card.TLabelframe")
         macro_card.pack(side="left", fill="both", expand=True, padx=(0, 6))
         self.macro_canvas = None
+        self._macro_artists = self._meal_artists = self._meal_blit = None
         if MATPLOTLIB_AVAILABLE:
             self.fig_macro = Figure(figsize=(5, 4), dpi=100, facecolor=self.palette["card"])
             self.ax_macro = self.fig_macro.add_subplot(111)
@@ -454,11 +3504,13 @@ class SmartFitApp:
         table_card = ttk.Labelframe(self.content_frame, text="Detailed Meal Plan", style="Card.TLabelframe")
         table_card.pack(fill="x", pady=(0, 12), padx=12, ipadx=12, ipady=8)
         cols = ("Meal", "Calories", "Protein_g", "Carbs_g", "Fat_g")
-        self.tree = ttk.Treeview(table_card, columns=cols, show="headings", height=6)
+        self.meal_table = VirtualTreeview(table_card, cols, height=6)
+        self.tree = self.meal_table.tree
         for c in cols:
             self.tree.heading(c, text=c)
             self.tree.column(c, anchor="center", width=130)
-        self.tree.pack(fill="x", padx=12, pady=8)
+        self.meal_table.pack(fill="x", padx=12, pady=8)
+        self.tree.bind("<Button-3>", self._show_swap_menu)
 
         # Workout Card
         workout_card = ttk.Labelframe(self.content_frame, text="Weekly Workout Plan", style="Card.TLabelframe")
@@ -481,6 +3533,7 @@ class SmartFitApp:
         for txt in [self.results_text, self.workout_text, self.suggestions_text]:
             txt.configure(bg=p["card"], fg=p["text"], insertbackground=p["text"])
         self._setup_style()  # Reapply style with new palette
+        self._recolor_charts()
 
     def _toggle_theme(self):
         self.palette_key = "light" if self.theme_var.get() else "dark"
@@ -488,105 +3541,394 @@ class SmartFitApp:
         self._apply_palette()
 
     # ---------- Actions ----------
-    def _display_plan(self, df, targets):
+    def _display_plan(self, df, targets, charts=None):
         self.last_plan_df, self.last_targets = df, targets
         for key in ["BMR", "TDEE", "TargetCalories"]:
             self.stat_labels[key].config(text=targets.get(key, "—"))
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
         header = f"Nutrition Plan — {now}\nTarget: {targets['TargetCalories']} kcal | Protein: {targets['Protein_g']}g | Carbs: {targets['Carbs_g']}g | Fat: {targets['Fat_g']}g\n\n"
-        self.results_text.delete("1.0", tk.END); self.results_text.insert(tk.END, header)
-        for i in self.tree.get_children(): self.tree.delete(i)
-        for _, r in df.iterrows():
-            self.tree.insert("", tk.END, values=(r["Meal"], r["Calories"], r["Protein_g"], r["Carbs_g"], r["Fat_g"]))
+        set_text(self.results_text, header)
+        multi_day = "Day" in df and df["Day"].nunique() > 1
+        self.meal_table.set_rows(((r.get("Day", 1), r["Meal"]), (f"Day {r['Day']} - {r['Meal']}" if multi_day else r["Meal"], r["Calories"], r["Protein_g"], r["Carbs_g"], r["Fat_g"]))
+                                 for r in df.to_dict("records"))
         if MATPLOTLIB_AVAILABLE:
-            self._draw_macro_chart(targets)
-            self._draw_meal_chart(df)
+            charts = charts or {}
+            self._draw_macro_chart(targets, charts.get("macro"))
+            self._draw_meal_chart(df, charts.get("meal"))
         tips = ai_diet_suggestions(targets, df)
-        self.suggestions_text.delete("1.0", tk.END)
-        self.suggestions_text.insert(tk.END, "\n".join(f"• {t}" for t in tips))
-
-    def _draw_macro_chart(self, targets):
-        self.fig_macro.clf(); ax = self.fig_macro.add_subplot(111)
-        vals = [targets["Protein_g"]*4, targets["Carbs_g"]*4, targets["Fat_g"]*9]
-        labels = ["Protein", "Carbs", "Fat"]
-        colors = [self.palette["accent"], self.palette["accent2"], self.palette["success"]]
-        ax.pie(vals, labels=labels, autopct="%1.1f%%", startangle=90, colors=colors, wedgeprops=dict(edgecolor=self.palette["card"]))
-        ax.set_title("Macronutrient Distribution", color=self.palette["text"], fontsize=12)
-        self.fig_macro.set_facecolor(self.palette["card"])
-        self.macro_canvas.draw()
-
-    def _draw_meal_chart(self, df):
-        self.fig_meal.clf(); ax = self.fig_meal.add_subplot(111)
-        names, cals = df["Meal"].tolist(), df["Calories"].tolist()
-        colors = [self.palette["accent"] if i % 2 == 0 else self.palette["accent2"] for i in range(len(names))]
-        bars = ax.bar(names, cals, color=colors)
-        ax.set_title("Calories per Meal", color=self.palette["text"], fontsize=12)
-        ax.set_ylabel("Calories", color=self.palette["text"])
-        for b in bars:
-            h = b.get_height()
-            ax.annotate(f"{int(h)}", xy=(b.get_x() + b.get_width()/2, h), xytext=(0, 4), textcoords="offset points", ha="center", color=self.palette["muted"])
-        self.fig_meal.set_facecolor(self.palette["card"])
-        self.meal_canvas.draw()
+        set_text(self.suggestions_text, "\n".join(f"• {t}" for t in tips))
+        callbacks, self._plan_callbacks = self._plan_callbacks, []
+        for cb in callbacks:
+            cb()
+
+    def _show_swap_menu(self, event):
+        """Right-click on a meal row: a submenu per item listing its closest swaps within the meal's budget."""
+        iid = self.tree.identify_row(event.y)
+        if not iid or self.last_plan_df is None:
+            return
+        self.tree.selection_set(iid)
+        key = self.meal_table.selected_key()
+        row = next(i for i, (k, _) in enumerate(self.meal_table.rows) if k == key)
+        plan = CompactPlan.from_frame(self.last_plan_df)
+        menu = tk.Menu(self.tree, tearoff=0)
+        for pos, item in enumerate(self.last_plan_df["Items"].iloc[row]):
+            sub = tk.Menu(menu, tearoff=0)
+            for alt in swap_alternatives(plan, row, pos, self.last_targets):
+                sub.add_command(label=f"{format_plan_item(alt)} - {alt['cal']:g} kcal",
+                                command=lambda pos=pos, food=alt["id"]: self._swap_item(plan, row, pos, food))
+            if sub.index("end") is None:
+                sub.add_command(label="No swap within this meal's budget", state="disabled")
+            menu.add_cascade(label=f"Swap {format_plan_item(item)}", menu=sub)
+        try:
+            menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            menu.grab_release()
+
+    def _swap_item(self, plan, row, position, food_id):
+        self._display_plan(plan.replace_item(row, position, food_id).to_frame(), self.last_targets)
+
+    @METRICS.timed("ui.chart.macro")
+    def _draw_macro_chart(self, targets, data=None):
+        """Create the pie once; later plans only move wedge angles and relabel (blitted)."""
+        data = data or macro_chart_data(targets)
+        if self._macro_artists is None:
+            ax = self.ax_macro
+            wedges, texts, autotexts = ax.pie(data["values"], labels=["Protein", "Carbs", "Fat"], autopct="%1.1f%%", startangle=90,
+                                              colors=self._macro_colors(), wedgeprops=dict(edgecolor=self.palette["card"]))
+            self._macro_title = ax.set_title("Macronutrient Distribution", color=self.palette["text"], fontsize=12)
+            self._macro_blit = BlitManager(self.macro_canvas)
+            for a in (*wedges, *texts, *autotexts):
+                self._macro_blit.add(a)
+            self._macro_artists = (wedges, texts, autotexts)
+            self.fig_macro.set_facecolor(self.palette["card"])
+            self.macro_canvas.draw_idle()
+            return
+        wedges, texts, autotexts = self._macro_artists
+        for i, w in enumerate(wedges):
+            w.set_theta1(data["theta1"][i]); w.set_theta2(data["theta2"][i])
+            x, y = data["label_xy"][i]
+            texts[i].set_position((x, y)); texts[i].set_ha("left" if x > 0 else "right")
+            autotexts[i].set_position(tuple(data["pct_xy"][i])); autotexts[i].set_text(data["pct_text"][i])
+        self._macro_blit.update()
+
+    @METRICS.timed("ui.chart.meal")
+    def _draw_meal_chart(self, df, data=None):
+        """Reuse bars and labels while the meals are the same; rebuild only when they change."""
+        data = data or meal_chart_data(df)
+        names, cals = data["names"], data["cals"]
+        ax = self.ax_meal
+        top = max(cals, default=0) * 1.15 or 1
+        if self._meal_artists is None or self._meal_artists[0] != names:
+            ax.cla()
+            if self._meal_blit is not None:
+                self._meal_blit.disconnect()
+            self._meal_blit = BlitManager(self.meal_canvas)
+            bars = ax.bar(names, cals, color=self._meal_colors(len(names)))
+            self._meal_title = ax.set_title("Calories per Meal", color=self.palette["text"], fontsize=12)
+            ax.set_ylabel("Calories", color=self.palette["text"])
+            notes = [ax.annotate(f"{int(h)}", xy=(b.get_x() + b.get_width()/2, h), xytext=(0, 4), textcoords="offset points", ha="center", color=self.palette["muted"])
+                     for b, h in zip(bars, cals)]
+            for a in (*bars, *notes):
+                self._meal_blit.add(a)
+            self._meal_artists = (names, list(bars), notes)
+            ax.set_ylim(0, top)
+            self.fig_meal.set_facecolor(self.palette["card"])
+            self.meal_canvas.draw_idle()
+            return
+        _, bars, notes = self._meal_artists
+        for b, n, h in zip(bars, notes, cals):
+            b.set_height(h)
+            n.xy = (b.get_x() + b.get_width()/2, h); n.set_text(f"{int(h)}")
+        lo, hi = ax.get_ylim()
+        if top > hi or top < 0.6 * hi:
+            ax.set_ylim(0, top)  # axis ticks change: needs a full (idle) draw
+            self.meal_canvas.draw_idle()
+        else:
+            self._meal_blit.update()
+
+    def _macro_colors(self):
+        return [self.palette["accent"], self.palette["accent2"], self.palette["success"]]
+
+    def _meal_colors(self, n):
+        return [self.palette["accent"] if i % 2 == 0 else self.palette["accent2"] for i in range(n)]
+
+    def _recolor_charts(self):
+        """Theme toggle: restyle the existing artists instead of rebuilding the charts."""
+        if not MATPLOTLIB_AVAILABLE:
+            return
+        p = self.palette
+        if self._macro_artists is not None:
+            wedges, texts, _ = self._macro_artists
+            for w, c in zip(wedges, self._macro_colors()):
+                w.set_facecolor(c); w.set_edgecolor(p["card"])
+            for t in texts:
+                t.set_color(p["text"])
+            self._macro_title.set_color(p["text"])
+            self.fig_macro.set_facecolor(p["card"])
+            self.macro_canvas.draw_idle()
+        if self._meal_artists is not None:
+            _, bars, notes = self._meal_artists
+            for b, c in zip(bars, self._meal_colors(len(bars))):
+                b.set_color(c)
+            for n in notes:
+                n.set_color(p["muted"])
+            self._meal_title.set_color(p["text"]); self.ax_meal.yaxis.label.set_color(p["text"])
+            self.fig_meal.set_facecolor(p["card"])
+            self.meal_canvas.draw_idle()
+
+    def _show_latency(self, what, clicked):
+        ms = (time.perf_counter() - clicked) * 1000
+        self.stat_labels["Latency"].config(text=f"{ms:.0f} ms")
+        self.latency_note.config(text=f"{what} shown {ms:.1f} ms after request")
+
+    def _show_error(self, err):
+        messagebox.showerror("Generation Error", f"Could not generate plan: {err}")
 
     def on_generate(self):
-        def worker():
-            try:
+        clicked = time.perf_counter()
+        try:
+            with METRICS.timer("inputs.parse"):
                 sex = self.vars["sex"].get(); weight = float(self.vars["weight"].get())
                 height = float(self.vars["height"].get()); age = int(self.vars["age"].get())
                 activity = self.vars["activity"].get(); goal = self.vars["goal"].get()
-            except Exception as e:
-                messagebox.showerror("Input Error", f"Invalid input: {e}"); return
-            time.sleep(0.5)
-            targets = calculate_tdee_and_targets(sex, weight, height, age, activity, goal)
-            df = generate_meal_plan(targets["TargetCalories"], targets["Protein_g"], targets["Carbs_g"], targets["Fat_g"])
-            self.root.after(0, lambda: self._display_plan(df, targets))
-        threading.Thread(target=worker, daemon=True).start()
+                mode = "optimize" if self.optimize_var.get() else "greedy"
+                exp = self.vars["exp"].get(); days = int(self.days_var.get())
+        except Exception as e:
+            messagebox.showerror("Input Error", f"Invalid input: {e}"); return
+        def done(entry):
+            self._display_plan(entry["plan"], entry["targets"], entry["charts"])
+            self._show_latency("Nutrition plan", clicked)
+            if entry["relaxed"]:
+                listed = ", ".join(f"day {d} {meal}" for d, meal in entry["relaxed"][:8]) + (", ..." if len(entry["relaxed"]) > 8 else "")
+                messagebox.showwarning("Variety rules relaxed", f"Not enough foods to avoid repeats for: {listed}. These meals may repeat foods.")
+        def job():
+            entry = self.plan_cache.plan(sex, age, weight, height, activity, goal, exp, mode)
+            relaxed = []
+            if days > 1:
+                multi = MultiDayPlan(entry["targets"], days=days, mode=mode)
+                plan, relaxed = multi.to_compact(), multi.relaxed_meals()
+            else:
+                plan = entry["plan"]
+            if self.history is not None:
+                try:
+                    profile = {"sex": sex, "age": age, "weight": weight, "height": height, "activity": activity, "goal": goal, "experience": exp}
+                    self.history.add_plan(LOCAL_MEMBER, profile, entry["targets"], plan, mode=mode)
+                except Exception as e:
+                    print_status(f"Could not save plan to history: {e}")
+            entry = {**entry, "plan": plan.to_frame(), "relaxed": relaxed}
+            # chart geometry is prepared here, off the Tk thread
+            return {**entry, "charts": {"macro": macro_chart_data(entry["targets"]), "meal": meal_chart_data(entry["plan"])}}
+        self.jobs.submit("nutrition", job, done, self._show_error)
 
     def on_generate_workout(self):
-        def worker():
-            level = self.vars["exp"].get(); goal = self.vars["goal"].get()
-            time.sleep(0.3)
-            plan = generate_workout_plan(level, goal)
-            self.root.after(0, lambda: self._show_workout(plan))
-        threading.Thread(target=worker, daemon=True).start()
+        clicked = time.perf_counter()
+        level = self.vars["exp"].get(); goal = self.vars["goal"].get()
+        def done(plan):
+            self._show_workout(plan)
+            self._show_latency("Workout plan", clicked)
+        self.jobs.submit("workout", lambda: generate_workout_plan(level, goal), done, self._show_error)
 
     def _show_workout(self, plan):
-        self.workout_text.delete("1.0", tk.END)
-        for day, exs in plan:
-            self.workout_text.insert(tk.END, f"{day}:\n")
-            for e in exs:
-                self.workout_text.insert(tk.END, f"  - {e}\n")
-            self.workout_text.insert(tk.END, "\n")
+        set_text(self.workout_text, "".join(f"{day}:\n" + "".join(f"  - {e}\n" for e in exs) + "\n" for day, exs in plan))
+
+    def on_close(self):
+        self.jobs.shutdown()
+        try:
+            self.plan_cache.save()
+            print_status(f"Plan cache saved ({self.plan_cache.stats()})")
+        except Exception as e:
+            print_status(f"Could not save plan cache: {e}")
+        if self.history is not None:
+            self.history.close()
+        self.root.destroy()
 
     def export_plan(self):
-        if not self.last_plan_df or not self.last_targets:
+        if self.last_plan_df is None or not self.last_targets:
             messagebox.showinfo("No Plan", "Generate a plan first."); return
-        rows = []
-        for _, r in self.last_plan_df.iterrows():
-            items_str = "; ".join(f"{it['name']} ({it['serving']})" for it in r["Items"])
-            rows.append({"Meal": r["Meal"], "Items": items_str, "Calories": r["Calories"], "Protein_g": r["Protein_g"], "Carbs_g": r["Carbs_g"], "Fat_g": r["Fat_g"]})
-        export_df = pd.DataFrame(rows)
-        fpath = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")], initialfile="smartfit_plan.csv")
+        filetypes = [("CSV", "*.csv"), ("CSV (gzip)", "*.csv.gz")]
+        if PYARROW_AVAILABLE:
+            filetypes += [("Parquet", "*.parquet"), ("Feather", "*.feather")]
+        fpath = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=filetypes, initialfile="smartfit_plan.csv")
         if not fpath: return
-        with open(fpath, "w", encoding="utf-8") as fh:
-            fh.write("# SmartFit - Personalized Plan\n")
-            for k, v in self.last_targets.items():
-                fh.write(f"# {k}: {v}\n")
-            export_df.to_csv(fh, index=False)
+        try:
+            with PlanWriter(fpath, metadata=self.last_targets, days="Day" in self.last_plan_df) as writer:
+                writer.add(self.last_plan_df)
+        except Exception as e:
+            messagebox.showerror("Export Error", f"Could not export plan: {e}"); return
         messagebox.showinfo("Exported", f"Plan saved to {fpath}")
 
 
 # ---------- Runner ----------
-def start_app_with_splash():
+_IMPORT_FINISHED = time.perf_counter()
+
+def start_app_with_splash(profile_startup=False):
+    """Show the splash at once, import heavy libraries on a background thread, build the main
+    window as soon as they are loaded and close the splash when the first plan is on screen.
+    With profile_startup, print import/UI-build/first-plan timings and exit."""
+    started = time.perf_counter()
+    timings = {"import_s": _IMPORT_FINISHED - _IMPORT_STARTED}
+    print_status("Starting SmartFit...")
     root = tk.Tk()
     root.withdraw()
-    def on_splash_finish():
-        root.deiconify()
+    splash = SplashScreen(root)
+    splash.start()
+    splash.set_stage(0.35, "Loading SmartFit...")
+    warm = threading.Event()
+
+    def warm_up():
+        t = time.perf_counter()
+        try:
+            load_ui_libraries(); pd.DataFrame; get_food_catalog()
+        finally:
+            timings["libraries_s"] = time.perf_counter() - t
+            warm.set()
+
+    def build():
+        if not warm.is_set():
+            root.after(15, build); return
+        report_environment()
+        splash.set_stage(0.7, "Preparing dashboard...")
+        t = time.perf_counter()
         app = SmartFitApp(root)
+        timings["ui_build_s"] = time.perf_counter() - t
+        splash.set_stage(0.9, "Generating personalized plans...")
+        t = time.perf_counter()
+
+        def ready():
+            if "first_plan_s" in timings:
+                return
+            timings["first_plan_s"] = time.perf_counter() - t
+            timings["ready_s"] = time.perf_counter() - started
+            splash.finish()
+            app.show()
+            if profile_startup:
+                print_status("Startup timings: " + json.dumps({k: round(v, 4) for k, v in timings.items()}))
+                root.after(0, app.on_close)
+        app.when_plan_displayed(ready)
         app.on_generate()  # Auto-generate on launch
-    splash = SplashScreen(root, duration_ms=3000, on_finish=on_splash_finish)
-    splash.start()
+        root.after(10000, ready)  # never keep the splash up if the first plan fails
+
+    threading.Thread(target=warm_up, daemon=True).start()
+    root.after(0, build)
     root.mainloop()
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="smartift", description="SmartFit - AI fitness & nutrition assistant")
+    parser.add_argument("--metrics", default=os.environ.get("SMARTFIT_METRICS"),
+                        help="time each stage and write histograms here on exit (.prom/.txt: Prometheus text, else JSON)")
+    parser.add_argument("--profile-slowest", type=int, default=0, metavar="N", help="cProfile meal planning and keep the N slowest calls")
+    parser.add_argument("--profile-output", default="smartfit_slowest.txt", help="where --profile-slowest writes its report")
+    sub = parser.add_subparsers(dest="command")
+    gui = sub.add_parser("gui", help="start the desktop app (default)")
+    gui.add_argument("--profile-startup", action="store_true", help="print import, UI-build and first-plan times, then exit")
+    batch = sub.add_parser("batch", help="generate plans for a CSV/JSONL file of profiles")
+    batch.add_argument("input", help="profiles (.csv or .jsonl): sex, weight, height, age, activity, goal, experience")
+    batch.add_argument("output", help="JSONL results file")
+    batch.add_argument("--workers", type=int, default=None)
+    batch.add_argument("--chunk-size", type=int, default=1000)
+    batch.add_argument("--mode", choices=["greedy", "optimize"], default="greedy")
+    batch.add_argument("--catalog", default=os.environ.get("SMARTFIT_CATALOG"), help="binary food catalog directory")
+    batch.add_argument("--cache-size", type=int, default=4096, help="per-worker plan cache entries (0 disables)")
+    batch.add_argument("--weight-step", type=float, default=0.5, help="cache bucket size for weight (kg)")
+    batch.add_argument("--height-step", type=float, default=1.0, help="cache bucket size for height (cm)")
+    batch.add_argument("--cache-file", default=None, help="warm the worker caches from this JSON file and save the merged cache back to it")
+    batch.add_argument("--store", default=None, metavar="DB", help="also save profiles, targets and plans to this SQLite history")
+    batch.add_argument("--logs", default=None, help="weight/intake log CSV (member_id, date, weight, intake): adapt TDEE per profile id")
+    export = sub.add_parser("export", help="write meal plans for a CSV/JSONL file of profiles to CSV/Parquet/Feather")
+    export.add_argument("input", help="profiles (.csv or .jsonl), as for batch")
+    export.add_argument("output", help=".csv, .csv.gz, .csv.zst, .parquet or .feather")
+    export.add_argument("--format", choices=["csv", "parquet", "feather"], default=None, help="default: from the file name")
+    export.add_argument("--compression", default=None, help="gzip/zstd for CSV; snappy/zstd/gzip for Parquet; zstd/lz4 for Feather")
+    export.add_argument("--chunk-size", type=int, default=1000)
+    export.add_argument("--mode", choices=["greedy", "optimize"], default="greedy")
+    export.add_argument("--catalog", default=os.environ.get("SMARTFIT_CATALOG"), help="binary food catalog directory")
+    export.add_argument("--cache-size", type=int, default=4096, help="plan cache entries (0 plans every profile exactly)")
+    catalog = sub.add_parser("catalog", help="manage binary food catalogs")
+    catalog_sub = catalog.add_subparsers(dest="catalog_command", required=True)
+    convert = catalog_sub.add_parser("convert", help="write a binary catalog directory from a CSV or the built-in food list")
+    convert.add_argument("output", help="catalog directory to write (use with --catalog or SMARTFIT_CATALOG)")
+    convert.add_argument("--csv", default=None, help="foods CSV with name, serving, cal, protein, carbs, fat columns (default: built-in foods)")
+    bench = sub.add_parser("bench", help="run the headless benchmark suite")
+    bench.add_argument("--catalog-sizes", type=int, nargs="+", default=None, help="synthetic catalog sizes (default 17 10000 1000000)")
+    bench.add_argument("--batch-sizes", type=int, nargs="+", default=None, help="profile/plan batch sizes (default 1 1000 100000 1000000)")
+    bench.add_argument("--quick", action="store_true", help="smaller default sizes (catalogs 17/10k, batches 1/1k)")
+    bench.add_argument("--no-memory", action="store_true", help="skip peak-memory measurement")
+    bench.add_argument("--repeat", type=int, default=3, help="fresh processes to run the suite in; medians are reported (default 3)")
+    bench.add_argument("--pipeline-rows", type=int, default=10000, help="rows of each batch run through plan_profiles (0: all)")
+    bench.add_argument("--output", default=None, help="write results as JSON")
+    bench.add_argument("--baseline", default=None, help="compare against a stored results JSON; exit 1 on regressions")
+    bench.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    serve = sub.add_parser("serve", help="serve targets, meal plans, workouts and suggestions as JSON over HTTP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--workers", type=int, default=None, help="plan solver processes (default: CPU count)")
+    serve.add_argument("--batch-window-ms", type=float, default=2.0, help="how long to collect concurrent requests into one batch")
+    serve.add_argument("--max-batch", type=int, default=256, help="flush a batch early at this many requests")
+    serve.add_argument("--max-pending", type=int, default=1024, help="unanswered requests before answering 503")
+    serve.add_argument("--mode", choices=["greedy", "optimize"], default="greedy", help="default mode; requests may set \"mode\"")
+    serve.add_argument("--catalog", default=os.environ.get("SMARTFIT_CATALOG"), help="binary food catalog directory")
+    serve.add_argument("--cache-size", type=int, default=4096, help="per-worker plan cache entries (0 disables)")
+    load = sub.add_parser("loadtest", help="measure serve latency with concurrent local clients")
+    load.add_argument("--url", default=None, help="running server, e.g. 127.0.0.1:8080 (default: start one on a free port)")
+    load.add_argument("--host", default="127.0.0.1", help="interface for the spawned server")
+    load.add_argument("--path", default="/v1/plan", choices=sorted(SERVE_ROUTES))
+    load.add_argument("--requests", type=int, default=2000)
+    load.add_argument("--concurrency", type=int, default=32)
+    load.add_argument("--workers", type=int, default=None, help="workers for the spawned server")
+    load.add_argument("--seed", type=int, default=0)
+    load.add_argument("--p99-ms", type=float, default=None, help="exit 1 when p99 latency is over this budget")
+    load.add_argument("--strict", action="store_true", help="also exit 1 on any non-200 response")
+    args = parser.parse_args(argv)
+    if args.metrics or args.profile_slowest:
+        METRICS.enable(profile_slowest=args.profile_slowest)
+    try:
+        run_command(args)
+    finally:
+        if METRICS.enabled:
+            METRICS.report()
+            if args.metrics:
+                METRICS.dump(args.metrics); print_status(f"Metrics written to {args.metrics}")
+            if args.profile_slowest:
+                METRICS.dump_profiles(args.profile_output); print_status(f"Slowest plan profiles written to {args.profile_output}")
+
+def run_command(args):
+    if args.command == "bench":
+        args.catalog_sizes = args.catalog_sizes or ([17, 10000] if args.quick else [17, 10000, 1000000])
+        args.batch_sizes = args.batch_sizes or ([1, 1000] if args.quick else [1, 1000, 100000, 1000000])
+        sys.exit(run_bench_command(args))
+    elif args.command == "loadtest":
+        sys.exit(run_loadtest_command(args))
+    elif args.command == "catalog":
+        path = convert_csv_to_catalog(args.csv, args.output) if args.csv else convert_food_db_to_catalog(args.output)
+        print_status(f"Wrote {len(FoodCatalog.open(path))} foods to {path}")
+    elif args.command == "serve":
+        if args.catalog:
+            set_food_catalog(FoodCatalog.open(args.catalog))
+        run_server(args.host, args.port, workers=args.workers, batch_window_ms=args.batch_window_ms, max_batch=args.max_batch,
+                   max_pending=args.max_pending, mode=args.mode, catalog_path=args.catalog,
+                   cache_options={"maxsize": args.cache_size} if args.cache_size > 0 else None)
+    elif args.command == "export":
+        if args.catalog:
+            set_food_catalog(FoodCatalog.open(args.catalog))
+        cache = PlanCache(maxsize=args.cache_size) if args.cache_size > 0 else None
+        export_profiles(args.input, args.output, args.mode, args.chunk_size, args.format, args.compression, cache)
+    elif args.command == "batch":
+        cache_options = None if args.cache_size <= 0 else {
+            "maxsize": args.cache_size, "weight_step": args.weight_step, "height_step": args.height_step, "path": args.cache_file}
+        store = PlanStore(args.store) if args.store else None
+        estimates = None
+        if args.logs:
+            tracker = ProgressTracker()
+            tracker.ingest_frame(pd.read_csv(args.logs))
+            estimates = {str(m): est for m in tracker.members if not math.isnan((est := tracker.estimate(m))[0])}
+            print_status(f"Adaptive TDEE for {len(estimates)} of {len(tracker.members)} logged members")
+        try:
+            run_batch(args.input, args.output, args.workers, args.chunk_size, args.mode, args.catalog, cache_options, store, estimates)
+        finally:
+            if store is not None:
+                store.close()
+    else:
+        start_app_with_splash(profile_startup=getattr(args, "profile_startup", False))
+
 if __name__ == "__main__":
-    start_app_with_splash()
+    main()
@@ -0,0 +1,61 @@
+"""The original row-by-row pandas implementations, kept as references for the vectorized paths."""
+import numpy as np
+import pandas as pd
+
+import smartift
+
+MEALS = ("Breakfast", "Lunch", "Dinner", "Snack")
+SPLITS = {"Breakfast": 0.25, "Lunch": 0.35, "Dinner": 0.30, "Snack": 0.10}
+
+
+def reference_fill(foods, threshold, order):
+    """The original meal fill: walk the sorted foods until calories reach the threshold."""
+    if order == "cal":
+        cand = foods.sort_values(by="cal")
+    else:
+        cand = foods.assign(pdensity=foods["protein"] / (foods["cal"] + 1e-6)).sort_values(by="pdensity", ascending=False)
+    ids, cal = [], 0.0
+    for i, c in zip(cand.index.tolist(), cand["cal"].tolist()):
+        if cal >= threshold:
+            break
+        ids.append(i); cal += c
+    if cal < threshold:
+        ids.append(foods.sort_values(by="cal", ascending=False).index[0])
+    return ids
+
+
+def reference_meal_plan(foods, target_calories, meals=MEALS):
+    available = [m for m in meals if m]
+    total_split = sum(SPLITS[m] for m in available if m in SPLITS)
+    rows = []
+    for meal in available:
+        ids = reference_fill(foods, target_calories * (SPLITS.get(meal, 0.15) / total_split) * 0.95, "cal" if meal == "Snack" else "pdensity")
+        items = [foods.loc[i].to_dict() for i in ids]
+        cal, prot, carb, fat = (sum(it[k] for it in items) if items else 0.0 for k in ("cal", "protein", "carbs", "fat"))
+        rows.append({"Meal": meal, "Items": items, "Calories": round(cal), "Protein_g": round(prot, 1),
+                     "Carbs_g": round(carb, 1), "Fat_g": round(fat, 1)})
+    return pd.DataFrame(rows)
+
+
+def reference_suggestions(targets, last_plan_df):
+    tips = []
+    tcal = targets.get("TargetCalories")
+    if tcal and tcal < 1600:
+        tips.append("Target calories are low — prioritize protein and nutrient-dense foods.")
+    if targets and targets.get("Protein_g", 0) < 1:
+        tips.append("Distribute protein across meals (20-30g per meal).")
+    if last_plan_df is not None:
+        for _, r in last_plan_df.iterrows():
+            if any("Peanut Butter" in it["name"] and r["Meal"].lower().startswith("sn") for it in r["Items"]):
+                tips.append("Swap some peanut-butter snacks for Greek yogurt + berries.")
+                break
+    tips.extend(["Include colored vegetables for vitamins and fiber.", "Stay hydrated (2-3 L/day depending on activity).",
+                 "For medical conditions, consult a dietitian."])
+    return tips
+
+
+def tied_catalog(n, seed):
+    # integer macros from small ranges: many foods share calories and protein density
+    rng = np.random.default_rng(seed)
+    macros = rng.integers(1, 6, (n, 4)) * np.array([50, 5, 10, 3])
+    return smartift.FoodCatalog([f"Food {i}" for i in range(n)], ["1 serving"] * n, *macros.T)
@@ -0,0 +1,19 @@
+import json
+
+import smartift
+
+
+def test_batch_output_keeps_input_order_across_chunks(tmp_path):
+    profiles = smartift.synthetic_profiles(53, seed=6)
+    profiles.loc[[4, 30], "weight"] = float("nan")  # rows without a weight stay in place with an error
+    src = tmp_path / "profiles.csv"
+    profiles.to_csv(src, index=False)
+    out = tmp_path / "plans.jsonl"
+    count = smartift.run_batch(str(src), str(out), workers=2, chunk_size=5, cache_options=None)
+    lines = out.read_text(encoding="utf-8").splitlines()
+    assert count == len(lines) == len(profiles)
+    rows = list(smartift.read_profiles(str(src)))
+    assert lines == smartift.plan_profiles(rows)
+    results = [json.loads(line) for line in lines]
+    assert [r["id"] for r in results] == profiles["id"].astype(str).tolist()
+    assert [i for i, r in enumerate(results) if "error" in r] == [4, 30]
@@ -0,0 +1,37 @@
+import pytest
+
+import smartift
+
+
+def result(memory="rss", **stats):
+    return {"meta": {"memory": memory}, "results": {"b": stats}}
+
+
+def test_compare_widens_threshold_to_noise():
+    base = result(per_s=1000.0, noise={"per_s": 0.01})
+    _, regressions = smartift.compare_benchmarks(result(per_s=850.0, noise={"per_s": 0.01}), base, 0.10)
+    assert [r[1] for r in regressions] == ["per_s"]
+    _, regressions = smartift.compare_benchmarks(result(per_s=850.0, noise={"per_s": 0.08}), base, 0.10)
+    assert regressions == []
+
+
+def test_compare_applies_floors_and_memory_method():
+    base = result(p50_us=1.0, p99_us=100.0, peak_mb=10.0)
+    cur = result(p50_us=1.4, p99_us=125.0, peak_mb=20.0)
+    _, regressions = smartift.compare_benchmarks(cur, base)
+    assert [r[1] for r in regressions] == ["peak_mb"]  # 0.4 us is under the absolute floor, +25% p99 under its floor
+    _, regressions = smartift.compare_benchmarks(result("tracemalloc", peak_mb=20.0), base)
+    assert regressions == []
+
+
+def test_merge_takes_medians_and_spread_across_runs():
+    runs = [result(per_s=v, seconds=1 / v, noise={"per_s": 0.02}) for v in (100.0, 110.0, 90.0)]
+    merged = smartift.merge_benchmarks(runs)
+    stats = merged["results"]["b"]
+    assert stats["per_s"] == 100.0 and merged["meta"]["repeat"] == 3
+    assert stats["noise"]["per_s"] == pytest.approx(20 / 1.693 / 100)
+
+
+def test_time_batch_reports_median_of_min_runs():
+    out = smartift.time_batch(lambda: None, 10, min_runs=5, min_time=0)
+    assert out["runs"] == 5 and out["seconds"] >= out["best_seconds"]
@@ -0,0 +1,59 @@
+import json
+
+import smartift
+
+
+def test_profile_key_quantizes_inputs():
+    cache = smartift.PlanCache(weight_step=0.5, height_step=1.0)
+    a = cache.profile_key("male", 30.2, 70.24, 180.4, "Moderate", "Maintain")
+    b = cache.profile_key("Male", 29.8, 69.9, 179.6, "Moderate", "Maintain")
+    assert a == b == ("Male", 30.0, 70.0, 180.0, "Moderate", "Maintain", "beginner", "greedy")
+    assert cache.profile_key("F", 30, 70.3, 180, "Moderate", "Maintain")[2] == 70.5
+    assert smartift.quantize(71.3, 0) == 71.3
+
+
+def test_lru_eviction_and_counters():
+    cache = smartift.PlanCache(maxsize=2)
+    cache.put("a", 1); cache.put("b", 2)
+    assert cache.get("a") == 1          # "a" is now most recent
+    cache.put("c", 3)                   # evicts "b"
+    assert cache.get("b") is None and cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 1, "hit_rate": 2 / 3}
+
+
+def test_plan_targets_are_exact_while_plan_is_shared():
+    cache = smartift.PlanCache()
+    a = cache.plan("Male", 30, 70.1, 180, "Moderate", "Maintain")
+    b = cache.plan("Male", 30, 69.9, 180, "Moderate", "Maintain")
+    assert a["plan"] is b["plan"] and cache.stats()["hits"] == 1
+    assert b["targets"] == smartift.calculate_tdee_and_targets("Male", 69.9, 180, 30, "Moderate", "Maintain")
+
+
+def test_save_load_round_trip(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = smartift.PlanCache(path=path)
+    entry = cache.entry("Female", 41, 63.2, 166, "Light", "Lose Fat", "intermediate")
+    cache.save()
+    json.load(open(path, encoding="utf-8"))  # plain data
+    warm = smartift.PlanCache(path=path)
+    again = warm.entry("Female", 41, 63.2, 166, "Light", "Lose Fat", "intermediate")
+    assert warm.stats()["hits"] == 1 and warm.take_added() == []
+    assert again["plan"].to_dict() == entry["plan"].to_dict() and again["workout"] == entry["workout"]
+    assert len(smartift.PlanCache(path=path, weight_step=1.0)._data) == 0  # other quantization: cold
+    open(path, "w").write("not json")
+    assert len(smartift.PlanCache(path=path)._data) == 0
+
+
+def test_batch_run_saves_cache_for_next_run(tmp_path):
+    profiles = smartift.synthetic_profiles(40, seed=3)
+    profiles.to_csv(tmp_path / "in.csv", index=False)
+    path = str(tmp_path / "cache.json")
+    options = {"maxsize": 1000, "path": path}
+    smartift.run_batch(str(tmp_path / "in.csv"), str(tmp_path / "out1.jsonl"), workers=1, chunk_size=16, cache_options=options)
+    warm = smartift.PlanCache(**options)
+    assert len(warm._data) > 0
+    for r in profiles.to_dict("records"):
+        warm.entry(r["sex"], r["age"], r["weight"], r["height"], r["activity"], r["goal"], r["experience"])
+    assert warm.stats()["misses"] == 0
+    smartift.run_batch(str(tmp_path / "in.csv"), str(tmp_path / "out2.jsonl"), workers=1, chunk_size=16, cache_options=options)
+    assert (tmp_path / "out1.jsonl").read_text() == (tmp_path / "out2.jsonl").read_text()
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+import smartift
+
+
+def assert_same_catalog(got, want):
+    assert list(got.names) == list(want.names) and list(got.servings) == list(want.servings)
+    for k in smartift.FoodCatalog.MACROS:
+        assert got.columns[k].dtype == want.columns[k].dtype
+        assert np.array_equal(got.columns[k], want.columns[k])
+    for k in smartift.FoodCatalog.ORDERS:
+        assert np.array_equal(got.orders[k], want.orders[k]) and np.array_equal(got.prefix[k], want.prefix[k])
+    assert got.biggest == want.biggest
+    assert [got.record(i) for i in range(len(got))] == [want.record(i) for i in range(len(want))]
+
+
+def test_saved_catalog_round_trips(tmp_path):
+    want = smartift.FoodCatalog.from_records(smartift.FOOD_DB)
+    got = smartift.FoodCatalog.open(smartift.convert_food_db_to_catalog(str(tmp_path / "foods")))
+    assert_same_catalog(got, want)
+    rec = got.record(got.find("Chicken Breast (100g)"))
+    assert rec["cal"] == 165 and isinstance(rec["cal"], int)
+    plan = lambda cat: smartift.generate_meal_plan(2400, 150, 250, 70, catalog=cat).drop(columns="Items")
+    pd.testing.assert_frame_equal(plan(got), plan(want))
+
+
+def test_catalog_convert_command(tmp_path):
+    csv_path = tmp_path / "foods.csv"
+    smartift.synthetic_catalog(500, seed=2).to_frame().to_csv(csv_path, index=False)
+    smartift.main(["catalog", "convert", str(tmp_path / "cat"), "--csv", str(csv_path)])
+    assert_same_catalog(smartift.FoodCatalog.open(str(tmp_path / "cat")), smartift.FoodCatalog.from_csv(csv_path))
+
+
+def test_string_table_decode_matches_getitem():
+    names = [f"Food {i} ü" * (1 + i % 5) for i in range(5000)]
+    table, (refs,) = smartift.StringTable.build(names)
+    rng = np.random.default_rng(0)
+    for pick in ([], [7], [0, len(table) - 1], rng.integers(0, len(table), 300), np.arange(100, 400), refs):
+        assert table.decode(pick) == [table[i] for i in np.asarray(pick, dtype=np.int64).tolist()]
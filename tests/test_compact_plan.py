@@ -0,0 +1,33 @@
+"""CompactPlan.to_frame against the original dict-per-item meal plan."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import smartift
+from baseline import MEALS, reference_meal_plan, tied_catalog
+
+
+@pytest.mark.parametrize("catalog", [smartift.FoodCatalog.from_records(smartift.FOOD_DB), tied_catalog(200, 7)])
+def test_compact_plan_frame_matches_reference(catalog):
+    foods = catalog.to_frame()
+    rng = np.random.default_rng(5)
+    for target in rng.uniform(800, 4500, 25):
+        meals = tuple(m for m in MEALS if rng.random() < 0.8) or MEALS
+        got = smartift.generate_meal_plan(target, 0, 0, 0, meals=meals, catalog=catalog)
+        want = reference_meal_plan(foods, target, meals)
+        pd.testing.assert_frame_equal(got.drop(columns="Items"), want.drop(columns="Items"), check_dtype=False)
+        for g, w in zip(got["Items"], want["Items"]):
+            assert [(it["name"], it["cal"], it["protein"], it["carbs"], it["fat"]) for it in g] == \
+                   [(it["name"], it["cal"], it["protein"], it["carbs"], it["fat"]) for it in w]
+
+
+def test_from_frame_matches_items_by_name_without_ids():
+    catalog = smartift.FoodCatalog.from_records(smartift.FOOD_DB)
+    plan = smartift.generate_meal_plan(2600, 0, 0, 0, catalog=catalog)
+    want = smartift.CompactPlan.from_frame(plan)
+    no_ids = plan.assign(Items=[[{k: v for k, v in it.items() if k != "id"} for it in items] for items in plan["Items"]])
+    got = smartift.CompactPlan.from_frame(no_ids, catalog)
+    assert got.food_ids.tolist() == want.food_ids.tolist() and got.totals.tolist() == want.totals.tolist()
+    no_ids["Items"].iloc[0][0]["name"] = "Dragon Fruit Smoothie"
+    with pytest.raises(ValueError):
+        smartift.CompactPlan.from_frame(no_ids, catalog)
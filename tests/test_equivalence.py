@@ -0,0 +1,34 @@
+"""calculate_targets_batch against calculate_tdee_and_targets, row by row."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import smartift
+
+
+@pytest.fixture(scope="module")
+def profiles():
+    # weights in 0.25 kg and heights in 0.5 cm steps put many BMR/protein/fat values exactly on .5
+    rng = np.random.default_rng(11)
+    n = 3000
+    df = pd.DataFrame({"sex": rng.choice(["Male", "Female"], n), "weight": rng.integers(160, 520, n) * 0.25,
+                       "height": rng.integers(300, 400, n) * 0.5, "age": rng.integers(16, 80, n),
+                       "activity": rng.choice(smartift.ACTIVITY_LEVELS + ["Unknown"], n),
+                       "goal": rng.choice(smartift.GOALS + ["Other"], n)})
+    df["tdee"] = np.where(rng.random(n) < 0.3, rng.integers(3000, 6000, n) * 0.5, np.nan)
+    df["tdee_confidence"] = rng.integers(0, 5, n) * 0.25
+    return df
+
+
+def test_batch_targets_match_scalar(profiles):
+    batch = smartift.calculate_targets_batch(profiles).to_dict("records")
+    for r, got in zip(profiles.to_dict("records"), batch):
+        want = smartift.calculate_tdee_and_targets(r["sex"], r["weight"], r["height"], r["age"], r["activity"], r["goal"],
+                                                   None if np.isnan(r["tdee"]) else r["tdee"], r["tdee_confidence"])
+        assert got == want
+
+
+def test_batch_targets_cover_rounding_ties(profiles):
+    bmr = 10 * profiles["weight"] + 6.25 * profiles["height"] - 5 * profiles["age"]
+    assert ((bmr % 1) == 0.5).sum() > 100
+    assert ((2.0 * profiles["weight"]) % 1 == 0.5).sum() > 100
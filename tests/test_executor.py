@@ -0,0 +1,54 @@
+import threading
+import time
+
+import smartift
+
+
+class FakeRoot:
+    """Stands in for a Tk root: after() callbacks run only when the test pumps them, and every
+    call records the thread it came from."""
+    def __init__(self):
+        self.pending, self.threads, self._ids = {}, set(), iter(range(1, 1 << 30))
+
+    def after(self, ms, fn, *args):
+        self.threads.add(threading.get_ident())
+        key = next(self._ids)
+        self.pending[key] = (fn, args)
+        return key
+
+    def after_cancel(self, key):
+        self.pending.pop(key, None)
+
+    def pump(self, until, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not until() and time.monotonic() < deadline:
+            for key in list(self.pending):
+                fn, args = self.pending.pop(key)
+                fn(*args)
+            time.sleep(0.005)
+
+
+def test_latest_result_is_delivered_on_the_polling_thread():
+    root, got = FakeRoot(), []
+    jobs = smartift.LatestOnlyExecutor(root)
+    gate = threading.Event()
+    jobs.submit("plan", lambda: gate.wait() and "stale", got.append)
+    jobs.submit("plan", lambda: "fresh", got.append)
+    gate.set()
+    root.pump(lambda: got)
+    assert got == ["fresh"]
+    assert root.threads == {threading.get_ident()}
+    jobs.shutdown()
+
+
+def test_shutdown_drops_results_and_stops_polling():
+    root, got = FakeRoot(), []
+    jobs = smartift.LatestOnlyExecutor(root)
+    gate = threading.Event()
+    future = jobs.submit("plan", lambda: gate.wait(), got.append)
+    jobs.shutdown()
+    gate.set()
+    future.result(5)
+    assert not root.pending
+    root.pump(lambda: False, timeout=0.1)
+    assert got == [] and root.threads == {threading.get_ident()}
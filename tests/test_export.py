@@ -0,0 +1,39 @@
+import gzip
+import io
+
+import pandas as pd
+import pytest
+
+import smartift
+
+FORMATS = [("plans.csv", None), ("plans.csv.gz", None),
+           pytest.param("plans.csv.zst", None, marks=pytest.mark.skipif(not smartift.ZSTD_AVAILABLE, reason="needs zstandard")),
+           pytest.param("plans.parquet", "zstd", marks=pytest.mark.skipif(not smartift.PYARROW_AVAILABLE, reason="needs pyarrow")),
+           pytest.param("plans.feather", None, marks=pytest.mark.skipif(not smartift.PYARROW_AVAILABLE, reason="needs pyarrow"))]
+
+
+def read_export(path):
+    if path.suffix in (".parquet", ".feather"):
+        return (pd.read_parquet if path.suffix == ".parquet" else pd.read_feather)(path)
+    raw = path.read_bytes()
+    if path.suffix == ".gz":
+        raw = gzip.decompress(raw)
+    elif path.suffix == ".zst":
+        import zstandard
+        raw = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(raw)).read()
+    return pd.read_csv(io.BytesIO(raw), comment="#", dtype={"Plan": str})
+
+
+@pytest.mark.parametrize("name, compression", FORMATS)
+def test_export_formats_round_trip(tmp_path, name, compression):
+    plans = []
+    for i, cal in enumerate(range(1500, 3300, 150)):
+        plan = smartift.generate_meal_plan(cal, 0, 0, 0, compact=True)
+        plans.append((f"p{i}", plan if i % 2 else plan.to_frame()))  # CompactPlans and DataFrames mix
+    rows = smartift.export_plans(plans, str(tmp_path / name), compression=compression, chunk_size=7)
+    want = pd.concat([(p if isinstance(p, pd.DataFrame) else p.to_frame()).assign(Plan=pid) for pid, p in plans], ignore_index=True)
+    want["Items"] = ["; ".join(smartift.format_plan_item(it) for it in items) for items in want["Items"]]
+    got = read_export(tmp_path / name)
+    assert rows == len(want) == len(got)
+    assert list(got.columns) == ["Plan", *smartift.PLAN_COLUMNS]
+    pd.testing.assert_frame_equal(got, want[list(got.columns)], check_dtype=False)
@@ -0,0 +1,19 @@
+"""Searchsorted greedy fill against the original pandas sort-and-walk."""
+import numpy as np
+import pytest
+
+import smartift
+from baseline import reference_fill, tied_catalog
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("order", ["cal", "pdensity"])
+def test_greedy_fill_matches_reference_on_tied_catalogs(seed, order):
+    cat = tied_catalog(300, seed)
+    foods = cat.to_frame()
+    rng = np.random.default_rng(seed)
+    for threshold in np.concatenate([rng.uniform(0, 3000, 40), [0, cat.macros[:, 0].sum() + 1]]):
+        ids, totals = cat.greedy_fill(threshold, order)
+        want = reference_fill(foods, threshold, order)
+        assert np.asarray(ids).tolist() == want
+        assert np.allclose(totals, cat.macros[want].sum(axis=0) if want else np.zeros(4))
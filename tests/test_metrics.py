@@ -0,0 +1,48 @@
+import json
+import re
+import time
+
+import smartift
+
+
+def test_disabled_metrics_record_nothing():
+    m = smartift.Instrumentation()
+    step = m.timed("stage")(lambda x: x + 1)
+    with m.timer("block"):
+        assert step(1) == 2
+    assert m.histograms == {}
+
+
+def test_prometheus_buckets_are_cumulative(tmp_path):
+    m = smartift.Instrumentation()
+    m.enable()
+    for s in (0.0004, 0.003, 0.003, 0.2, 30.0):
+        m.observe("plan.meal", s)
+    text = m.to_prometheus()
+    buckets = {le: int(n) for le, n in re.findall(r'smartfit_stage_seconds_bucket\{stage="plan.meal",le="([^"]+)"\} (\d+)', text)}
+    assert buckets["0.0005"] == 1 and buckets["0.0025"] == 1 and buckets["0.005"] == 3 and buckets["0.25"] == 4
+    assert buckets["10.0"] == 4 and buckets["+Inf"] == 5
+    counts = list(buckets.values())
+    assert counts == sorted(counts)
+    assert 'smartfit_stage_seconds_count{stage="plan.meal"} 5' in text
+    assert float(re.search(r'smartfit_stage_seconds_sum\{stage="plan.meal"\} (\S+)', text).group(1)) == sum((0.0004, 0.003, 0.003, 0.2, 30.0))
+    m.dump(str(tmp_path / "m.prom"))
+    assert (tmp_path / "m.prom").read_text(encoding="utf-8") == text
+    m.dump(str(tmp_path / "m.json"))
+    stage = json.loads((tmp_path / "m.json").read_text(encoding="utf-8"))["stages"]["plan.meal"]
+    assert stage["count"] == 5 and stage["max_s"] == 30.0 and stage["p50_s"] == 0.005
+
+
+def test_worker_snapshots_merge_with_slowest_profiles():
+    parent, worker = smartift.Instrumentation(), smartift.Instrumentation()
+    parent.enable(profile_slowest=2); worker.enable(profile_slowest=2)
+    plan = worker.timed("plan.meal", profile=True)(lambda s: time.sleep(s))
+    for s in (0.001, 0.06, 0.002, 0.03):
+        plan(s)
+    parent.observe("plan.meal", 0.001)
+    parent.merge(worker.take())
+    assert worker.histograms == {} and worker.slowest == []
+    assert parent.histograms["plan.meal"].count == 5
+    calls = [c for _, _, _, c, _ in sorted(parent.slowest, reverse=True)]
+    assert calls == ["<lambda>(0.06)", "<lambda>(0.03)"]
+    assert all("function calls" in text for *_, text in parent.slowest)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import smartift
+
+
+@pytest.fixture(scope="module")
+def targets():
+    return smartift.calculate_tdee_and_targets("Male", 80, 180, 30, "Moderate", "Lose Fat")
+
+
+@pytest.mark.parametrize("catalog", [smartift.FoodCatalog.from_records(smartift.FOOD_DB), smartift.synthetic_catalog(20000, seed=3)])
+def test_multiday_optimize_respects_blocked_foods(catalog, targets):
+    plan = smartift.MultiDayPlan(targets, days=5, catalog=catalog, mode="optimize", deadline_ms=1000)
+    single = smartift.generate_meal_plan(targets["TargetCalories"], targets["Protein_g"], targets["Carbs_g"], targets["Fat_g"],
+                                         catalog=catalog, mode="optimize", deadline_ms=1000, compact=True)
+    first = plan.to_compact([1])
+    assert first.food_ids.tolist() == single.food_ids.tolist()
+    assert first.portions.tolist() == single.portions.tolist()
+    for d in range(1, plan.days):
+        assert not plan.used[d] & plan.used[d - 1]
+
+
+def test_multiday_rejects_unknown_mode(targets):
+    with pytest.raises(ValueError):
+        smartift.MultiDayPlan(targets, days=2, mode="fastest")
+
+
+def test_swap_scan_matches_brute_force_under_room():
+    cat = smartift.synthetic_catalog(20000, seed=5)
+    index = smartift.FoodSwapIndex(cat.macros, kdtree=False)
+    rng = np.random.default_rng(1)
+    for t in range(100):
+        food = int(rng.integers(len(cat)))
+        room = None if t % 4 == 0 else cat.macros[food] * rng.uniform(0.3, 1.5, 4)
+        exclude = rng.integers(0, len(cat), 3).tolist()
+        ids, dist = index.query(food, 5, room, exclude)
+        d = ((index.vectors - index.vectors[food]) ** 2).sum(axis=1)
+        ok = np.ones(len(cat), dtype=bool); ok[exclude + [food]] = False
+        if room is not None:
+            ok &= (cat.macros <= room).all(axis=1)
+        assert np.allclose(dist, np.sqrt(np.sort(d[ok])[:5]))
+
+
+def test_multiday_records_relaxed_meals(targets):
+    catalog = smartift.FoodCatalog.from_records(smartift.FOOD_DB)
+    plan = smartift.MultiDayPlan(targets, days=30, max_days_per_item=5, catalog=catalog)
+    relaxed = plan.relaxed_meals()
+    assert relaxed and all(1 <= d <= 30 for d, _ in relaxed)
+    counts = {}
+    for d in range(plan.days):
+        if not plan.relaxed[d]:
+            assert not plan.used[d] & plan.used[d - 1] if d else True
+            assert all(counts.get(i, 0) < 5 for i in plan.used[d])
+        for i in plan.used[d]:
+            counts[i] = counts.get(i, 0) + 1
+    assert smartift.MultiDayPlan(targets, days=3, catalog=smartift.synthetic_catalog(2000)).relaxed_meals() == []
+
+
+@pytest.mark.parametrize("catalog", [smartift.FoodCatalog.from_records(smartift.FOOD_DB), smartift.synthetic_catalog(20000, seed=3)])
+def test_optimize_past_deadline_serves_greedy_plan(catalog, targets):
+    args = (targets["TargetCalories"], targets["Protein_g"], targets["Carbs_g"], targets["Fat_g"])
+    greedy = smartift.generate_meal_plan(*args, catalog=catalog, compact=True)
+    late = smartift.generate_meal_plan(*args, catalog=catalog, mode="optimize", deadline_ms=0, compact=True)
+    assert late.food_ids.tolist() == greedy.food_ids.tolist()
+    assert late.portions.tolist() == greedy.portions.tolist() and late.totals.tolist() == greedy.totals.tolist()
+    multi = smartift.MultiDayPlan(targets, days=3, catalog=catalog, mode="optimize", deadline_ms=0)
+    assert multi.to_compact().food_ids.tolist() == smartift.MultiDayPlan(targets, days=3, catalog=catalog).to_compact().food_ids.tolist()
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import smartift
+
+COLUMNS = ["trend", "intake_ewma", "slope_kg_per_day", "intake_mean", "coverage", "tdee", "confidence"]
+
+
+@pytest.fixture(scope="module")
+def logs():
+    # irregular logging: gaps, same-day duplicates and days with only one of weight/intake
+    rng = np.random.default_rng(19)
+    rows = []
+    for m in range(12):
+        day = pd.Timestamp("2024-01-01") + pd.Timedelta(days=int(rng.integers(0, 30)))
+        w = rng.uniform(55, 110)
+        for _ in range(int(rng.integers(1, 120))):
+            day += pd.Timedelta(days=int(rng.choice([0, 1, 1, 1, 2, 5, 40])))
+            w += rng.normal(-0.03, 0.3)
+            rows.append({"member_id": f"m{m}", "date": day, "weight": w if rng.random() < 0.8 else np.nan,
+                         "intake": rng.uniform(1500, 3200) if rng.random() < 0.7 else np.nan})
+    return pd.DataFrame(rows).sample(frac=1.0, random_state=3).reset_index(drop=True)
+
+
+def streamed(tracker, frame):
+    out = []
+    for r in frame.to_dict("records"):
+        st = tracker.add(r["member_id"], r["date"], None if np.isnan(r["weight"]) else r["weight"],
+                         None if np.isnan(r["intake"]) else r["intake"]).stats(tracker.min_days)
+        out.append([st[c] for c in COLUMNS])
+    return np.array(out, dtype=np.float64)
+
+
+def test_streaming_matches_progress_frame(logs):
+    frame = smartift.progress_frame(logs)
+    got = streamed(smartift.ProgressTracker(), frame)
+    assert np.allclose(got, frame[COLUMNS].to_numpy(dtype=np.float64), rtol=1e-9, atol=1e-3, equal_nan=True)
+
+
+def test_ingest_frame_continues_streaming(logs):
+    frame = smartift.progress_frame(logs)
+    cut = frame.groupby("member_id")["day"].transform(lambda d: d.iloc[len(d) // 2])
+    head, tail = frame[frame["day"] <= cut].drop(columns=["day", *COLUMNS]), frame[frame["day"] > cut]
+    tracker = smartift.ProgressTracker()
+    tracker.ingest_frame(head)
+    got = streamed(tracker, tail)
+    assert np.allclose(got, tail[COLUMNS].to_numpy(dtype=np.float64), rtol=1e-9, atol=1e-3, equal_nan=True)
+
+
+def test_confidence_counts_logged_days_not_span():
+    tracker = smartift.ProgressTracker()
+    start = pd.Timestamp("2024-03-01")
+    for day in (0, 9, 18, 27):
+        tracker.add("sparse", start + pd.Timedelta(days=day), 80 - day * 0.02, 2400)
+    for day in range(28):
+        tracker.add("daily", start + pd.Timedelta(days=day), 80 - day * 0.02, 2400)
+    assert tracker.members["sparse"].coverage == 4
+    assert tracker.estimate("sparse")[1] == 0.0
+    assert tracker.estimate("daily")[1] == 1.0
+    frame = smartift.progress_frame(pd.DataFrame([{"member_id": "sparse", "date": start + pd.Timedelta(days=d), "weight": 80.0,
+                                                   "intake": 2400.0} for d in (0, 9, 9, 18, 27)]))
+    assert frame["coverage"].tolist() == [1, 2, 2, 3, 4]
+    assert (frame["confidence"] == 0).all()
@@ -0,0 +1,53 @@
+import pytest
+
+import smartift
+
+
+@pytest.fixture(scope="module")
+def large_catalog():
+    # thousands of variants per food: every trigram of a real query is over the rare-posting cap
+    return smartift.synthetic_catalog(60000, seed=1)
+
+
+@pytest.fixture(scope="module")
+def small_catalog():
+    return smartift.FoodCatalog.from_records(smartift.FOOD_DB)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("greek yogurt", "Greek Yogurt (200g)"),
+    ("yogurt greek", "Greek Yogurt (200g)"),
+    ("pnut buttr", "Peanut Butter (2 tbsp)"),
+    ("butter peanut", "Peanut Butter (2 tbsp)"),
+    ("chiken brest", "Chicken Breast (100g)"),
+])
+@pytest.mark.parametrize("catalog", ["small_catalog", "large_catalog"])
+def test_search_finds_misspelled_and_reordered(request, catalog, query, expected):
+    cat = request.getfixturevalue(catalog)
+    ids = cat.search(query, limit=5)
+    assert ids and cat.names[ids[0]] == expected
+
+
+def test_search_fills_limit_with_fuzzy_matches(large_catalog):
+    ids = large_catalog.search("yogurt greek", limit=10)
+    assert len(ids) == 10
+    assert all(large_catalog.names[i].startswith("Greek Yogurt") for i in ids)
+
+
+def test_search_unmatched_query_is_empty(large_catalog):
+    assert large_catalog.search("zzzz") == []
+
+
+def test_containing_matches_scan(large_catalog):
+    ids = large_catalog.search_index.containing("peanut butter")
+    assert ids == {i for i, n in enumerate(large_catalog.names) if "peanut butter" in smartift.normalize_food_name(n)}
+
+
+@pytest.mark.parametrize("text", ["peanut butter", "Greek", "oat", "a", ""])
+def test_catalog_containing_without_index_matches_scan(text):
+    cat = smartift.synthetic_catalog(5000, seed=2)
+    ids = cat.containing(text)
+    assert getattr(cat, "_search_index", None) is None
+    q = smartift.normalize_food_name(text)
+    assert ids.tolist() == [i for i, n in enumerate(cat.names) if q in smartift.normalize_food_name(n)]
+    assert set(ids.tolist()) == cat.search_index.containing(text)
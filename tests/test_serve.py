@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import smartift
+
+PROFILE = {"sex": "Female", "weight": 64, "height": 168, "age": 35, "activity": "Moderate", "goal": "Maintain"}
+
+
+def serve(test, **options):
+    """Run `test(server, request)` against a PlanServer on a free local port."""
+    async def main():
+        server = smartift.PlanServer("127.0.0.1", 0, workers=1, **options)
+        await server.start()
+
+        async def request(path, body=None):
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            try:
+                data = None if body is None else json.dumps(body).encode()
+                status, headers, payload = await smartift._http_request(reader, writer, "127.0.0.1", path, data)
+            finally:
+                writer.close()
+            return status, headers, json.loads(payload) if headers["content-type"] == "application/json" else payload
+        try:
+            return await test(server, request)
+        finally:
+            server.close()
+            await asyncio.sleep(0.05)  # let the handlers see their clients' EOF before the loop closes
+    return asyncio.run(main())
+
+
+def test_routes():
+    async def test(server, request):
+        targets = smartift.calculate_tdee_and_targets("Female", 64, 168, 35, "Moderate", "Maintain")
+        status, _, body = await request("/v1/targets", PROFILE | {"id": 7})
+        assert status == 200 and body == {"id": 7, "targets": targets}
+        status, _, body = await request("/v1/meal-plan", PROFILE)
+        assert status == 200 and [m["Meal"] for m in body["meals"]] == ["Breakfast", "Lunch", "Dinner", "Snack"]
+        status, _, body = await request("/v1/swaps", {"foods": [0, 3], "position": 1, "k": 3, "targets": targets})
+        assert status == 200 and len(body["swaps"]) == 3
+        assert (await request("/v1/swaps", {"foods": [True, 3]}))[0] == 422
+        assert (await request("/v1/targets", PROFILE | {"weight": "heavy"}))[0] == 422
+        assert (await request("/v1/plan", PROFILE | {"mode": "fastest"}))[0] == 400
+        assert (await request("/v1/plan"))[0] == 405
+        assert (await request("/v2/plan", PROFILE))[0] == 404
+        assert (await request("/health"))[2]["status"] == "ok"
+    serve(test)
+
+
+def test_concurrent_requests_share_batches():
+    async def test(server, request):
+        before = server.batches
+        replies = await asyncio.gather(*(request("/v1/targets", PROFILE | {"id": i, "weight": 50 + i}) for i in range(20)))
+        assert [r[0] for r in replies] == [200] * 20
+        assert [r[2]["id"] for r in replies] == list(range(20))
+        assert server.batches - before < 20
+    serve(test, batch_window_ms=200)
+
+
+def test_backpressure_answers_503():
+    async def test(server, request):
+        replies = await asyncio.gather(*(request("/v1/plan", PROFILE | {"id": i}) for i in range(8)))
+        statuses = [r[0] for r in replies]
+        assert statuses.count(200) == 3 and statuses.count(503) == 5
+        assert all(r[1]["retry-after"] == "1" for r in replies if r[0] == 503)
+        assert server.rejected == 5 and server.pending == 0
+    serve(test, max_pending=3, batch_window_ms=200)
@@ -0,0 +1,59 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import smartift
+
+PROFILE = {"sex": "Male", "age": 41, "weight": 88.5, "height": 181.0, "activity": "Light", "goal": "Lose Fat", "experience": "beginner"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = smartift.PlanStore(str(tmp_path / "history.sqlite3"))
+    yield store
+    store.close()
+
+
+def dated_plans(store):
+    t = smartift.calculate_tdee_and_targets("Male", 88.5, 181, 41, "Light", "Lose Fat")
+    plans = {}
+    for i in range(20):
+        day, member = datetime.date(2024, 5, 1) + datetime.timedelta(days=i // 2), f"m{i % 2}"
+        plan = smartift.generate_meal_plan(1600 + 50 * i, 0, 0, 0, compact=True)
+        plans[store.add_plan(member, PROFILE if i < 2 else None, t, plan, plan_date=day)] = (member, str(day), plan)
+    return t, plans
+
+
+def test_queries_return_plans_in_order(store):
+    t, plans = dated_plans(store)
+    last = store.last_plans("m1", n=3)
+    assert [r["date"] for r in last] == ["2024-05-10", "2024-05-09", "2024-05-08"]
+    for r in last:
+        member, day, plan = plans[r["id"]]
+        assert (r["member_id"], r["date"], r["targets"]) == (member, day, t)
+        assert r["plan"].food_ids.tolist() == plan.food_ids.tolist() and r["plan"].totals.tolist() == plan.totals.tolist()
+        assert r["plan"].to_frame().equals(plan.to_frame())
+    window = store.plans_between("2024-05-03", "2024-05-05")
+    assert [r["id"] for r in window] == sorted(i for i, (_, day, _) in plans.items() if "2024-05-03" <= day <= "2024-05-05")
+    assert [r["member_id"] for r in store.plans_between("2024-05-03", "2024-05-05", member_id="m0")] == ["m0"] * 3
+    assert [r["id"] for r in store.plans_between("2024-05-03", "2024-05-05", limit=2)] == [r["id"] for r in window[:2]]
+    first = store.last_plans("m0", n=100)[-1]
+    assert store.profile(first["profile_id"]) == PROFILE
+    assert store.last_plans("nobody") == []
+
+
+def test_queries_use_the_indexes(store):
+    plan = lambda sql, args: " ".join(r[-1] for r in store.conn.execute("EXPLAIN QUERY PLAN " + sql, args))
+    assert "USING INDEX plans_member_date" in plan(store._LAST, ("m0", 5))
+    assert "USING INDEX plans_member_date" in plan(store._MEMBER_RANGE, ("m0", "2024-01-01", "2024-12-31", 5))
+    assert "USING INDEX plans_date" in plan(store._RANGE, ("2024-01-01", "2024-12-31", 5))
+
+
+def test_newer_schema_is_refused(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    smartift.PlanStore(path).close()
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA user_version = 99")
+    with pytest.raises(RuntimeError):
+        smartift.PlanStore(path)
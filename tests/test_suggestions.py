@@ -0,0 +1,38 @@
+"""Compiled diet rules against the original ai_diet_suggestions if-chain."""
+import numpy as np
+
+import smartift
+from baseline import reference_suggestions
+
+
+def test_rule_suggestions_match_reference():
+    cat = smartift.synthetic_catalog(3000, seed=4)
+    rng = np.random.default_rng(9)
+    peanut = [i for i, n in enumerate(cat.names) if "Peanut Butter" in n]
+    targets, plans = [], []
+    for _ in range(200):
+        t = smartift.calculate_tdee_and_targets("Female", rng.uniform(35, 120), rng.uniform(140, 200), int(rng.integers(16, 80)),
+                                                rng.choice(smartift.ACTIVITY_LEVELS), rng.choice(smartift.GOALS))
+        if rng.random() < 0.1:
+            t = {} if rng.random() < 0.5 else {**t, "Protein_g": 0, "TargetCalories": 0}
+        meals = [m for m in ("Breakfast", "Lunch", "Dinner", "Snack", "snack 2") if rng.random() < 0.7]
+        ids = [rng.choice(len(cat), int(rng.integers(0, 4))) for _ in meals]
+        for j in range(len(meals)):
+            if rng.random() < 0.2:
+                ids[j] = np.append(ids[j], rng.choice(peanut))
+        plan = smartift.CompactPlan.from_choices(meals, [(i, cat.macros[i].sum(axis=0)) for i in ids])
+        targets.append(t); plans.append(None if rng.random() < 0.1 else plan.to_frame(cat))
+    got = smartift.DIET_RULESET.suggest(targets, plans, cat)
+    assert got == [reference_suggestions(t, p) for t, p in zip(targets, plans)]
+    assert any("Swap some peanut-butter snacks for Greek yogurt + berries." in tips for tips in got)
+
+
+def test_peanut_butter_snack_rule():
+    cat = smartift.FoodCatalog.from_records(smartift.FOOD_DB)
+    pb = cat.find("Peanut Butter (2 tbsp)")
+    t = smartift.calculate_tdee_and_targets("Male", 80, 180, 30, "Moderate", "Maintain")
+    for meal, hit in (("Snack", True), ("Lunch", False)):
+        plan = smartift.CompactPlan.from_choices(["Breakfast", meal], [([0], cat.macros[0]), ([pb], cat.macros[pb])]).to_frame(cat)
+        tips = smartift.ai_diet_suggestions(t, plan, cat)
+        assert tips == reference_suggestions(t, plan)
+        assert ("Swap some peanut-butter snacks for Greek yogurt + berries." in tips) == hit
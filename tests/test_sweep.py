@@ -0,0 +1,24 @@
+"""target_sweep and greedy_plan_totals against the scalar calls."""
+import numpy as np
+import pytest
+
+import smartift
+from baseline import MEALS, SPLITS, reference_fill
+
+
+@pytest.mark.parametrize("sex, height, age", [("Male", 180.5, 30), ("Female", 163.0, 47)])
+def test_sweep_matches_scalar(sex, height, age):
+    weights = np.arange(160, 420, 3) * 0.25
+    sweep = smartift.target_sweep(sex, height, age, weights, feasibility=True)
+    cat = smartift.get_food_catalog()
+    foods = cat.to_frame()
+    for i, w in enumerate(weights):
+        for j, a in enumerate(sweep.activities):
+            for k, g in enumerate(sweep.goals):
+                want = smartift.calculate_tdee_and_targets(sex, w, height, age, a, g)
+                assert sweep.cell(i, j, k) == want
+    for i in range(0, len(weights), 7):
+        target = sweep["TargetCalories"][i, 0, 0]
+        totals = sum(cat.macros[reference_fill(foods, target * SPLITS[m] * 0.95, "cal" if m == "Snack" else "pdensity")].sum(axis=0)
+                     for m in MEALS)
+        assert np.allclose(smartift.greedy_plan_totals(np.array([target]))[0], totals)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import smartift
+
+
+@pytest.mark.parametrize("level", list(smartift.WORKOUT_TABLES))
+@pytest.mark.parametrize("goal", smartift.GOALS)
+def test_program_periodization(level, goal):
+    p = smartift.workout_program(level, goal, 12)
+    t = p.template
+    strength = t.kind == smartift.EXERCISE_KINDS.index("strength")
+    assert np.flatnonzero(p.deload).tolist() == [3, 7, 11]
+    assert all(day.endswith("(deload)") for day, _ in p.week(3)) and not any(day.endswith("(deload)") for day, _ in p.week(2))
+    # reps stay inside each exercise's range; load climbs every build week and drops in the deload
+    assert ((p.reps[:, strength] >= t.lo[strength]) & (p.reps[:, strength] <= t.hi[strength])).all()
+    load, before_deload = p.load[:, strength][:, 0], np.flatnonzero(p.deload) - 1
+    assert (np.diff(load[~p.deload]) > 0).all() and (load[p.deload] < load[before_deload]).all()
+    volume = p.volume()
+    assert (volume[p.deload] < volume[before_deload]).all()
+    assert (volume[[4, 8]] >= volume[[0, 4]]).all()  # each block starts at least where the last one started
+    frame = p.to_frame()
+    assert len(frame) == 12 * len(t.records)
+    assert frame["Sets"].tolist() == p.sets.ravel().tolist() and frame["Week"].iloc[-1] == 12
+
+
+def test_program_is_memoized_and_read_only():
+    p = smartift.workout_program("beginner", "Gain weight (bulk 15%)")
+    assert smartift.workout_program("beginner", "Gain muscle", 8) is p
+    assert smartift.workout_program("unknown", "Gain weight (bulk 15%)") is p
+    with pytest.raises(ValueError):
+        p.sets[0, 0] = 9
+    for weeks in (3, 17):
+        with pytest.raises(ValueError):
+            smartift.workout_program("beginner", "Maintain weight", weeks)
+
+
+def test_lose_goal_adds_cardio_finisher_on_non_cardio_days():
+    p = smartift.workout_program("intermediate", "Lose weight (cut 20%)", 4)
+    t = p.template
+    for d, (_, exercises) in enumerate(p.week(0)):
+        assert (exercises[-1] == smartift.CARDIO_FINISHER) == (not t.day_cardio[d])